@@ -0,0 +1,98 @@
+"""
+Compares reading many input devices with one thread per device against the
+single epoll-driven `DeviceReader`. Devices are faked with pipes, so this runs
+without root and without real hardware.
+
+    python benchmarks/device_reader.py [devices] [frames per device]
+"""
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from keyboard._nixcommon import EventDevice, DeviceReader, event_struct, EV_KEY, EV_SYN, SYN_REPORT
+
+
+def make_devices(count):
+    devices = []
+    writers = []
+    for i in range(count):
+        read_fd, write_fd = os.pipe()
+        device = EventDevice('/dev/input/event{}'.format(1000 + i))
+        device._input_file = os.fdopen(read_fd, 'rb')
+        device._sysfs_name = 'fake device {}'.format(i)
+        devices.append(device)
+        writers.append(write_fd)
+    return devices, writers
+
+
+def feed(writers, frames_per_device):
+    frame = event_struct.pack(0, 0, EV_KEY, 30, 1) + event_struct.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+    # Keep frames_per_device * 48 bytes under the 64 KiB pipe buffer so the
+    # writes never block on a slow reader.
+    for _ in range(frames_per_device):
+        for write_fd in writers:
+            os.write(write_fd, frame)
+
+
+def close(devices, writers):
+    for write_fd in writers:
+        os.close(write_fd)
+    for device in devices:
+        device.input_file.close()
+
+
+def bench_threads(device_count, frames_per_device):
+    devices, writers = make_devices(device_count)
+    received = []
+
+    def read_loop(device):
+        while True:
+            try:
+                for frame in device.read_frames():
+                    received.append(frame)
+            except (OSError, ValueError):
+                break
+
+    start = time.perf_counter()
+    for device in devices:
+        Thread(target=read_loop, args=(device,), daemon=True).start()
+    feed(writers, frames_per_device)
+    while len(received) < device_count * frames_per_device:
+        time.sleep(0.0001)
+    elapsed = time.perf_counter() - start
+    close(devices, writers)
+    return elapsed
+
+
+def bench_epoll(device_count, frames_per_device):
+    devices, writers = make_devices(device_count)
+    received = []
+    reader = DeviceReader(devices, received.append)
+
+    def run():
+        while len(received) < device_count * frames_per_device:
+            reader.poll(0.01)
+
+    start = time.perf_counter()
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    feed(writers, frames_per_device)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    close(devices, writers)
+    return elapsed
+
+
+if __name__ == '__main__':
+    device_counts = [int(sys.argv[1])] if len(sys.argv) > 1 else [4, 32, 256]
+    frames_per_device = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    print('{:>8} {:>12} {:>12}'.format('devices', 'threads (s)', 'epoll (s)'))
+    for device_count in device_counts:
+        print('{:>8} {:>12.4f} {:>12.4f}'.format(
+            device_count,
+            bench_threads(device_count, frames_per_device),
+            bench_epoll(device_count, frames_per_device),
+        ))
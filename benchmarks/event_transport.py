@@ -0,0 +1,83 @@
+"""
+Compares the two ways the evdev reader process can hand events to the
+listener: a `multiprocessing.Queue` of frames and the shared memory ring.
+Frames of one key event plus SYN_REPORT are produced in a child process, the
+same way the reader does.
+
+Latency is measured from the moment the producer creates the frame until the
+listener reads its first event, using the monotonic clock shared by both
+processes.
+
+    python benchmarks/event_transport.py [frames]
+"""
+import os
+import sys
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from keyboard._nixcommon import EV_KEY, EV_SYN, SYN_REPORT
+from keyboard._nixring import SharedEventRing
+
+PATH = '/dev/input/event3'
+NAME = 'AT Translated Set 2 keyboard'
+
+
+def produce(sink, count, pace):
+    for i in range(count):
+        now = time.monotonic()
+        sink.put([(now, EV_KEY, 30, i % 2, PATH, NAME), (now, EV_SYN, SYN_REPORT, 0, PATH, NAME)])
+        if pace:
+            time.sleep(pace)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(sink, read_event, count, pace):
+    process = Process(target=produce, args=(sink, count, pace), daemon=True)
+    latencies = []
+    start = time.perf_counter()
+    process.start()
+    for _ in range(count):
+        event = read_event()
+        latencies.append(time.monotonic() - event[0])
+        read_event()
+    elapsed = time.perf_counter() - start
+    process.join()
+    return elapsed, latencies
+
+
+def queue_reader(queue):
+    pending = []
+
+    def read_event():
+        if not pending:
+            pending.extend(reversed(queue.get()))
+        return pending.pop()
+    return read_event
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print('Throughput, {} frames as fast as possible:'.format(count))
+    queue = Queue()
+    elapsed, _ = run(queue, queue_reader(queue), count, 0)
+    print('  queue:         {:>10.0f} events/s'.format(2 * count / elapsed))
+    ring = SharedEventRing()
+    elapsed, _ = run(ring, ring.read_event, count, 0)
+    ring.close()
+    print('  shared memory: {:>10.0f} events/s'.format(2 * count / elapsed))
+
+    paced = min(count, 2000)
+    print('Latency, {} frames 1 ms apart (median / p99):'.format(paced))
+    queue = Queue()
+    _, latencies = run(queue, queue_reader(queue), paced, 0.001)
+    print('  queue:         {:>8.1f} us / {:>8.1f} us'.format(percentile(latencies, 0.5) * 1e6, percentile(latencies, 0.99) * 1e6))
+    ring = SharedEventRing()
+    _, latencies = run(ring, ring.read_event, paced, 0.001)
+    ring.close()
+    print('  shared memory: {:>8.1f} us / {:>8.1f} us'.format(percentile(latencies, 0.5) * 1e6, percentile(latencies, 0.99) * 1e6))
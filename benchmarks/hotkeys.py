@@ -0,0 +1,96 @@
+"""
+Cost of registering 1,000 hotkeys and of dispatching key events with them.
+Half of them are chorded ('ctrl+shift+alt+<key>', where each modifier has two
+or three scan codes) and half are two-step sequences ('ctrl+<key>, <key>'),
+in groups of 25 that share their first step. Events are fed straight into the
+listener, with the OS backend replaced by a fake keymap, so this runs
+anywhere.
+
+    python benchmarks/hotkeys.py [rounds]
+"""
+import os
+import sys
+import time
+import types
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import keyboard
+from keyboard._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
+
+HOTKEYS = 1000
+
+# Names 'k0'...'k499' on scan codes 100...599, plus the modifiers.
+key_names = ['k{}'.format(i) for i in range(HOTKEYS // 2)]
+scan_codes = dict((name, 100 + i) for i, name in enumerate(key_names))
+scan_codes.update({'left ctrl': 29, 'right ctrl': 97, 'left shift': 42, 'right shift': 54,
+                   'left alt': 56, 'right alt': 100 + HOTKEYS})
+# Some layouts report a second scan code for the same modifier.
+extra_scan_codes = {'left alt': [101 + HOTKEYS]}
+
+
+def map_name(name):
+    if name in scan_codes:
+        yield scan_codes[name], ()
+        for scan_code in extra_scan_codes.get(name, ()):
+            yield scan_code, ()
+    else:
+        raise ValueError(name)
+
+
+def fake_event(event_type, name):
+    return KeyboardEvent(event_type, scan_codes[name], name=name)
+
+
+keyboard._os_keyboard = types.SimpleNamespace(
+    init=lambda: None,
+    listen=lambda callback: None,
+    map_name=map_name,
+    press=lambda scan_code, *args: None,
+    release=lambda scan_code, *args: None,
+)
+keyboard._listener = keyboard._KeyboardListener()
+keyboard._listener.init()
+# Events are pumped by hand, no processing thread is needed.
+keyboard._listener.start_if_necessary = lambda: None
+keyboard._initialized = True
+
+triggered = []
+tracemalloc.start()
+start = time.perf_counter()
+for i, name in enumerate(key_names):
+    keyboard.add_hotkey('ctrl+shift+alt+' + name, triggered.append, args=[i], suppress=True)
+    keyboard.add_hotkey('ctrl+{}, {}'.format(key_names[i % 20], name), triggered.append, args=[i], suppress=True)
+registration = time.perf_counter() - start
+registration_memory = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+
+# Typing without modifiers, then chords, then sequences.
+events = []
+for name in key_names[:50]:
+    events += [fake_event(KEY_DOWN, name), fake_event(KEY_UP, name)]
+for name in key_names[:50]:
+    events += [fake_event(KEY_DOWN, 'left ctrl'), fake_event(KEY_DOWN, 'right shift'),
+               fake_event(KEY_DOWN, 'left alt'), fake_event(KEY_DOWN, name), fake_event(KEY_UP, name),
+               fake_event(KEY_UP, 'left alt'), fake_event(KEY_UP, 'right shift'),
+               fake_event(KEY_UP, 'left ctrl')]
+for i, name in enumerate(key_names[:50]):
+    prefix = key_names[i % 20]
+    events += [fake_event(KEY_DOWN, 'left ctrl'), fake_event(KEY_DOWN, prefix), fake_event(KEY_UP, prefix),
+               fake_event(KEY_UP, 'left ctrl'), fake_event(KEY_DOWN, name), fake_event(KEY_UP, name)]
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    direct_callback = keyboard._listener.direct_callback
+    # Best of a few runs, the dispatch is short enough to be noisy.
+    elapsed = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for event in events:
+                direct_callback(event)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print('registering {} hotkeys: {:.1f} ms, {:.0f} KiB'.format(
+        HOTKEYS, registration * 1000, registration_memory / 1024))
+    print('dispatch: {:.2f} us/event over {} events ({} triggers)'.format(
+        elapsed / (rounds * len(events)) * 1e6, rounds * len(events), len(triggered) // 5))
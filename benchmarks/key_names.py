@@ -0,0 +1,54 @@
+"""
+Per-event cost of resolving a scan code to a key name in the evdev listener:
+the previous lookup (sorting the pressed modifiers into a tuple, then up to
+two dict lookups) against the compiled array indexed by scan code and
+modifier bitmask. Uses a synthetic keymap, so it needs no console.
+
+    python benchmarks/key_names.py [events]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from keyboard import _nixkeyboard
+from keyboard._nixkeymap import iso646_names
+
+for scan_code, name in enumerate(iso646_names[32:127]):
+    _nixkeyboard._register_keysym(scan_code + 2, 0, name)
+    _nixkeyboard._register_keysym(scan_code + 2, 1, name.upper() if len(name) == 1 else name)
+_nixkeyboard._add_missing_keys()
+_nixkeyboard._compile_names()
+
+tables = _nixkeyboard.scan_code_and_mods_to_name
+scan_codes = [2 + (i * 7) % 120 for i in range(256)]
+
+
+def before(pressed_modifiers):
+    for scan_code in scan_codes:
+        pressed_modifiers_tuple = tuple(sorted(pressed_modifiers))
+        names = (
+            tables[(scan_code, pressed_modifiers_tuple)]
+            or tables[(scan_code, ())]
+            or ["unknown"]
+        )
+        name = names[0]
+
+
+def after(modifier_mask):
+    key_names, name_indexes, _, _ = _nixkeyboard._name_table
+    n = _nixkeyboard.N_MODIFIER_MASKS
+    for scan_code in scan_codes:
+        name = key_names[name_indexes[scan_code * n + modifier_mask]]
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeat = max(1, events // len(scan_codes))
+    for label, pressed in [('no modifiers', set()), ('shift', {'shift'}), ('ctrl+shift', {'ctrl', 'shift'})]:
+        mask = sum(_nixkeyboard.MODIFIER_BITS[m] for m in pressed)
+        old = min(timeit.repeat(lambda: before(pressed), number=repeat, repeat=3))
+        new = min(timeit.repeat(lambda: after(mask), number=repeat, repeat=3))
+        total = repeat * len(scan_codes)
+        print('{:<14} before {:>7.1f} ns/event   after {:>7.1f} ns/event'.format(
+            label, old / total * 1e9, new / total * 1e9))
@@ -0,0 +1,62 @@
+"""
+Cost of creating a `KeyboardEvent`: memory allocated per event and events
+created per second. Compares the previous `__dict__` based class, which
+normalized the name in its constructor, with the slotted class through its
+regular constructor and through `canonical_event`, both with and without the
+name being read afterwards (the slotted class normalizes it on first read).
+
+    python benchmarks/keyboard_event.py [events]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from keyboard._keyboard_event import KeyboardEvent, KEY_DOWN, canonical_event
+from keyboard._canonical_names import normalize_name
+
+
+class DictKeyboardEvent(object):
+    """KeyboardEvent as it was before it got slots."""
+
+    def __init__(self, event_type, scan_code, name=None, time=None, device=None,
+                 device_name=None, modifiers=None, is_keypad=None, synthetic=False):
+        self.event_type = event_type
+        self.scan_code = scan_code
+        self.time = time
+        self.device = device
+        self.device_name = device_name
+        self.is_keypad = is_keypad
+        self.modifiers = modifiers
+        self.synthetic = synthetic
+        if name:
+            self.name = normalize_name(name)
+
+
+ARGS = (KEY_DOWN, 30, 'a', 1.5, '/dev/input/event3', 'AT Translated Set 2 keyboard', ('shift',), False)
+
+CASES = [
+    ('dict class', lambda: DictKeyboardEvent(*ARGS), lambda: DictKeyboardEvent(*ARGS).name),
+    ('slots', lambda: KeyboardEvent(*ARGS), lambda: KeyboardEvent(*ARGS).name),
+    ('slots, canonical', lambda: canonical_event(*ARGS), lambda: canonical_event(*ARGS).name),
+]
+
+
+def bytes_per_event(create, count=10000):
+    tracemalloc.start()
+    events = [create() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Leave out the list holding them.
+    return (size - sys.getsizeof(events)) / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    print('{:<18} {:>12} {:>14} {:>20}'.format('', 'bytes/event', 'events/s', 'events/s, name read'))
+    for label, create, create_and_read in CASES:
+        elapsed = min(timeit.repeat(create, number=count, repeat=3))
+        elapsed_read = min(timeit.repeat(create_and_read, number=count, repeat=3))
+        print('{:<18} {:>12.0f} {:>14.0f} {:>20.0f}'.format(
+            label, bytes_per_event(create), count / elapsed, count / elapsed_read))
@@ -0,0 +1,43 @@
+"""
+Compares building the evdev key tables with and without the on-disk cache.
+This is the part of `keyboard.init()` that depends on it; the rest (devices,
+uinput) is the same for both. Each start is measured in a fresh interpreter,
+with the cache in a temporary directory. Needs `dumpkeys` and console access.
+
+    python benchmarks/keymap_cache.py [runs]
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def measure(mode):
+    from keyboard import _nixkeyboard, _nixkeymapcache
+
+    if mode == 'cold':
+        _nixkeymapcache.invalidate()
+    start = time.perf_counter()
+    _nixkeyboard.build_tables()
+    print(time.perf_counter() - start)
+
+
+def run(mode, environment):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), mode], env=environment)
+    return float(output)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] in ('cold', 'warm'):
+        measure(sys.argv[1])
+        sys.exit()
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    environment = dict(os.environ, XDG_CACHE_HOME=tempfile.mkdtemp())
+    cold = [run('cold', environment) for _ in range(runs)]
+    warm = [run('warm', environment) for _ in range(runs)]
+    print('cold (dumpkeys): {:>8.2f} ms'.format(min(cold) * 1000))
+    print('warm (cache):    {:>8.2f} ms'.format(min(warm) * 1000))
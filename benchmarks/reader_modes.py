@@ -0,0 +1,73 @@
+"""
+Compares the process and thread evdev reader modes: time from creating the
+aggregated device until its first event is read, and the memory used once it
+is running. Devices are faked with FIFOs, so this runs without root.
+
+Each mode is measured in a fresh interpreter. Memory is reported as RSS and
+PSS (proportional set size, which splits pages shared after the fork between
+both processes) summed over this process and the reader process, if any.
+
+    python benchmarks/reader_modes.py
+"""
+import os
+import sys
+import time
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DEVICES = 4
+
+
+def memory_kb(pid):
+    rss = pss = 0
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            if line.startswith('Rss:'):
+                rss = int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss = int(line.split()[1])
+    return rss, pss
+
+
+def measure(mode_name):
+    # Imported here to keep the parent interpreter out of the measurement.
+    from keyboard._nixcommon import AggregatedEventDevice, EventDevice, event_struct, EV_KEY, EV_SYN, SYN_REPORT
+    from keyboard._linux_reader_modes import LinuxReaderModes
+
+    directory = tempfile.mkdtemp()
+    devices = []
+    writers = []
+    for i in range(DEVICES):
+        path = os.path.join(directory, 'event{}'.format(9000 + i))
+        os.mkfifo(path)
+        # O_RDWR doesn't wait for a reader to open the other end.
+        writers.append(os.open(path, os.O_RDWR))
+        devices.append(EventDevice(path))
+    frame = event_struct.pack(0, 0, EV_KEY, 30, 1) + event_struct.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+
+    start = time.perf_counter()
+    device = AggregatedEventDevice(devices, reader_mode=LinuxReaderModes[mode_name])
+    os.write(writers[0], frame)
+    device.read_event()
+    cold_start = time.perf_counter() - start
+
+    time.sleep(0.2)
+    rss, pss = memory_kb(os.getpid())
+    if device.process is not None:
+        child_rss, child_pss = memory_kb(device.process.pid)
+        rss += child_rss
+        pss += child_pss
+    print('{:>8} {:>14.1f} {:>10} {:>10}'.format(mode_name.lower(), cold_start * 1000, rss, pss))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+    else:
+        print('{:>8} {:>14} {:>10} {:>10}'.format('mode', 'first event ms', 'RSS KiB', 'PSS KiB'))
+        sys.stdout.flush()
+        for mode_name in ['PROCESS', 'THREAD']:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), mode_name])
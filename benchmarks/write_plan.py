@@ -0,0 +1,82 @@
+"""
+Events sent per character typed by `keyboard.write`: the previous planner,
+which released every modifier and pressed the whole new set whenever the
+set changed, against `compile_plan`, which only presses and releases the
+modifiers that differ. Uses a synthetic layout with shift and alt gr levels,
+so it needs no keyboard.
+
+    python benchmarks/write_plan.py [repeat]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from keyboard._canonical_names import normalize_name
+from keyboard._write_plan import compile_plan
+
+# Four levels per key: plain, shift, alt gr and shift+alt gr.
+LEVELS = [(), ('shift',), ('alt gr',), ('shift', 'alt gr')]
+ROWS = [
+    ('1234567890', '!"#$%&/()=', '¹²³¼½¬{[]}', '¡⅛£¤⅜⅝⅞™±°'),
+    ('qwertyuiop', 'QWERTYUIOP', '@ł€¶ŧ←↓→øþ', 'ΩŁ€®Ŧ¥↑ıØÞ'),
+    ('asdfghjkl;', 'ASDFGHJKL:', 'æſðđŋħ̣ĸł˝', 'Æ§ÐªŊĦ˙&Ł˘'),
+    ('zxcvbnm,.-', 'ZXCVBNM;:_', '«»¢“”nµ·…–', '<>©‘’Nº×÷—'),
+]
+MODIFIER_CODES = {'shift': 42, 'alt gr': 100}
+
+KEYS = {' ': [(57, ())], 'space': [(57, ())]}
+for row_index, row in enumerate(ROWS):
+    for level, characters in enumerate(row):
+        for column, character in enumerate(characters):
+            KEYS.setdefault(normalize_name(character), [(row_index * 16 + column + 2, LEVELS[level])])
+
+CORPUS = {
+    'prose': 'The quick brown fox jumps over the lazy dog. Pack my box with five dozen liquor jugs!',
+    'identifiers': 'getHTTPResponseCode parseXMLDocument userID_2 MAX_RETRY_COUNT camelCaseName XMLHttpRequest',
+    'serials': 'XK7Q-9PL2-MM4Z-R8TT 4f3A-77Bc-E1d0 SN-2024-AB12CD34 QW9E-RT5Y-UI3O',
+    'alt gr': 'mail@example.com {key: [1, 2]} 30€ ΩØÞ @user ¹²³ ŁĦ€ a→b ø×÷',
+}
+
+
+def map_name(name):
+    return KEYS[name]
+
+
+def before(text):
+    """Counts the events of the previous planner."""
+    events = 0
+    last_modifiers = None
+    for character in text:
+        try:
+            scan_code, modifiers = next(iter(map_name(normalize_name(character))))
+        except (KeyError, ValueError, StopIteration):
+            events += len(last_modifiers or ()) + 1
+            last_modifiers = None
+            continue
+        if last_modifiers is not None and set(last_modifiers) != set(modifiers):
+            events += len(last_modifiers)
+            last_modifiers = None
+        if last_modifiers is None:
+            events += len(modifiers)
+            last_modifiers = modifiers
+        events += 2
+    return events + len(last_modifiers or ())
+
+
+def after(text):
+    """Counts the events of `compile_plan`, unicode characters as one each."""
+    plan = compile_plan(text, map_name, MODIFIER_CODES.__getitem__)
+    return (sum(len(actions) + (character is not None) for actions, character in plan.steps)
+            + len(plan.final))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for label, text in CORPUS.items():
+        old = before(text)
+        new = after(text)
+        seconds = min(timeit.repeat(lambda: compile_plan(text, map_name, MODIFIER_CODES.__getitem__),
+                                    number=repeat, repeat=3))
+        print('{:<12} before {:>5.2f} events/char   after {:>5.2f} events/char   compile {:>6.2f} us/char'.format(
+            label, old / len(text), new / len(text), seconds / repeat / len(text) * 1e6))
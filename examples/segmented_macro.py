@@ -8,21 +8,26 @@ time to speak between segments.
 import sys
 sys.path.append('../')
 import keyboard
-import pickle
 import os
 
 if len(sys.argv) == 1:
-    filename = input('Enter filename to save/load events: ')
+    filename = input('Enter directory to save/load events: ')
 else:
     filename = sys.argv[1]
 
-if os.path.exists(filename):
-    segments = pickle.load(open(filename, 'rb'))
-    for i, segment in enumerate(segments):
+if os.path.exists(filename) and not os.path.isdir(filename):
+    print('{} is not a directory. Segments used to be saved in a single pickle file,'.format(filename))
+    print('they are now saved as a directory of .kbr recordings: record them again.')
+    sys.exit(1)
+elif os.path.exists(filename):
+    segments = sorted(name for name in os.listdir(filename) if name.endswith('.kbr'))
+    for i, name in enumerate(segments):
+        with keyboard.load_recording(os.path.join(filename, name)) as segment:
+            events = list(segment)
         print('Press F1 to play segment {}/{}'.format(i+1, len(segments)))
-        print('Duration: {:.02} seconds'.format(segment[-1].time - segment[0].time))
+        print('Duration: {:.02} seconds'.format(events[-1].time - events[0].time))
         keyboard.wait('F1')
-        keyboard.play(segment)
+        keyboard.play(events)
 
 else:
     print('Press F1 to save this fragment. Press F2 to discard it. Press F3 to stop recording.')
@@ -50,5 +55,7 @@ else:
     keyboard.wait('F3')
     keyboard.hook(handle_event)
 
-    pickle.dump(segments, open(filename, 'wb'))
+    os.makedirs(filename)
+    for i, segment in enumerate(segments):
+        keyboard.save_recording(segment, os.path.join(filename, '{:04}.kbr'.format(i)))
     print('Saved {} segments to {}'.format(len(segments), filename))
\ No newline at end of file
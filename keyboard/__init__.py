@@ -5,16 +5,28 @@ from threading import Event as _UninterruptibleEvent
 import platform as _platform
 from ._canonical_names import all_modifiers, sided_modifiers, normalize_name
 from ._generic import GenericListener as _GenericListener
+from ._generic import HandlerProfile as _HandlerProfile
+from ._generic import warn_slow_handler as _warn_slow_handler
+from ._callback_executor import CallbackExecutor as _CallbackExecutor
+from ._latency import LatencyStats as _LatencyStats
+from ._scheduler import get_scheduler as _get_scheduler
+from ._playback import Prefetcher as _Prefetcher, play_timed as _play_timed
+from ._write_plan import WritePlan, compile_plan as _compile_plan
+from ._recording import RecordingReader, RecordingWriter, SpillingRecorder as _SpillingRecorder
+from ._hotkey_matcher import HotkeyMatcher as _HotkeyMatcher
 from ._keyboard_event import KEY_DOWN, KEY_UP, KeyboardEvent
 from ._windows_synthetic_modes import WindowsSyntheticModes
+from ._linux_event_transports import LinuxEventTransports
+from ._linux_reader_modes import LinuxReaderModes
 from ._keyboard_modes import KeyboardModes
 from ._keyboard_modes import auto_select_keyboard_mode as _auto_select_keyboard_mode
 import warnings
 import time as _time
 from ._global_data import global_data as _global_data
 from enum import Enum
-from threading import Thread as _Thread, Lock as _Lock
+from threading import Lock as _Lock
 import collections as _collections
+import functools as _functools
 import itertools as _itertools
 import re as _re
 
@@ -239,6 +251,14 @@ def _unsafe_propagate(event:KeyboardEvent):
         release(key)
 
 
+def _replay_events(events):
+    for event in events:
+        if event.event_type == KEY_DOWN:
+            press(event.scan_code)
+        else:
+            release(event.scan_code)
+
+
 def _is_list(x):
     return isinstance(x, (list, tuple))
 
@@ -287,6 +307,27 @@ def is_modifier(key):
         return key in _modifier_scan_codes
 
 
+# Scan code -> name of its sided modifier, or None until read from the keymap.
+_sided_modifier_ids = None
+
+
+def _key_id(scan_code):
+    """
+    Returns the logical key of a scan code, used to match hotkeys: the name of
+    the modifier for scan codes of sided modifiers ("left shift" and "right
+    shift" are both "shift"), the scan code itself otherwise.
+    """
+    global _sided_modifier_ids
+    ids = _sided_modifier_ids
+    if ids is None:
+        ids = {}
+        for name in sided_modifiers:
+            for code in key_to_scan_codes(name, False):
+                ids[code] = name
+        _sided_modifier_ids = ids
+    return ids.get(scan_code, scan_code)
+
+
 _pressed_events_lock = _Lock()
 _pressed_events = {}
 
@@ -343,12 +384,22 @@ class _KeyboardListener(_GenericListener):
         _get_os_keyboard().init()
 
         self.active_modifiers = set()
+        # Scan codes in `_pressed_events`, replaced (never mutated) on each
+        # change so other threads can read it without the lock.
+        self.pressed_signature = frozenset(_pressed_events)
         self.blocking_hooks = []
         self.blocking_keys = _collections.defaultdict(list)
         self.nonblocking_keys = _collections.defaultdict(list)
-        self.blocking_hotkeys = _collections.defaultdict(list)
-        self.nonblocking_hotkeys = _collections.defaultdict(list)
+        # Modifiers awaited by hotkeys, shared by both kinds.
         self.filtered_modifiers = _collections.Counter()
+        self.blocking_hotkeys = _HotkeyMatcher(
+            _key_id, is_modifier, self.filtered_modifiers, _replay_events,
+            self.call_handler,
+        )
+        self.nonblocking_hotkeys = _HotkeyMatcher(
+            _key_id, is_modifier, self.filtered_modifiers,
+            call_handler=self.call_handler,
+        )
 
         # Supporting hotkey suppression is harder than it looks. See
         # https://github.com/boppreh/keyboard/issues/22
@@ -356,12 +407,11 @@ class _KeyboardListener(_GenericListener):
 
     def pre_process_event(self, event):
         for key_hook in self.nonblocking_keys[event.scan_code]:
-            key_hook(event)
+            self.call_handler(key_hook, event)
 
-        with _pressed_events_lock:
-            hotkey = tuple(sorted(_pressed_events))
-        for callback in self.nonblocking_hotkeys[hotkey]:
-            callback(event)
+        if self.nonblocking_hotkeys:
+            self.nonblocking_hotkeys.expire(event)
+            self.nonblocking_hotkeys.match(event, self.pressed_signature)
 
         return event.scan_code or (event.name and event.name != "unknown")
 
@@ -375,28 +425,58 @@ class _KeyboardListener(_GenericListener):
         events by suppressing and re-emitting; and blocked hotkeys, which
         suppress specific hotkeys.
         """
+        latency = self.latency
+        if latency is not None:
+            return latency.time_direct_callback(self._direct_callback, event)
+        return self._direct_callback(event)
 
-        if not all(hook(event) for hook in self.blocking_hooks):
-            return False
-
+    def _update_pressed(self, event):
+        """
+        Updates the tables of currently pressed keys and modifiers. Returns
+        the scan codes pressed, including the key being released.
+        """
         event_type = event.event_type
         scan_code = event.scan_code
-
-        # Update tables of currently pressed keys and modifiers.
         with _pressed_events_lock:
+            hotkey = self.pressed_signature
             if event_type == KEY_DOWN:
                 if is_modifier(scan_code):
                     self.active_modifiers.add(scan_code)
                 _pressed_events[scan_code] = event
-            hotkey = tuple(sorted(_pressed_events))
+                if scan_code not in hotkey:
+                    hotkey = self.pressed_signature = hotkey | {scan_code}
             if event_type == KEY_UP:
                 self.active_modifiers.discard(scan_code)
                 if scan_code in _pressed_events:
                     del _pressed_events[scan_code]
+                    self.pressed_signature = hotkey - {scan_code}
+        return hotkey
+
+    def _direct_callback(self, event):
+        if event.synthetic:
+            # Corrections sent by the backend for keys held on startup or
+            # whose events were dropped. They only fix the state, nobody
+            # pressed anything now.
+            self._update_pressed(event)
+            if event.event_type == KEY_UP:
+                _logically_pressed_keys.pop(event.scan_code, None)
+            return True
+
+        call_handler = self.call_handler
+        if not all(call_handler(hook, event) for hook in self.blocking_hooks):
+            return False
+
+        # Sequences this event breaks replay what they suppressed before it.
+        if self.blocking_hotkeys:
+            self.blocking_hotkeys.expire(event)
+
+        event_type = event.event_type
+        scan_code = event.scan_code
+        hotkey = self._update_pressed(event)
 
         # Mappings based on individual keys instead of hotkeys.
         for key_hook in self.blocking_keys[scan_code]:
-            if not key_hook(event):
+            if not call_handler(key_hook, event):
                 return False
 
         # Default accept.
@@ -410,11 +490,9 @@ class _KeyboardListener(_GenericListener):
                 modifiers_to_update = self.active_modifiers
                 if is_modifier(scan_code):
                     modifiers_to_update = modifiers_to_update | {scan_code}
-                callback_results = [
-                    callback(event) for callback in self.blocking_hotkeys[hotkey]
-                ]
-                if callback_results:
-                    accept = all(callback_results)
+                hotkey_accept = self.blocking_hotkeys.match(event, hotkey)
+                if hotkey_accept is not None:
+                    accept = hotkey_accept
                     origin = "hotkey"
                 else:
                     origin = "other"
@@ -466,7 +544,24 @@ def init(
     keyboard_mode=None,
     auto_grab= False,
     device_name: str = "PyKeys Virtual Keyboard",
+    linux_event_transport: LinuxEventTransports = LinuxEventTransports.QUEUE,
+    linux_reader_mode: LinuxReaderModes = LinuxReaderModes.PROCESS,
 ):
+    """
+    Selects and sets up the keyboard backend. Called automatically with the
+    default arguments on first use, call it explicitly to change them.
+
+    - `linux_event_transport` how the evdev reader process hands events to
+    the listener. `LinuxEventTransports.QUEUE` pickles them through a
+    `multiprocessing.Queue`, `LinuxEventTransports.SHARED_MEMORY` packs them
+    into a shared memory ring, skipping the pickling and the feeder thread.
+    - `linux_reader_mode` where the evdev devices are read.
+    `LinuxReaderModes.PROCESS` forks a separate reader process, which keeps
+    reading even while this interpreter is busy but costs a second Python
+    process worth of memory and start up time. `LinuxReaderModes.THREAD` reads
+    them from a thread of this process instead, starting faster and using
+    less memory (see `benchmarks/reader_modes.py`).
+    """
     global _os_keyboard, _listener, _initialized, _keyboard_mode, _device_name
 
     if _initialized:
@@ -481,6 +576,8 @@ def init(
         )
 
     _global_data.device_name = device_name
+    _global_data.linux_event_transport = linux_event_transport
+    _global_data.linux_reader_mode = linux_reader_mode
     if keyboard_mode is not None:
         _keyboard_mode = keyboard_mode
     else:
@@ -686,12 +783,199 @@ def is_pressed(hotkey):
 
 def call_later(fn, args=(), delay=0.001):
     """
-    Calls the provided function in a new thread after waiting some time.
-    Useful for giving the system some time to process an event, without blocking
-    the current execution flow.
+    Calls the provided function after waiting some time, without blocking
+    the current execution flow. Useful for giving the system some time to
+    process an event.
+
+    All delayed calls share a single thread, so the function should return
+    quickly, or start its own thread for longer work. Key repeat on X11 runs
+    on a thread of its own and isn't delayed by them. Returns a timer whose
+    `cancel()` method stops the call if it didn't happen yet.
+    """
+    return _get_scheduler().call_later(delay, fn, args)
+
+
+def timer_stats():
+    """
+    Returns how many delayed calls from `call_later` were `scheduled`,
+    `fired` and are `pending`, and the `jitter` of how late they fired,
+    summarized like in `stats`.
+    """
+    return _get_scheduler().stats()
+
+
+_callback_executor = None
+
+
+def start_callback_executor(max_workers=4, max_pending=32, overflow="drop"):
+    """
+    Runs the callbacks of hotkeys, word listeners, `on_press`, `on_release`
+    and key hooks in a pool of `max_workers` threads, instead of the thread
+    that processes events, so a slow callback doesn't delay the events after
+    it. Calls of the same callback still run one at a time and in order.
+
+    - `max_pending` is the number of calls of a callback that may wait while
+    it runs.
+    - `overflow` is what to do with the calls beyond that: "drop" them, or
+    "coalesce" the waiting calls so only the latest one runs.
+
+    Suppression is still decided while processing the event: hooks with
+    `suppress=True` keep running there, since their return value decides
+    it, and hotkey callbacks run in the pool as if they returned None. `hook`
+    callbacks, which see every event, are not affected either.
+
+    It may be called from a callback, even one running in the pool, to
+    restart the pool with other settings.
+    """
+    global _callback_executor
+    executor = _CallbackExecutor(max_workers, max_pending, overflow)
+    stop_callback_executor()
+    _callback_executor = executor
+
+
+def stop_callback_executor(wait=True):
+    """
+    Runs callbacks in the thread that processes events again. If `wait`,
+    returns after the calls already queued finished, except when called from
+    a callback running in the pool (e.g. a hotkey that stops offloading),
+    which can't wait for itself and returns right away.
+    """
+    global _callback_executor
+    executor, _callback_executor = _callback_executor, None
+    if executor is not None:
+        executor.shutdown(wait)
+
+
+def callback_stats():
+    """
+    Returns the metrics of the callback executor, or None if it's not
+    running. See `start_callback_executor`. The keys are:
+
+    - `submitted`, `completed`, `failed`, `dropped`, `coalesced`: number of
+    callback calls.
+    - `queue_depth`, `max_queue_depth`: number of calls waiting.
+    - `total_time`, `max_time`: seconds spent in callbacks.
     """
-    thread = _Thread(target=lambda: (_time.sleep(delay), fn(*args)))
-    thread.start()
+    executor = _callback_executor
+    return executor.stats() if executor is not None else None
+
+
+def _offloaded(callback):
+    """
+    Wraps a callback to run on the callback executor, when there's one.
+    """
+
+    def run(*args):
+        executor = _callback_executor
+        if executor is None:
+            return callback(*args)
+        executor.submit(run, callback, args)
+
+    return run
+
+
+_latency_stats = None
+
+
+def enable_latency_stats():
+    """
+    Starts measuring how long events take to go through each stage, from the
+    moment the OS stamps them to the end of the handlers, from scratch. See
+    `stats`. Until then, and after `disable_latency_stats`, nothing is
+    measured.
+    """
+    global _latency_stats
+    listener = _get_listener()
+    listener.start_if_necessary()
+    _latency_stats = _LatencyStats()
+    listener.latency = _latency_stats
+    os_keyboard = _get_os_keyboard()
+    if hasattr(os_keyboard, "set_latency_stats"):
+        os_keyboard.set_latency_stats(True)
+
+
+def disable_latency_stats():
+    """
+    Stops measuring latency. What was measured so far is still returned by
+    `stats`.
+    """
+    _get_listener().latency = None
+    os_keyboard = _get_os_keyboard()
+    if hasattr(os_keyboard, "set_latency_stats"):
+        os_keyboard.set_latency_stats(False)
+
+
+def stats():
+    """
+    Returns the latency measured since `enable_latency_stats`, as a dict
+    from each stage to the `count` of events measured and the `mean`, `max`
+    and approximate `p50`, `p90` and `p99` percentiles, in microseconds.
+    The stages are:
+
+    - `read`: from the kernel stamping the event to reading it (Linux only).
+    - `listen`: from the event to the listener receiving it.
+    - `direct_callback`: time spent deciding whether to suppress the event.
+    - `process`: from the event to the thread calling handlers picking it up.
+    - `handlers`: time spent in non-suppressing hooks and hotkeys.
+
+    Stages measured from the event compare its timestamp with the current
+    time, so they are only as accurate as the timestamps of the backend.
+    Returns an empty dict if latency was never measured.
+    """
+    if _latency_stats is None:
+        return {}
+    histograms = {}
+    os_keyboard = _get_os_keyboard()
+    if hasattr(os_keyboard, "latency_histograms"):
+        histograms.update(os_keyboard.latency_histograms())
+    histograms.update(_latency_stats.histograms)
+    return {stage: histogram.summary() for stage, histogram in histograms.items()}
+
+
+_handler_profile = None
+
+
+def enable_handler_profiling(budget=0.01, on_slow=_warn_slow_handler):
+    """
+    Starts recording how many times each hook, key hook, hotkey, word
+    listener and `record`er is called and how long it takes, from scratch,
+    including the ones that suppress events. See `handler_profile`.
+
+    - `budget` is the number of seconds a handler may take before it's
+    counted as slow, or None for no limit.
+    - `on_slow(name, seconds)` is called for each slow call, from the thread
+    processing events. By default it issues a `RuntimeWarning`.
+    """
+    global _handler_profile
+    _handler_profile = _HandlerProfile(budget, on_slow)
+    _get_listener().profile = _handler_profile
+
+
+def disable_handler_profiling():
+    """
+    Stops profiling handlers. What was recorded is still returned by
+    `handler_profile` until profiling starts again.
+    """
+    _get_listener().profile = None
+
+
+def handler_profile(limit=10, sort_by="total"):
+    """
+    Returns the `limit` handlers that took the most time since profiling
+    started, sorted by "total", "max", "calls" or "slow". Each one is a dict
+    with its `name`, including where it was defined, the number of `calls`,
+    their `total` and `max` duration in seconds, and how many were `slow`.
+
+    Example:
+
+        keyboard.enable_handler_profiling(budget=0.005)
+        ...
+        for handler in keyboard.handler_profile(5):
+            print(handler['name'], handler['calls'], handler['max'])
+    """
+    if _handler_profile is None:
+        return []
+    return _handler_profile.top(limit, sort_by)
 
 
 _hooks = {}
@@ -728,6 +1012,7 @@ def hook(callback, suppress=False, on_remove=lambda: None):
         _hooks.pop(callback, None)
         _hooks.pop(remove_, None)
         remove(callback)
+        _get_listener().forget_handler(callback)
         on_remove()
 
     _hooks[callback] = _hooks[remove_] = remove_
@@ -738,6 +1023,8 @@ def on_press(callback, suppress=False):
     """
     Invokes `callback` for every KEY_DOWN event. For details see `hook`.
     """
+    if not suppress:
+        callback = _offloaded(callback)
     return hook(lambda e: e.event_type == KEY_UP or callback(e), suppress=suppress)
 
 
@@ -745,6 +1032,8 @@ def on_release(callback, suppress=False):
     """
     Invokes `callback` for every KEY_UP event. For details see `hook`.
     """
+    if not suppress:
+        callback = _offloaded(callback)
     return hook(lambda e: e.event_type == KEY_DOWN or callback(e), suppress=suppress)
 
 
@@ -762,15 +1051,17 @@ def hook_key(key, callback, suppress=False):
         _get_listener().blocking_keys if suppress else _get_listener().nonblocking_keys
     )
     scan_codes = key_to_scan_codes(key)
+    handler = callback if suppress else _offloaded(callback)
     for scan_code in scan_codes:
-        store[scan_code].append(callback)
+        store[scan_code].append(handler)
 
     def remove_():
         _hooks.pop(callback, None)
         _hooks.pop(key, None)
         _hooks.pop(remove_, None)
         for scan_code in scan_codes:
-            store[scan_code].remove(callback)
+            store[scan_code].remove(handler)
+        _get_listener().forget_handler(handler)
 
     _hooks[callback] = _hooks[key] = _hooks[remove_] = remove_
     return remove_
@@ -856,35 +1147,6 @@ def parse_hotkey_combinations(hotkey):
     return tuple(tuple(combine_step(step)) for step in parse_hotkey(hotkey))
 
 
-def _add_hotkey_step(handler, combinations, suppress):
-    """
-    Hooks a single-step hotkey (e.g. 'shift+a').
-    """
-    container = (
-        _get_listener().blocking_hotkeys
-        if suppress
-        else _get_listener().nonblocking_hotkeys
-    )
-
-    # Register the scan codes of every possible combination of
-    # modfiier + main key. Modifiers have to be registered in
-    # filtered_modifiers too, so suppression and replaying can work.
-    for scan_codes in combinations:
-        for scan_code in scan_codes:
-            if is_modifier(scan_code):
-                _get_listener().filtered_modifiers[scan_code] += 1
-        container[scan_codes].append(handler)
-
-    def remove():
-        for scan_codes in combinations:
-            for scan_code in scan_codes:
-                if is_modifier(scan_code):
-                    _get_listener().filtered_modifiers[scan_code] -= 1
-            container[scan_codes].remove(handler)
-
-    return remove
-
-
 _hotkeys = {}
 
 
@@ -932,9 +1194,11 @@ def add_hotkey(
         def callback(callback=callback):
             return callback(*args)
 
+    run = _offloaded(callback)
+
     _get_listener().start_if_necessary()
 
-    steps = parse_hotkey_combinations(hotkey)
+    steps = parse_hotkey(hotkey)
 
     event_type = KEY_UP if trigger_on_release else KEY_DOWN
     if len(steps) == 1:
@@ -947,98 +1211,24 @@ def add_hotkey(
                 event_type == KEY_DOWN
                 and e.event_type == KEY_UP
                 and e.scan_code in _logically_pressed_keys
-            ) or (event_type == e.event_type and callback())
-
-        remove_step = _add_hotkey_step(handler, steps[0], suppress)
-
-        def remove_():
-            remove_step()
-            _hotkeys.pop(hotkey, None)
-            _hotkeys.pop(remove_, None)
-            _hotkeys.pop(callback, None)
-
-        # TODO: allow multiple callbacks for each hotkey without overwriting the
-        # remover.
-        _hotkeys[hotkey] = _hotkeys[remove_] = _hotkeys[callback] = remove_
-        return remove_
-
-    state = _State()
-    state.remove_catch_misses = lambda: None
-    state.remove_last_step = None
-    state.suppressed_events = []
-    state.last_update = float("-inf")
-
-    def catch_misses(event, force_fail=False):
-        if (
-            (
-                event.event_type == event_type
-                and state.index
-                and event.scan_code not in allowed_keys_by_step[state.index]
-            )
-            or (timeout and _time.monotonic() - state.last_update >= timeout)
-            or force_fail
-        ):  # Weird formatting to ensure short-circuit.
-            state.remove_last_step()
-
-            for event in state.suppressed_events:
-                if event.event_type == KEY_DOWN:
-                    press(event.scan_code)
-                else:
-                    release(event.scan_code)
-            del state.suppressed_events[:]
-
-            index = 0
-            set_index(0)
-        return True
-
-    def set_index(new_index):
-        state.index = new_index
-
-        if new_index == 0:
-            # This is done for performance reasons, avoiding a global key hook
-            # that is always on.
-            state.remove_catch_misses()
-            state.remove_catch_misses = lambda: None
-        elif new_index == 1:
-            state.remove_catch_misses()
-            # Must be `suppress=True` to ensure `send` has priority.
-            state.remove_catch_misses = hook(catch_misses, suppress=True)
-
-        if new_index == len(steps) - 1:
-
-            def handler(event):
-                if event.event_type == KEY_UP:
-                    remove()
-                    set_index(0)
-                accept = event.event_type == event_type and callback()
-                if accept:
-                    return catch_misses(event, force_fail=True)
-                else:
-                    state.suppressed_events[:] = [event]
-                    return False
-
-            remove = _add_hotkey_step(handler, steps[state.index], suppress)
-        else:
-            # Fix value of next_index.
-            def handler(event, new_index=state.index + 1):
-                if event.event_type == KEY_UP:
-                    remove()
-                    set_index(new_index)
-                state.suppressed_events.append(event)
-                return False
-
-            remove = _add_hotkey_step(handler, steps[state.index], suppress)
-        state.remove_last_step = remove
-        state.last_update = _time.monotonic()
-        return False
+            ) or (event_type == e.event_type and run())
 
-    set_index(0)
+    else:
+        # The matcher follows the sequence, and only calls this on the
+        # trigger event of the last step.
+        def handler(e):
+            return run()
 
-    allowed_keys_by_step = [set().union(*step) for step in steps]
+    matcher = (
+        _get_listener().blocking_hotkeys
+        if suppress
+        else _get_listener().nonblocking_hotkeys
+    )
+    compiled = matcher.add(steps, handler, event_type, timeout)
 
     def remove_():
-        state.remove_catch_misses()
-        state.remove_last_step()
+        matcher.remove(compiled)
+        _get_listener().forget_handler(handler)
         _hotkeys.pop(hotkey, None)
         _hotkeys.pop(remove_, None)
         _hotkeys.pop(callback, None)
@@ -1185,12 +1375,43 @@ def write_list(keys: list[str], delay=0):
     process_chunk()
 
 
+# Bumped when the key names of the backend change, so write plans compiled
+# before are not used anymore.
+_layout_generation = 0
+
+
+@_functools.lru_cache(maxsize=256)
+def _compile_text(text, layout_generation):
+    return _compile_plan(
+        text, _get_os_keyboard().map_name, lambda name: key_to_scan_codes(name)[0]
+    )
+
+
+def compile_text(text):
+    """
+    Resolves the keys that type `text` and returns them as a `WritePlan`,
+    which `write` types without looking anything up. Plans of the last 256
+    texts are cached, so texts typed often, like abbreviations, are only
+    resolved once.
+
+    Example:
+
+        signature = keyboard.compile_text('Best regards,\nJohn')
+        keyboard.add_hotkey('ctrl+alt+s', keyboard.write, args=[signature])
+    """
+    return _compile_text(text, _layout_generation)
+
+
 def write(text, delay=0, restore_state_after=True, exact=None):
     """
     Sends artificial keyboard events to the OS, simulating the typing of a given
     text. Characters not available on the keyboard are typed as explicit unicode
     characters using OS-specific functionality, such as alt+codepoint.
 
+    `text` may also be a plan returned by `compile_text`. Backends that can
+    send several keys at once get the whole text in a single device write
+    when there is no delay.
+
     To ensure text integrity, all currently pressed keys are released before
     the text is typed, and modifiers are restored afterwards.
 
@@ -1213,6 +1434,8 @@ def write(text, delay=0, restore_state_after=True, exact=None):
 
     # Window's typing of unicode characters is quite efficient and should be preferred.
     if exact:
+        if isinstance(text, WritePlan):
+            text = text.text
         for letter in text:
             if letter in "\n\b":
                 send(letter)
@@ -1220,42 +1443,34 @@ def write(text, delay=0, restore_state_after=True, exact=None):
                 _get_os_keyboard().type_unicode(letter)
             _time.sleep(delay)
     else:
-        last_modifiers = None
-
-        def release_all_last_modifiers():
-            nonlocal last_modifiers
-            if last_modifiers is not None:
-                for modifier in last_modifiers:
-                    release(modifier)
-                last_modifiers = None
-
-        for letter in text:
-            try:
-                entries = _get_os_keyboard().map_name(normalize_name(letter))
-                scan_code, modifiers = next(iter(entries))
-            except (KeyError, ValueError, StopIteration):
-                # doesn't work on wayland
-                release_all_last_modifiers()
-                _get_os_keyboard().type_unicode(letter)
-                continue
-
-            # TODO: minioptmization only release modifiers that are no longer needed same for pressing
-            if last_modifiers is not None and set(last_modifiers) != set(modifiers):
-                release_all_last_modifiers()
-
-            if last_modifiers is None:
-                for modifier in modifiers:
-                    press(modifier)
-                last_modifiers = modifiers
-
-            _get_os_keyboard().press(scan_code, "shift" in modifiers)
-            _get_os_keyboard().release(scan_code, "shift" in modifiers)
-
-            _time.sleep(delay)
+        plan = text if isinstance(text, WritePlan) else compile_text(text)
+        os_keyboard = _get_os_keyboard()
+        if not delay and hasattr(os_keyboard, "send_keys") and not getattr(os_keyboard, "patient_type", False):
+            for pairs, letter in plan.batches:
+                if pairs:
+                    os_keyboard.send_keys(pairs)
+                if letter is not None:
+                    os_keyboard.type_unicode(letter)
+        else:
+            press, release = os_keyboard.press, os_keyboard.release
+            for actions, letter in plan.steps:
+                for scan_code, is_down, shifted in actions:
+                    if is_down:
+                        press(scan_code, shifted)
+                    else:
+                        release(scan_code, shifted)
+                if letter is None:
+                    _time.sleep(delay)
+                else:
+                    # doesn't work on wayland
+                    os_keyboard.type_unicode(letter)
+            for scan_code, is_down, shifted in plan.final:
+                release(scan_code, shifted)
 
-        if last_modifiers:
-            for modifier in last_modifiers:
-                release(modifier)
+        # The modifiers typed with are released now.
+        if plan.modifiers:
+            with _virtually_pressed_events_lock:
+                _virtually_pressed_events.difference_update(plan.modifiers)
 
     if restore_state_after:
         restore_modifiers(state)
@@ -1370,6 +1585,130 @@ def read_hotkey(suppress=True):
             return get_hotkey_name(names)
 
 
+_event_hubs = {}
+
+
+def _get_event_hub():
+    # Imported here because asyncio is slow to import, and already is by
+    # anyone running a loop.
+    import asyncio
+    from ._async_events import EventHub
+
+    loop = asyncio.get_running_loop()
+    hub = _event_hubs.get(loop)
+    if hub is None:
+        for other in list(_event_hubs):
+            if other.is_closed():
+                _event_hubs.pop(other).close()
+        hub = _event_hubs[loop] = EventHub(loop, hook, add_hotkey)
+    return hub
+
+
+async def events(filter=None, maxsize=256):
+    """
+    Asynchronous iterator over the keyboard events, for asyncio programs.
+    `filter` is an optional function that receives each event and returns
+    whether to keep it. If the consumer falls behind by more than `maxsize`
+    events, the oldest ones are dropped.
+
+    All iterators and waiters of an event loop share a single hook, so there
+    may be any number of them without threads or polling.
+
+    Example:
+
+        async for event in keyboard.events(lambda e: e.event_type == 'down'):
+            print(event.name)
+    """
+    hub = _get_event_hub()
+    subscription = hub.subscribe(filter, maxsize)
+    try:
+        while True:
+            yield await subscription.get()
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def wait_async(hotkey=None, suppress=False, trigger_on_release=False):
+    """
+    Asynchronous version of `wait`: returns once the given hotkey is pressed
+    or, if given no hotkey, never.
+    """
+    import asyncio
+
+    if not hotkey:
+        await asyncio.get_running_loop().create_future()
+    await _get_event_hub().wait_hotkey(hotkey, suppress, trigger_on_release)
+
+
+async def read_event_async(suppress=False):
+    """
+    Asynchronous version of `read_event`: returns the next keyboard event.
+    """
+    if not suppress:
+        hub = _get_event_hub()
+        # Events can arrive in batches, the first one is the next event.
+        subscription = hub.subscribe(maxsize=1, keep_oldest=True)
+        try:
+            return await subscription.get()
+        finally:
+            hub.unsubscribe(subscription)
+
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def fn(event):
+        # Suppresses until the hook is removed, like `read_event`.
+        if not future.done():
+            loop.call_soon_threadsafe(_set_result, future, event)
+
+    hooked = hook(fn, suppress=True)
+    try:
+        return await future
+    finally:
+        unhook(hooked)
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+async def read_key_async(suppress=False):
+    """
+    Asynchronous version of `read_key`: returns the name of the next key
+    event or, if missing, its scan code.
+    """
+    event = await read_event_async(suppress)
+    return event.name or event.scan_code
+
+
+async def read_hotkey_async(suppress=True):
+    """
+    Asynchronous version of `read_hotkey`: returns once the user presses and
+    releases a hotkey (or single key), the string representing it.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def fn(event):
+        if event.event_type == KEY_UP and not future.done():
+            # The pressed keys are read now, the loop may run much later.
+            with _pressed_events_lock:
+                names = [e.name for e in _pressed_events.values()] + [event.name]
+            loop.call_soon_threadsafe(_set_result, future, get_hotkey_name(names))
+        return event.event_type == KEY_DOWN
+
+    hooked = hook(fn, suppress=suppress)
+    try:
+        return await future
+    finally:
+        unhook(hooked)
+
+
 def get_typed_strings(events, allow_backspace=True):
     """
     Given a sequence of events, tries to deduce what strings were typed.
@@ -1424,13 +1763,22 @@ def get_typed_strings(events, allow_backspace=True):
 _recording = None
 
 
-def start_recording(recorded_events_queue=None):
+def start_recording(recorded_events_queue=None, spill_path=None, window=10000):
     """
     Starts recording all keyboard events into a global variable, or the given
     queue if any. Returns the queue of events and the hooked function.
 
+    For long recordings, give a `spill_path`: only the last `window` events
+    are then kept in memory, older ones are appended to a new file at that
+    path in the format of `save_recording`. It can't be combined with
+    `recorded_events_queue`.
+
     Use `stop_recording()` or `unhook(hooked_function)` to stop.
     """
+    if spill_path is not None:
+        if recorded_events_queue is not None:
+            raise ValueError("Give either recorded_events_queue or spill_path, not both.")
+        recorded_events_queue = _SpillingRecorder(spill_path, window)
     recorded_events_queue = recorded_events_queue or _queue.Queue()
     global _recording
     _recording = (recorded_events_queue, hook(recorded_events_queue.put))
@@ -1441,30 +1789,65 @@ def stop_recording():
     """
     Stops the global recording of events and returns a list of the events
     captured.
+
+    Recordings started with a `spill_path` return a read-only sequence
+    instead, which reads the events spilled to the file as they're accessed.
     """
     global _recording
     if not _recording:
         raise ValueError('Must call "start_recording" before.')
     recorded_events_queue, hooked = _recording
     unhook(hooked)
+    if isinstance(recorded_events_queue, _SpillingRecorder):
+        return recorded_events_queue.stop()
     return list(recorded_events_queue.queue)
 
 
-def record(until="escape", suppress=False, trigger_on_release=False):
+def record(until="escape", suppress=False, trigger_on_release=False, spill_path=None, window=10000):
     """
     Records all keyboard events from all keyboards until the user presses the
     given hotkey. Then returns the list of events recorded, of type
     `keyboard.KeyboardEvent`. Pairs well with
     `play(events)`.
 
+    `spill_path` and `window` keep long recordings out of memory, see
+    `start_recording`.
+
     Note: this is a blocking function.
     Note: for more details on the keyboard hook and events see `hook`.
     """
-    start_recording()
+    start_recording(spill_path=spill_path, window=window)
     wait(until, suppress=suppress, trigger_on_release=trigger_on_release)
     return stop_recording()
 
 
+def save_recording(events, path):
+    """
+    Saves events, such as the ones returned by `record`, to a file in a
+    compact binary format, about 16 bytes per event. Returns the number of
+    events saved.
+
+        keyboard.save_recording(keyboard.record(), 'macro.kbr')
+    """
+    with open(path, "wb") as file:
+        writer = RecordingWriter(file)
+        writer.write_events(events)
+        return writer.count
+
+
+def load_recording(path):
+    """
+    Opens a file saved by `save_recording` and returns a `RecordingReader`.
+    The file is memory-mapped and events are only created as they're
+    iterated, so it can be passed to `play` whatever its size. Use its
+    `events` method to iterate only some of them.
+
+        with keyboard.load_recording('macro.kbr') as recording:
+            keyboard.play(recording)
+    """
+    return RecordingReader(path)
+
+
 # on linux using evdev stops collisions from keyboards by making keyboard wait
 def patient_collision_safe_mode():
     if not _initialized:
@@ -1486,26 +1869,73 @@ def end_patient_collision_safe_mode():
         _get_os_keyboard().patient_type = True
 
 
-def play(events, speed_factor=1.0):
+# What playing a key event needs, with the scan code looked up.
+_PlayedKey = _collections.namedtuple("_PlayedKey", "time event_type scan_code")
+
+
+def _resolve_key_event(event):
+    scan_code = event.scan_code
+    if scan_code is None:
+        scan_code = key_to_scan_codes(event.name)[0]
+    return _PlayedKey(event.time, event.event_type, scan_code)
+
+
+def _send_key_events(events):
+    # Like `_replay_events`, in a single device write.
+    actions = []
+    with _virtually_pressed_events_lock:
+        for event in events:
+            scan_code = event.scan_code
+            is_down = event.event_type == KEY_DOWN
+            if is_down:
+                _virtually_pressed_events.add(scan_code)
+            else:
+                _virtually_pressed_events.discard(scan_code)
+            actions.append((scan_code, is_down))
+    _get_os_keyboard().send_keys(actions)
+
+
+def play(events, speed_factor=1.0, prefetch=1024):
     """
     Plays a sequence of recorded events, maintaining the relative time
     intervals. If speed_factor is <= 0 then the actions are replayed as fast
     as the OS allows. Pairs well with `record()`.
 
+    Events are sent at their time since the start of the playback, so delays
+    don't add up over long recordings. Events less than a millisecond apart
+    are sent together, in a single device write on backends that support it.
+
+    Returns how far from their time the events were sent, as the `count` of
+    events and the `mean`, `max` and approximate `p50`, `p90` and `p99`
+    percentiles in microseconds. The count is 0 when replayed without delays.
+
+    `events` may also be an iterator, such as a generator parsing a file. It
+    is then consumed on a background thread, which looks the keys up ahead of
+    time, holding about `prefetch` events at a time in memory.
+
     Note: the current keyboard state is cleared at the beginning and restored at
     the end of the function.
     """
-    state = stash_state()
+    if _is_list(events):
+        keys = [_resolve_key_event(event) for event in events]
+    else:
+        keys = _Prefetcher(events, _resolve_key_event, size=prefetch)
 
-    last_time = None
-    for event in events:
-        if speed_factor > 0 and last_time is not None:
-            _time.sleep((event.time - last_time) / speed_factor)
-        last_time = event.time
+    state = stash_state()
 
-        _unsafe_propagate(event)
+    os_keyboard = _get_os_keyboard()
+    if hasattr(os_keyboard, "send_keys") and not getattr(os_keyboard, "patient_type", False):
+        send = _send_key_events
+    else:
+        send = _replay_events
+    try:
+        errors = _play_timed(keys, speed_factor, send)
+    finally:
+        if not _is_list(keys):
+            keys.close()
 
     restore_modifiers(state)
+    return errors.summary()
 
 
 replay = play
@@ -1543,6 +1973,7 @@ def add_word_listener(
     state = _State()
     state.current = ""
     state.time = -1
+    run = _offloaded(callback)
 
     def handler(event):
         name = event.name
@@ -1557,7 +1988,7 @@ def add_word_listener(
             match_suffix and state.current.endswith(word)
         )
         if name in triggers and matched:
-            callback()
+            run()
             state.current = ""
         elif len(name) > 1:
             state.current = ""
@@ -1617,6 +2048,28 @@ def add_abbreviation(source_text, replacement_text, match_suffix=False, timeout=
 
 
 
+def invalidate_keymap_cache():
+    """
+    Reads the key names of the evdev (Linux) backend again from the console
+    keymap, replacing the copy cached on disk. Call it after changing the
+    keymap with `loadkeys`. On other backends only the tables derived from
+    the key names are dropped.
+
+    Registered hotkeys keep the scan codes their keys had when added, but
+    are matched with the new modifiers. Add them again to use the new key
+    names.
+    """
+    global _layout_generation, _sided_modifier_ids
+    os_keyboard = _get_os_keyboard()
+    if hasattr(os_keyboard, "invalidate_tables_cache"):
+        os_keyboard.invalidate_tables_cache()
+    _layout_generation += 1
+    _sided_modifier_ids = None
+    _modifier_scan_codes.clear()
+    if _listener is not None:
+        _listener.blocking_hotkeys.recompile()
+        _listener.nonblocking_hotkeys.recompile()
+
 
 def grab():
     """
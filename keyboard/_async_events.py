@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Delivers keyboard events to coroutines of an asyncio event loop.
+
+Each loop gets a single hub, holding a single hook no matter how many
+coroutines listen. The listener thread appends events to a buffer and wakes
+the loop with `call_soon_threadsafe` only if it's not already scheduled to
+read it, then the loop hands them out to each subscriber's bounded queue.
+Waiters for the same hotkey likewise share one hotkey registration.
+"""
+import asyncio
+from collections import deque
+from threading import Lock
+
+
+class Subscription(object):
+    """
+    Queue of events for one subscriber. When full, the oldest events are
+    dropped and counted in `dropped`, or the newest ones if `keep_oldest`.
+    """
+
+    def __init__(self, filter, maxsize, keep_oldest=False):
+        self.filter = filter
+        self.events = deque(maxlen=maxsize)
+        self.keep_oldest = keep_oldest
+        self.dropped = 0
+        self.waiter = None
+
+    def put(self, event):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+            if self.keep_oldest:
+                return
+        self.events.append(event)
+        waiter = self.waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def get(self):
+        while not self.events:
+            self.waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+        return self.events.popleft()
+
+
+class EventHub(object):
+    """
+    Events and hotkeys of one event loop. `hook` and `add_hotkey` are the
+    functions of the same name in `keyboard`.
+    """
+
+    def __init__(self, loop, hook, add_hotkey):
+        self.loop = loop
+        self.hook = hook
+        self.add_hotkey = add_hotkey
+        self.subscriptions = set()
+        self.remove_hook = None
+        self.lock = Lock()
+        self.buffer = []
+        self.scheduled = False
+        # (hotkey, suppress, trigger_on_release) -> [remove, set of futures]
+        self.hotkeys = {}
+
+    def _send(self, callback, *args):
+        # From other threads. A closed loop can't be woken anymore, which is
+        # fine, there's nobody left to wake.
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass
+
+    def _on_event(self, event):
+        with self.lock:
+            self.buffer.append(event)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self._send(self._flush)
+
+    def _flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+            self.scheduled = False
+        for subscription in list(self.subscriptions):
+            filter = subscription.filter
+            for event in events:
+                if filter is None or filter(event):
+                    subscription.put(event)
+
+    def subscribe(self, filter=None, maxsize=256, keep_oldest=False):
+        subscription = Subscription(filter, maxsize, keep_oldest)
+        self.subscriptions.add(subscription)
+        if self.remove_hook is None:
+            self.remove_hook = self.hook(self._on_event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+        if not self.subscriptions and self.remove_hook is not None:
+            remove_hook, self.remove_hook = self.remove_hook, None
+            remove_hook()
+
+    def wait_hotkey(self, hotkey, suppress=False, trigger_on_release=False):
+        """Returns a future set the next time `hotkey` is pressed."""
+        key = (hotkey, suppress, trigger_on_release)
+        registration = self.hotkeys.get(key)
+        if registration is None:
+            remove = self.add_hotkey(
+                hotkey,
+                lambda: self._send(self._trigger, key),
+                suppress=suppress,
+                trigger_on_release=trigger_on_release,
+            )
+            registration = self.hotkeys[key] = [remove, set()]
+        future = self.loop.create_future()
+        registration[1].add(future)
+        future.add_done_callback(lambda future: self._forget(key, future))
+        return future
+
+    def _trigger(self, key):
+        registration = self.hotkeys.get(key)
+        if registration is not None:
+            for future in list(registration[1]):
+                if not future.done():
+                    future.set_result(None)
+
+    def _forget(self, key, future):
+        registration = self.hotkeys.get(key)
+        if registration is None:
+            return
+        registration[1].discard(future)
+        if not registration[1]:
+            del self.hotkeys[key]
+            registration[0]()
+
+    def close(self):
+        """Removes the hook and hotkeys, once the loop is closed."""
+        self.subscriptions.clear()
+        if self.remove_hook is not None:
+            remove_hook, self.remove_hook = self.remove_hook, None
+            remove_hook()
+        for remove, futures in self.hotkeys.values():
+            remove()
+        self.hotkeys.clear()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Runs user callbacks in a bounded pool of threads, so a slow callback doesn't
+hold back the events after it.
+
+Calls are queued by key, usually one per registered hotkey or hook. Calls with
+the same key run one at a time and in order, calls with different keys run in
+parallel. Each key queues at most `max_pending` calls, and what happens to the
+rest depends on `overflow`:
+
+- "drop": new calls are discarded while the queue is full.
+- "coalesce": new calls replace the ones still waiting, so only the latest
+runs once the callback catches up.
+"""
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, get_ident
+from time import perf_counter
+
+OVERFLOW_POLICIES = ("drop", "coalesce")
+
+
+class CallbackExecutor(object):
+    def __init__(self, max_workers=4, max_pending=32, overflow="drop"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow policy {!r}, expected one of {}".format(
+                    overflow, ", ".join(OVERFLOW_POLICIES)
+                )
+            )
+        if max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="keyboard-callback")
+        self.lock = Lock()
+        # Key -> deque of (function, args) waiting. A key is present while
+        # one of its calls is running.
+        self.queues = {}
+        # Idents of the worker threads, which can't wait for themselves.
+        self.workers = set()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def submit(self, key, fn, args=()):
+        """
+        Queues `fn(*args)` after the other calls with the same key. Returns
+        False if it was dropped.
+        """
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                try:
+                    self.pool.submit(self._run, key, fn, args)
+                except RuntimeError:
+                    # Shut down.
+                    self.dropped += 1
+                    return False
+                self.queues[key] = deque()
+                self.submitted += 1
+                return True
+
+            if len(queue) >= self.max_pending:
+                if self.overflow == "drop":
+                    self.dropped += 1
+                    return False
+                self.coalesced += len(queue)
+                self.queue_depth -= len(queue)
+                queue.clear()
+            queue.append((fn, args))
+            self.submitted += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            return True
+
+    def _run(self, key, fn, args):
+        # Drains the queue of a key, on a single worker.
+        self.workers.add(get_ident())
+        while True:
+            start = perf_counter()
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+                failed = 1
+            else:
+                failed = 0
+            duration = perf_counter() - start
+
+            with self.lock:
+                self.completed += 1
+                self.failed += failed
+                self.total_time += duration
+                self.max_time = max(self.max_time, duration)
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                fn, args = queue.popleft()
+                self.queue_depth -= 1
+
+    def stats(self):
+        """
+        Returns a dict with the number of calls `submitted`, `completed`,
+        `failed` (raised an exception), `dropped` and `coalesced`; the
+        `queue_depth` of calls waiting and its maximum; and the `total_time`
+        and `max_time`, in seconds, spent in callbacks.
+        """
+        with self.lock:
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "total_time": self.total_time,
+                "max_time": self.max_time,
+            }
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers, after the calls already queued if `wait`. From a
+        callback running on a worker it never waits, since that worker would
+        have to wait for itself; the queued calls still run.
+        """
+        self.pool.shutdown(wait=wait and get_ident() not in self.workers)
@@ -1,7 +1,128 @@
 # -*- coding: utf-8 -*-
 from threading import Thread, Lock
 import traceback
+import warnings
 from queue import Queue
+from time import perf_counter_ns
+
+
+def describe_handler(handler):
+    """
+    Returns a readable name for a handler, with where it was defined. Looks
+    through the wrappers `keyboard` puts around callbacks (closures over a
+    `callback` or `run` variable) to name the user's function instead.
+    """
+    for _ in range(10):
+        code = getattr(handler, "__code__", None)
+        closure = getattr(handler, "__closure__", None)
+        if code is None or not closure:
+            break
+        for variable in ("callback", "run"):
+            if variable in code.co_freevars:
+                break
+        else:
+            break
+        inner = closure[code.co_freevars.index(variable)].cell_contents
+        if not callable(inner):
+            break
+        handler = inner
+
+    name = getattr(handler, "__qualname__", None) or type(handler).__qualname__
+    module = getattr(handler, "__module__", None)
+    if module:
+        name = module + "." + name
+    code = getattr(handler, "__code__", None)
+    if code is not None:
+        name += " ({}:{})".format(code.co_filename, code.co_firstlineno)
+    return name
+
+
+def warn_slow_handler(name, seconds):
+    warnings.warn(
+        "Keyboard handler {} took {:.1f} ms".format(name, seconds * 1e3),
+        RuntimeWarning,
+    )
+
+
+class HandlerProfile(object):
+    """
+    Call count, total and maximum duration of each handler. Handlers that
+    take longer than `budget` seconds are counted as slow and passed to
+    `on_slow(name, seconds)`, which warns by default.
+    """
+
+    def __init__(self, budget=0.01, on_slow=warn_slow_handler):
+        self.budget_ns = int(budget * 1e9) if budget else None
+        self.on_slow = on_slow
+        # Handler -> [calls, total ns, max ns, slow calls]
+        self.entries = {}
+
+    def invoke_handlers(self, handlers, event):
+        for handler in handlers:
+            start = perf_counter_ns()
+            try:
+                if handler(event):
+                    # Stop processing this hotkey.
+                    return 1
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._record(handler, perf_counter_ns() - start)
+
+    def call(self, handler, event):
+        """
+        Returns `handler(event)`, for handlers called one at a time such as
+        key hooks and hotkeys. Exceptions are raised as usual.
+        """
+        start = perf_counter_ns()
+        try:
+            return handler(event)
+        finally:
+            self._record(handler, perf_counter_ns() - start)
+
+    def _record(self, handler, duration):
+        entries = self.entries
+        entry = entries.get(handler)
+        if entry is None:
+            entry = entries[handler] = [0, 0, 0, 0]
+        entry[0] += 1
+        entry[1] += duration
+        if duration > entry[2]:
+            entry[2] = duration
+        if self.budget_ns is not None and duration > self.budget_ns:
+            entry[3] += 1
+            self._report_slow(handler, duration)
+
+    def forget(self, handler):
+        """Drops what was recorded for a handler that was removed."""
+        self.entries.pop(handler, None)
+
+    def _report_slow(self, handler, duration):
+        if self.on_slow is None:
+            return
+        try:
+            self.on_slow(describe_handler(handler), duration / 1e9)
+        except Exception:
+            traceback.print_exc()
+
+    def top(self, limit=10, sort_by="total"):
+        """
+        Returns the `limit` handlers that took the most time, by `sort_by`
+        ("total", "max", "calls" or "slow"), as dicts with their `name`,
+        `calls`, `total` and `max` seconds, and `slow` calls.
+        """
+        rows = [
+            {
+                "name": describe_handler(handler),
+                "calls": calls,
+                "total": total / 1e9,
+                "max": max_ns / 1e9,
+                "slow": slow,
+            }
+            for handler, (calls, total, max_ns, slow) in self.entries.copy().items()
+        ]
+        rows.sort(key=lambda row: row[sort_by], reverse=True)
+        return rows[:limit]
 
 
 class GenericListener(object):
@@ -11,8 +132,15 @@ class GenericListener(object):
         self.handlers = []
         self.listening = False
         self.queue = Queue()
+        # LatencyStats while measuring, see _latency.
+        self.latency = None
+        # HandlerProfile while profiling.
+        self.profile = None
 
     def invoke_handlers(self, event):
+        profile = self.profile
+        if profile is not None:
+            return profile.invoke_handlers(self.handlers, event)
         for handler in self.handlers:
             try:
                 if handler(event):
@@ -52,10 +180,18 @@ class GenericListener(object):
         assert self.queue is not None
         while True:
             event = self.queue.get()
-            if self.pre_process_event(event):
-                self.invoke_handlers(event)
+            latency = self.latency
+            if latency is None:
+                if self.pre_process_event(event):
+                    self.invoke_handlers(event)
+            else:
+                latency.time_handlers(self.process_event, event)
             self.queue.task_done()
 
+    def process_event(self, event):
+        if self.pre_process_event(event):
+            self.invoke_handlers(event)
+
     def add_handler(self, handler):
         """
         Adds a function to receive each event captured, starting the capturing
@@ -64,7 +200,23 @@ class GenericListener(object):
         self.start_if_necessary()
         self.handlers.append(handler)
 
+    def call_handler(self, handler, event):
+        """
+        Calls a handler that's not in `handlers`, profiling it like them.
+        """
+        profile = self.profile
+        if profile is None:
+            return handler(event)
+        return profile.call(handler, event)
+
+    def forget_handler(self, handler):
+        """ Drops the profile of a handler that was removed. """
+        profile = self.profile
+        if profile is not None:
+            profile.forget(handler)
+
     def remove_handler(self, handler):
         """ Removes a previously added event handler. """
         while handler in self.handlers:
             self.handlers.remove(handler)
+        self.forget_handler(handler)
@@ -1,5 +1,12 @@
+from ._linux_event_transports import LinuxEventTransports
+from ._linux_reader_modes import LinuxReaderModes
+
+
 class GlobalData:
     device_name = "PyKey virtual keyboard"
+    linux_event_transport = LinuxEventTransports.QUEUE
+    linux_reader_mode = LinuxReaderModes.PROCESS
 
 
 global_data = GlobalData()
+
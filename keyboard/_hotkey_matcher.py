@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+Matches key events against every registered hotkey at once.
+
+Keys are matched by logical identity instead of scan code: `key_id` maps each
+scan code to an id, the same for all the scan codes of a key that has several
+(both shifts are "shift"). All steps of all hotkeys are compiled into a single
+table, from the set of key ids pressed during an event to the `(hotkey, step)`
+pairs it completes, grouped by the scan codes they allow. A step takes a single
+entry however many scan codes its keys have. The table only changes when
+hotkeys are added or removed, so an event costs one dictionary lookup no
+matter how many hotkeys exist, and a step only applies if its hotkey is
+currently waiting for it.
+
+Hotkeys halfway through a sequence are "pending". They fail, replaying any
+events they suppressed, when a key that is not part of the step they wait for
+is pressed, or when their timeout expires. Both are checked here, on each
+event, instead of through a global hook per pending hotkey. Pending hotkeys
+are indexed by the scan codes their step allows, so an event that fails none
+of them is found with lookups. An event that fails some scans the distinct
+steps pending for its event type, so it costs one set lookup per step waited
+for, however many hotkeys share it, and only the hotkeys of the steps that
+fail are visited.
+
+Sequences with a common prefix share the suppressed events, like states of a
+trie would: an event is only replayed once no pending hotkey holds it, and
+not at all if a hotkey holding it triggers.
+"""
+import heapq
+import itertools
+from threading import RLock
+from time import monotonic
+
+from ._keyboard_event import KEY_DOWN, KEY_UP
+
+
+class Hotkey(object):
+    __slots__ = (
+        "steps",
+        "handler",
+        "event_type",
+        "timeout",
+        "allowed_keys",
+        "step_modifiers",
+        "entries",
+        "index",
+        "suppressed",
+        "deadline",
+    )
+
+    def __init__(self, steps, compiled_steps, handler, event_type, timeout):
+        self.steps = steps
+        self.handler = handler
+        self.event_type = event_type
+        self.timeout = timeout
+        self.compile(compiled_steps)
+        self.index = 0
+        self.suppressed = []
+        self.deadline = None
+
+    def compile(self, compiled_steps):
+        self.allowed_keys = [allowed for allowed, _, _ in compiled_steps]
+        # Modifiers counted for each step while it's awaited, so suppression
+        # and replaying of modifiers can work.
+        self.step_modifiers = [modifiers for _, modifiers, _ in compiled_steps]
+        # (key ids, scan codes, step index) of each entry in the transitions
+        # table.
+        self.entries = [
+            (ids, scan_codes, index)
+            for index, (_, _, entries) in enumerate(compiled_steps)
+            for ids, scan_codes in entries
+        ]
+
+
+class HotkeyMatcher(object):
+    """
+    Hotkeys of one kind (blocking or not). `key_id` maps scan codes to
+    logical keys, `modifiers` is a Counter of the modifier scan codes awaited
+    by some hotkey, and `replay` a function that sends again events
+    suppressed by a failed sequence, or None if the hotkeys never suppress
+    events. Handlers are called through `call_handler(handler, event)`,
+    which may profile them.
+    """
+
+    def __init__(self, key_id, is_modifier, modifiers, replay=None, call_handler=None):
+        self.key_id = key_id
+        self.is_modifier = is_modifier
+        self.modifiers = modifiers
+        self.replay = replay
+        self.call_handler = call_handler or _call_handler
+        self.lock = RLock()
+        self.hotkeys = set()
+        # Frozenset of key ids -> {frozenset of allowed scan codes:
+        #     {(hotkey, step index): True}}
+        self.transitions = {}
+        # Step -> compiled step, shared by the hotkeys that have it.
+        self._compiled_steps = {}
+        # Frozenset of pressed scan codes -> frozenset of their key ids, or
+        # None if some key is pressed twice.
+        self._pressed_ids = {}
+        self.pending = set()
+        # Indexes of the pending hotkeys. Scan code -> {hotkey: True} of the
+        # hotkeys whose step allows it; (event type, scan code) -> how many
+        # of the hotkeys triggered by that event type allow it; event type ->
+        # how many are pending; and event type -> {allowed scan codes:
+        # {hotkey: True}} of the hotkeys waiting for that step.
+        self.waiting = {}
+        self.allowing = {}
+        self.pending_types = {}
+        self.awaiting = {}
+        # id(event) -> number of hotkeys holding it back.
+        self.held = {}
+        self.deadlines = []
+        self._order = itertools.count()
+        # (event type, scan code) -> number of events being replayed, and the
+        # ids of the events recognized as one of them. The replay itself is
+        # not matched again.
+        self._replaying = {}
+        self._replayed = set()
+        # Hotkeys being advanced by `match`. Events their callbacks send
+        # meanwhile are matched against the other hotkeys only.
+        self._dispatching = set()
+
+    def __len__(self):
+        return len(self.hotkeys)
+
+    def add(self, steps, handler, event_type=KEY_DOWN, timeout=0):
+        """
+        Registers a hotkey, given as the steps from `parse_hotkey`.
+        `handler(event)` is called on the events of the last step and returns
+        whether to accept the event. Returns the hotkey, for `remove`.
+        """
+        steps = tuple(tuple(tuple(key) for key in step) for step in steps)
+        with self.lock:
+            compiled_steps = [self._compile_step(step) for step in steps]
+            hotkey = Hotkey(steps, compiled_steps, handler, event_type, timeout)
+            self.hotkeys.add(hotkey)
+            self._add_transitions(hotkey)
+            self.modifiers.update(hotkey.step_modifiers[0])
+        return hotkey
+
+    def _add_transitions(self, hotkey):
+        for ids, scan_codes, index in hotkey.entries:
+            groups = self.transitions.setdefault(ids, {})
+            groups.setdefault(scan_codes, {})[(hotkey, index)] = True
+
+    def recompile(self):
+        """
+        Compiles the hotkeys again, after `key_id` or `is_modifier` changed
+        with the keymap. Their scan codes, and so their progress, stay.
+        """
+        with self.lock:
+            self._compiled_steps.clear()
+            self._pressed_ids.clear()
+            self.transitions = {}
+            for hotkey in self.hotkeys:
+                self.modifiers.subtract(hotkey.step_modifiers[hotkey.index])
+                hotkey.compile([self._compile_step(step) for step in hotkey.steps])
+                self.modifiers.update(hotkey.step_modifiers[hotkey.index])
+                self._add_transitions(hotkey)
+
+    def _compile_step(self, step):
+        """
+        Returns the scan codes of a step, its modifiers, and its
+        `(key ids, scan codes)` entries. Usually one, but a key whose scan
+        codes have different ids (like a character typed with or without
+        shift) yields one per choice. Steps that repeat a key can never match
+        and have none.
+        """
+        compiled = self._compiled_steps.get(step)
+        if compiled is not None:
+            return compiled
+
+        alternatives = []
+        for key in step:
+            by_id = {}
+            for scan_code in key:
+                by_id.setdefault(self.key_id(scan_code), set()).add(scan_code)
+            alternatives.append(list(by_id.items()))
+
+        entries = []
+        for choice in itertools.product(*alternatives):
+            ids = frozenset(id for id, codes in choice)
+            if len(ids) == len(choice):
+                entries.append((ids, frozenset().union(*(codes for id, codes in choice))))
+
+        allowed = frozenset().union(*step)
+        modifiers = tuple(scan_code for key in step for scan_code in key if self.is_modifier(scan_code))
+        if len(self._compiled_steps) > 4096:
+            self._compiled_steps.clear()
+        compiled = self._compiled_steps[step] = (allowed, modifiers, tuple(entries))
+        return compiled
+
+    def remove(self, hotkey):
+        with self.lock:
+            if hotkey not in self.hotkeys:
+                return
+            self.hotkeys.remove(hotkey)
+            if hotkey in self.pending:
+                self._unindex(hotkey)
+            self.modifiers.subtract(hotkey.step_modifiers[hotkey.index])
+            hotkey.deadline = None
+            self._release(hotkey.suppressed)
+            del hotkey.suppressed[:]
+            for ids, scan_codes, index in hotkey.entries:
+                groups = self.transitions[ids]
+                members = groups[scan_codes]
+                del members[(hotkey, index)]
+                if not members:
+                    del groups[scan_codes]
+                    if not groups:
+                        del self.transitions[ids]
+
+    def clear(self):
+        with self.lock:
+            for hotkey in list(self.hotkeys):
+                self.remove(hotkey)
+            self.deadlines = []
+            self._compiled_steps.clear()
+            self._pressed_ids.clear()
+
+    def awaited(self):
+        """Returns the steps, as given by `parse_hotkey`, hotkeys wait for."""
+        with self.lock:
+            return set(hotkey.steps[hotkey.index] for hotkey in self.hotkeys)
+
+    def _hold(self, hotkey, event):
+        hotkey.suppressed.append(event)
+        self.held[id(event)] = self.held.get(id(event), 0) + 1
+
+    def _release(self, events):
+        """Returns the events that no other hotkey holds back anymore."""
+        held = self.held
+        released = []
+        for event in events:
+            count = held[id(event)] - 1
+            if count:
+                held[id(event)] = count
+            else:
+                del held[id(event)]
+                released.append(event)
+        return released
+
+    def _index(self, hotkey):
+        event_type = hotkey.event_type
+        allowed = hotkey.allowed_keys[hotkey.index]
+        self.pending.add(hotkey)
+        pending_types = self.pending_types
+        pending_types[event_type] = pending_types.get(event_type, 0) + 1
+        self.awaiting.setdefault(event_type, {}).setdefault(allowed, {})[hotkey] = True
+        waiting = self.waiting
+        allowing = self.allowing
+        for scan_code in allowed:
+            waiting.setdefault(scan_code, {})[hotkey] = True
+            key = (event_type, scan_code)
+            allowing[key] = allowing.get(key, 0) + 1
+
+    def _unindex(self, hotkey):
+        event_type = hotkey.event_type
+        allowed = hotkey.allowed_keys[hotkey.index]
+        self.pending.remove(hotkey)
+        _decrement(self.pending_types, event_type)
+        steps = self.awaiting[event_type]
+        _discard(steps, allowed, hotkey)
+        if not steps:
+            del self.awaiting[event_type]
+        waiting = self.waiting
+        allowing = self.allowing
+        for scan_code in allowed:
+            members = waiting[scan_code]
+            del members[hotkey]
+            if not members:
+                del waiting[scan_code]
+            key = (event_type, scan_code)
+            count = allowing[key] - 1
+            if count:
+                allowing[key] = count
+            else:
+                del allowing[key]
+
+    def _set_index(self, hotkey, index):
+        if hotkey not in self.hotkeys:
+            # Removed by its own callback.
+            return
+        modifiers = self.modifiers
+        for scan_code in hotkey.step_modifiers[hotkey.index]:
+            modifiers[scan_code] -= 1
+        for scan_code in hotkey.step_modifiers[index]:
+            modifiers[scan_code] += 1
+        if hotkey in self.pending:
+            self._unindex(hotkey)
+        hotkey.index = index
+        if index:
+            self._index(hotkey)
+            if hotkey.timeout:
+                hotkey.deadline = monotonic() + hotkey.timeout
+                heapq.heappush(self.deadlines, (hotkey.deadline, next(self._order), hotkey))
+        else:
+            hotkey.deadline = None
+
+    def _fail(self, hotkey):
+        """Resets a hotkey and sends again the events only it held back."""
+        events = self._release(hotkey.suppressed)
+        del hotkey.suppressed[:]
+        self._set_index(hotkey, 0)
+        if self.replay and events:
+            replaying = self._replaying
+            keys = [(event.event_type, event.scan_code) for event in events]
+            for key in keys:
+                replaying[key] = replaying.get(key, 0) + 1
+            try:
+                self.replay(events)
+            finally:
+                # Those not seen again, if the backend sends them later.
+                for key in keys:
+                    if key in replaying:
+                        _decrement(replaying, key)
+                if not replaying:
+                    self._replayed.clear()
+
+    def _is_replayed(self, event):
+        """
+        Whether `event` is one sent by `replay`, which only happens while
+        it runs and so on this thread, since it holds the lock.
+        """
+        if id(event) in self._replayed:
+            return True
+        key = (event.event_type, event.scan_code)
+        if key in self._replaying:
+            _decrement(self._replaying, key)
+            self._replayed.add(id(event))
+            return True
+        return False
+
+    def _consume(self, hotkey, event):
+        """Drops the events of a triggered hotkey from every other one."""
+        consumed = set(map(id, hotkey.suppressed))
+        consumed.add(id(event))
+        self._release(hotkey.suppressed)
+        del hotkey.suppressed[:]
+        for other in self.pending:
+            if other is not hotkey and any(id(e) in consumed for e in other.suppressed):
+                self._release([e for e in other.suppressed if id(e) in consumed])
+                other.suppressed[:] = [e for e in other.suppressed if id(e) not in consumed]
+
+    def expire(self, event):
+        """
+        Fails the pending hotkeys that timed out, or that `event` doesn't
+        belong to. Must be called for every event, before `match`.
+        """
+        if not self.pending:
+            return
+        with self.lock:
+            if self._replaying and self._is_replayed(event):
+                return
+
+            dispatching = self._dispatching
+            deadlines = self.deadlines
+            if deadlines and deadlines[0][0] <= monotonic():
+                now = monotonic()
+                postponed = []
+                while deadlines and deadlines[0][0] <= now:
+                    entry = heapq.heappop(deadlines)
+                    deadline, _, hotkey = entry
+                    # Entries of hotkeys that advanced or reset since are stale.
+                    if hotkey.deadline == deadline and hotkey.index:
+                        if hotkey in dispatching:
+                            postponed.append(entry)
+                        else:
+                            self._fail(hotkey)
+                for entry in postponed:
+                    heapq.heappush(deadlines, entry)
+
+            event_type = event.event_type
+            scan_code = event.scan_code
+            if self.allowing.get((event_type, scan_code), 0) == self.pending_types.get(event_type, 0):
+                # Every pending hotkey of this event type allows it.
+                return
+            for allowed, members in list(self.awaiting.get(event_type, {}).items()):
+                if scan_code not in allowed:
+                    for hotkey in list(members):
+                        # Unless reset by the replay of another one.
+                        if hotkey.index and hotkey not in dispatching:
+                            self._fail(hotkey)
+
+    def _ids(self, scan_codes):
+        try:
+            return self._pressed_ids[scan_codes]
+        except KeyError:
+            pass
+        if len(self._pressed_ids) > 1024:
+            self._pressed_ids.clear()
+        ids = frozenset(map(self.key_id, scan_codes))
+        if len(ids) != len(scan_codes):
+            ids = None
+        self._pressed_ids[scan_codes] = ids
+        return ids
+
+    def match(self, event, scan_codes):
+        """
+        Advances the hotkeys waiting for `scan_codes`, the frozenset of keys
+        pressed. Returns None if there are none, otherwise whether the event
+        should be accepted.
+
+        Pending hotkeys also take the release of any key of their step, even
+        with other keys held, so a suppressed press never leaks its release.
+        """
+        groups = self.transitions.get(self._ids(scan_codes))
+        released = event.event_type == KEY_UP and self.waiting.get(event.scan_code)
+        if not groups and not released:
+            return None
+        with self.lock:
+            if self._replaying and self._is_replayed(event):
+                return None
+            # Decided before advancing, so a hotkey moves at most one step.
+            dispatching = self._dispatching
+            matched = []
+            if groups:
+                # Same keys pressed, each once. A scan code always has the
+                # same id, so they're the right ones if all are allowed.
+                for allowed, members in groups.items():
+                    if scan_codes <= allowed:
+                        matched.extend(
+                            hotkey
+                            for hotkey, index in members
+                            if hotkey.index == index and hotkey not in dispatching
+                        )
+            if released:
+                # Read again, the lock may have been waited for.
+                released = self.waiting.get(event.scan_code, ())
+                seen = set(matched)
+                matched.extend(
+                    hotkey
+                    for hotkey in released
+                    if hotkey not in seen and hotkey not in dispatching
+                )
+            if not matched:
+                return None
+            if len(matched) > 1:
+                # Triggers go last, so they consume what the others just held.
+                matched.sort(key=lambda hotkey: hotkey.index == len(hotkey.steps) - 1)
+            # A dispatching hotkey is never matched again, so never twice here.
+            dispatching.update(matched)
+            try:
+                return all([self._advance(hotkey, event) for hotkey in matched])
+            finally:
+                dispatching.difference_update(matched)
+
+    def _advance(self, hotkey, event):
+        last_index = len(hotkey.steps) - 1
+        if not last_index:
+            return self.call_handler(hotkey.handler, event)
+
+        if hotkey.index < last_index:
+            self._hold(hotkey, event)
+            if event.event_type == KEY_UP:
+                self._set_index(hotkey, hotkey.index + 1)
+            return False
+
+        if event.event_type == hotkey.event_type:
+            if self.call_handler(hotkey.handler, event):
+                # Allowed, let everything through.
+                self._fail(hotkey)
+                return True
+        elif event.event_type == KEY_DOWN:
+            # Triggers on release.
+            self._hold(hotkey, event)
+            return False
+        # Triggered and suppressed, or the release after it. Reset once the
+        # key is up.
+        self._consume(hotkey, event)
+        if event.event_type == KEY_UP:
+            self._set_index(hotkey, 0)
+        return False
+
+
+def _call_handler(handler, event):
+    return handler(event)
+
+
+def _decrement(counter, key):
+    count = counter[key] - 1
+    if count > 0:
+        counter[key] = count
+    else:
+        del counter[key]
+
+
+def _discard(index, key, hotkey):
+    members = index[key]
+    del members[hotkey]
+    if not members:
+        del index[key]
@@ -8,15 +8,21 @@ KEY_DOWN = "down"
 KEY_UP = "up"
 
 
+
 class KeyboardEvent(object):
-    event_type = None
-    scan_code = None
-    name = None
-    time = None
-    device = None
-    device_name = None
-    modifiers = None
-    is_keypad = None
+    # No per-instance __dict__, events are created for every key press.
+    __slots__ = (
+        "event_type",
+        "scan_code",
+        "time",
+        "device",
+        "device_name",
+        "modifiers",
+        "is_keypad",
+        "synthetic",
+        "_name",
+        "_name_is_canonical",
+    )
 
     def __init__(
         self,
@@ -38,8 +44,22 @@ class KeyboardEvent(object):
         self.is_keypad = is_keypad
         self.modifiers = modifiers
         self.synthetic = synthetic
-        if name:
-            self.name = normalize_name(name)
+        # Normalized on first access, most events never have their name read.
+        self._name = name or None
+        self._name_is_canonical = not name
+
+    @property
+    def name(self):
+        if not self._name_is_canonical:
+            self._name = normalize_name(self._name)
+            self._name_is_canonical = True
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        # Assigned names were never normalized.
+        self._name = name
+        self._name_is_canonical = True
 
     def to_json(self, ensure_ascii=False):
         attrs = dict(
@@ -74,3 +94,36 @@ class KeyboardEvent(object):
             )
             and (not self.name or not other.name or self.name == other.name)
         )
+
+
+def canonical_event(
+    event_type,
+    scan_code,
+    name,
+    time,
+    device=None,
+    device_name=None,
+    modifiers=None,
+    is_keypad=None,
+    synthetic=False,
+    _new=object.__new__,
+    _cls=KeyboardEvent,
+):
+    """
+    Creates an event for a backend whose key names are already canonical, as
+    returned by `normalize_name`, skipping the normalization. A plain function
+    with its lookups bound as defaults, and best called with positional
+    arguments, so it costs less than the class call it replaces.
+    """
+    event = _new(_cls)
+    event.event_type = event_type
+    event.scan_code = scan_code
+    event.time = time
+    event.device = device
+    event.device_name = device_name
+    event.is_keypad = is_keypad
+    event.modifiers = modifiers
+    event.synthetic = synthetic
+    event._name = name or None
+    event._name_is_canonical = True
+    return event
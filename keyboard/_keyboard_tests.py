@@ -15,9 +15,18 @@ and added to `output_events` immediately, mimicking real functionality.
 
 import unittest
 import time
+import json
+import os
+import shutil
+import tempfile
+from queue import Queue
+from unittest import mock
 
 import keyboard
-from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
+from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP, canonical_event
+from ._write_plan import compile_plan
+from ._playback import Prefetcher as _Prefetcher, play_timed as _play_timed
+from ._recording import RecordedEvents as _RecordedEvents, SpillingRecorder as _SpillingRecorder
 
 dummy_keys = {
     "space": [(0, [])],
@@ -146,6 +155,17 @@ class TestKeyboard(unittest.TestCase):
 
         self.assertEqual(event, KeyboardEvent(**json.loads(event.to_json())))
 
+    def test_event_name_normalized_lazily(self):
+        event = KeyboardEvent(KEY_DOWN, 999, name="Left_Control")
+        self.assertFalse(hasattr(event, "__dict__"))
+        self.assertEqual(event.name, "left ctrl")
+        self.assertEqual(KeyboardEvent(KEY_DOWN, 999).name, None)
+        canonical = canonical_event(KEY_DOWN, 999, "left ctrl", 0)
+        self.assertEqual(canonical, event)
+        import pickle
+
+        self.assertEqual(pickle.loads(pickle.dumps(event)).name, "left ctrl")
+
     def test_is_modifier_name(self):
         for name in keyboard.all_modifiers:
             self.assertTrue(keyboard.is_modifier(name))
@@ -264,6 +284,27 @@ class TestKeyboard(unittest.TestCase):
     def test_parse_hotkey_list_names(self):
         self.assertEqual(keyboard.parse_hotkey(["a", "b", "c"]), (((1,), (2,), (3,)),))
 
+    def test_synthetic_events_only_update_state(self):
+        # A key already held when the reader starts.
+        held = KeyboardEvent(KEY_DOWN, 1, name="a", synthetic=True)
+        events = []
+        hotkeys = []
+        keyboard.hook(events.append)
+        keyboard.add_hotkey("a", lambda: hotkeys.append("a"), suppress=True)
+        keyboard.on_press_key("a", lambda e: hotkeys.append(e))
+        self.do([held], [held])
+        self.assertTrue(keyboard.is_pressed("a"))
+        self.assertEqual(events, [])
+        self.assertEqual(hotkeys, [])
+        self.assertEqual(keyboard._logically_pressed_keys, {})
+
+        self.do([KeyboardEvent(KEY_UP, 1, name="a", synthetic=True)])
+        self.assertFalse(keyboard.is_pressed("a"))
+        self.assertEqual(events, [])
+        self.do(d_a, [])
+        self.assertEqual(hotkeys[0], "a")
+        self.do(u_a)
+
     def test_is_pressed_none(self):
         self.assertFalse(keyboard.is_pressed("a"))
 
@@ -288,6 +329,18 @@ class TestKeyboard(unittest.TestCase):
         self.assertFalse(keyboard.is_pressed("a"))
         self.assertTrue(keyboard.is_pressed("b"))
 
+    def test_pressed_signature(self):
+        self.do(d_shift + d_a)
+        signature = keyboard._listener.pressed_signature
+        self.assertEqual(signature, frozenset([1, 5]))
+        self.do(d_a)
+        self.assertIs(keyboard._listener.pressed_signature, signature)
+        self.do(u_a + d_b)
+        self.assertEqual(keyboard._listener.pressed_signature, frozenset([2, 5]))
+        self.assertEqual(signature, frozenset([1, 5]))
+        self.do(u_shift + u_b + u_c)
+        self.assertEqual(keyboard._listener.pressed_signature, frozenset())
+
     def test_is_pressed_hotkey_true(self):
         self.do(d_shift + d_a)
         self.assertTrue(keyboard.is_pressed("shift+a"))
@@ -349,6 +402,64 @@ class TestKeyboard(unittest.TestCase):
         time.sleep(0.05)
         self.assertTrue(triggered)
 
+    def test_call_later_cancel(self):
+        triggered = []
+        timer = keyboard.call_later(triggered.append, (1,), 0.01)
+        timer.cancel()
+        keyboard.call_later(triggered.append, (2,), 0.02)
+        time.sleep(0.05)
+        self.assertEqual(triggered, [2])
+        stats = keyboard.timer_stats()
+        self.assertGreaterEqual(stats["fired"], 1)
+        self.assertGreaterEqual(stats["jitter"]["count"], 1)
+
+    def test_scheduler(self):
+        from ._scheduler import Scheduler
+
+        scheduler = Scheduler(coalesce=0)
+        calls = []
+        start = time.monotonic()
+        scheduler.call_at(start + 0.03, calls.append, ("c",))
+        scheduler.call_at(start + 0.01, calls.append, ("a",))
+        scheduler.call_at(start + 0.02, calls.append, ("b",))
+        # Replaced by the next one with the same key.
+        scheduler.call_at(start + 0.005, calls.append, ("old",), key="key")
+        scheduler.call_at(start + 0.015, calls.append, ("new",), key="key")
+        scheduler.call_at(start + 0.025, calls.append, ("cancelled",), key="other")
+        scheduler.cancel("other")
+        self.assertEqual(scheduler.stats()["pending"], 4)
+        time.sleep(0.08)
+        self.assertEqual(calls, ["a", "new", "b", "c"])
+        stats = scheduler.stats()
+        self.assertEqual((stats["scheduled"], stats["fired"], stats["pending"]), (6, 4, 0))
+        self.assertEqual(stats["jitter"]["count"], 4)
+        self.assertEqual(scheduler.keys, {})
+
+    def test_scheduler_coalesce(self):
+        from ._scheduler import Scheduler
+
+        scheduler = Scheduler(coalesce=0.05)
+        calls = []
+        start = time.monotonic()
+        scheduler.call_at(start + 0.01, lambda: calls.append(time.monotonic()))
+        scheduler.call_at(start + 0.04, lambda: calls.append(time.monotonic()))
+        time.sleep(0.03)
+        # Both ran on the first wake up.
+        self.assertEqual(len(calls), 2)
+
+    def test_scheduler_not_delayed_by_another(self):
+        from ._scheduler import Scheduler
+
+        shared, repeat = Scheduler(), Scheduler(name="repeat")
+        calls = []
+        start = time.monotonic()
+        shared.call_at(start, time.sleep, (0.1,))
+        repeat.call_at(start + 0.01, lambda: calls.append(time.monotonic()))
+        time.sleep(0.05)
+        self.assertEqual(len(calls), 1)
+        self.assertLess(calls[0] - start, 0.05)
+        self.assertEqual(repeat.thread.name, "repeat")
+
     def test_hook_nonblocking(self):
         self.i = 0
 
@@ -539,6 +650,79 @@ class TestKeyboard(unittest.TestCase):
         self.do([], d_a + u_a + d_b + u_b)
         self.assertGreater(time.time() - last_time, 0.015)
 
+    def test_compile_text(self):
+        keyboard._virtually_pressed_events.clear()
+        plan = keyboard.compile_text("Ab")
+        self.assertIs(keyboard.compile_text("Ab"), plan)
+        self.assertEqual(plan.text, "Ab")
+        self.assertEqual(
+            plan.steps,
+            (
+                (((5, True, False), (1, True, True), (1, False, True)), None),
+                (((5, False, False), (2, True, False), (2, False, False)), None),
+            ),
+        )
+        self.assertEqual(plan.final, ())
+        self.assertEqual(plan.modifiers, frozenset([5]))
+        with self.assertRaises(AttributeError):
+            plan.steps = ()
+
+        keyboard.write(plan, exact=False)
+        self.do([], d_shift + d_a + u_a + u_shift + d_b + u_b)
+        keyboard.write(plan, exact=True)
+        self.do(
+            [],
+            [
+                KeyboardEvent(event_type=KEY_DOWN, scan_code=999, name="A"),
+                KeyboardEvent(event_type=KEY_DOWN, scan_code=999, name="b"),
+            ],
+        )
+
+    def test_compile_plan_modifier_transitions(self):
+        keys = {
+            "q": [(16, [])],
+            "Q": [(16, ["shift"])],
+            "@": [(16, ["alt gr"])],
+            "Ω": [(16, ["shift", "alt gr"])],
+        }
+        modifier_codes = {"shift": 42, "alt gr": 100}
+        plan = compile_plan("@ΩQqΩ", keys.__getitem__, modifier_codes.__getitem__)
+        self.assertEqual(
+            [actions for actions, character in plan.steps],
+            [
+                ((100, True, False), (16, True, False), (16, False, False)),
+                ((42, True, False), (16, True, True), (16, False, True)),
+                ((100, False, False), (16, True, True), (16, False, True)),
+                ((42, False, False), (16, True, False), (16, False, False)),
+                ((42, True, False), (100, True, False), (16, True, True), (16, False, True)),
+            ],
+        )
+        # Released last pressed first.
+        self.assertEqual(plan.final, ((100, False, False), (42, False, False)))
+        self.assertEqual(plan.modifiers, frozenset([42, 100]))
+
+        plan = compile_plan("Ω\u2603", keys.__getitem__, modifier_codes.__getitem__)
+        self.assertEqual(plan.steps[1], (((100, False, False), (42, False, False)), "\u2603"))
+        self.assertEqual(plan.final, ())
+
+    def test_compile_text_layout_change(self):
+        plan = keyboard.compile_text("ab")
+        keyboard._layout_generation += 1
+        self.addCleanup(setattr, keyboard, "_layout_generation", keyboard._layout_generation)
+        self.assertIsNot(keyboard.compile_text("ab"), plan)
+        self.assertEqual(keyboard.compile_text("ab"), plan)
+
+    def test_compile_text_unicode_batched(self):
+        keyboard._virtually_pressed_events.clear()
+        batches = []
+        keyboard._os_keyboard.send_keys = lambda actions: batches.append(list(actions))
+        try:
+            keyboard.write("aáB", exact=False)
+        finally:
+            del keyboard._os_keyboard.send_keys
+        self.assertEqual(batches, [[(1, True), (1, False)], [(5, True), (2, True), (2, False), (5, False)]])
+        self.do([], [KeyboardEvent(event_type=KEY_DOWN, scan_code=999, name="á")])
+
     def test_write_unicode_explicit(self):
         keyboard.write("ab", exact=True)
         self.do(
@@ -556,6 +740,20 @@ class TestKeyboard(unittest.TestCase):
             [KeyboardEvent(event_type=KEY_DOWN, scan_code=999, name="á")] + d_b + u_b,
         )
 
+    def test_write_batched(self):
+        keyboard._virtually_pressed_events.clear()
+        batches = []
+        keyboard._os_keyboard.send_keys = lambda actions: batches.append(list(actions))
+        try:
+            keyboard.write("Ab", exact=False)
+        finally:
+            del keyboard._os_keyboard.send_keys
+        self.assertEqual(
+            batches,
+            [[(5, True), (1, True), (1, False), (5, False), (2, True), (2, False)]],
+        )
+        self.assertEqual(keyboard._virtually_pressed_events, set())
+
     def test_start_stop_recording(self):
         keyboard.start_recording()
         self.do(d_a + u_a)
@@ -597,6 +795,226 @@ class TestKeyboard(unittest.TestCase):
         self.do([], d_a + u_a)
         self.assertGreater(time.time() - last_time, 0.005)
 
+    def test_play_batched(self):
+        keyboard._virtually_pressed_events.clear()
+        batches = []
+        keyboard._os_keyboard.send_keys = lambda actions: batches.append(list(actions))
+        try:
+            events = [
+                make_event(KEY_DOWN, "a", 1, 100),
+                make_event(KEY_UP, "a", 1, 100.0001),
+                make_event(KEY_DOWN, "b", None, 100.02),
+            ]
+            timing = keyboard.play(events)
+        finally:
+            del keyboard._os_keyboard.send_keys
+        self.assertEqual(batches, [[(1, True), (1, False)], [(2, True)]])
+        self.assertEqual(keyboard._virtually_pressed_events, {2})
+        self.assertEqual(timing["count"], 3)
+        keyboard._virtually_pressed_events.clear()
+
+    def test_play_timed_groups(self):
+        sent = []
+        events = [make_event(KEY_DOWN, "a", 1, t) for t in (10, 10.0005, 10.03, 10.06)]
+        start = time.monotonic()
+        errors = _play_timed(events, 2, lambda group: sent.append((time.monotonic() - start, group)))
+        self.assertEqual([group for _, group in sent], [events[:2], events[2:3], events[3:]])
+        self.assertGreaterEqual(sent[1][0], 0.015)
+        self.assertGreaterEqual(sent[2][0], 0.03)
+        self.assertEqual(errors.summary()["count"], 4)
+
+    def test_play_timed_no_drift(self):
+        # Each send takes half the interval, which must not push the next
+        # events back.
+        events = [make_event(KEY_DOWN, "a", 1, i * 0.01) for i in range(10)]
+        start = time.monotonic()
+        _play_timed(events, 1, lambda group: time.sleep(0.005))
+        self.assertLess(time.monotonic() - start, 0.09 + 0.03)
+
+    def test_play_timed_fast(self):
+        sent = []
+        events = [make_event(KEY_DOWN, "a", 1, i) for i in range(100)]
+        start = time.monotonic()
+        errors = _play_timed(events, 0, sent.append, max_batch=64)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([len(group) for group in sent], [64, 36])
+        self.assertEqual(errors.summary()["count"], 0)
+
+    def test_play_timed_stream(self):
+        # Events yielded as they happen: the first one is sent without
+        # waiting for the second.
+        def source():
+            yield make_event(KEY_DOWN, "a", 1, 10)
+            time.sleep(0.2)
+            yield make_event(KEY_UP, "a", 1, 10.2)
+
+        sent = []
+        start = time.monotonic()
+        prefetcher = _Prefetcher(source())
+        _play_timed(prefetcher, 1, lambda group: sent.append((time.monotonic() - start, len(group))))
+        self.assertEqual([count for _, count in sent], [1, 1])
+        self.assertLess(sent[0][0], 0.1)
+        self.assertGreaterEqual(sent[1][0], 0.2)
+
+    def test_play_generator(self):
+        keyboard._virtually_pressed_events.clear()
+        lines = ['{"event_type": "down", "scan_code": 1, "time": 0}', '{"event_type": "up", "scan_code": null, "name": "a", "time": 0.001}']
+        keyboard.play(KeyboardEvent(**json.loads(line)) for line in lines)
+        self.do([], d_a + u_a)
+
+    def test_prefetcher(self):
+        prefetcher = _Prefetcher(iter(range(1000)), lambda i: i * 2, size=128, chunk=16)
+        self.assertEqual(list(prefetcher), [i * 2 for i in range(1000)])
+        self.assertEqual(list(prefetcher), [])
+
+    def test_prefetcher_error(self):
+        def source():
+            yield 1
+            yield 2
+            raise ValueError("bad line")
+
+        items = []
+        with self.assertRaises(ValueError):
+            for item in _Prefetcher(source()):
+                items.append(item)
+        self.assertEqual(items, [1, 2])
+
+    def test_prefetcher_bounded(self):
+        produced = []
+
+        def source():
+            for i in range(10000):
+                produced.append(i)
+                yield i
+
+        prefetcher = _Prefetcher(source(), size=64, chunk=8)
+        iterator = iter(prefetcher)
+        self.assertEqual(next(iterator), 0)
+        time.sleep(0.05)
+        # The chunks queued, the one being filled and the one handed out.
+        self.assertLessEqual(len(produced), 64 + 8 + 8 + 1)
+        prefetcher.close()
+        prefetcher.thread.join(1)
+        self.assertFalse(prefetcher.thread.is_alive())
+
+    def _save_recording(self, events):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "recording.kbr")
+        self.assertEqual(keyboard.save_recording(events, path), len(events))
+        return path
+
+    def test_recording_round_trip(self):
+        events = [
+            KeyboardEvent(KEY_DOWN, 1, "a", 1000.5, "/dev/input/event3", "AT keyboard", ("shift",), False),
+            KeyboardEvent(KEY_UP, 1, "a", 1000.512345, "/dev/input/event3", "AT keyboard", (), True),
+            KeyboardEvent(KEY_DOWN, None, "á", 1000.6, synthetic=True),
+            KeyboardEvent(KEY_UP, -5, None, 999.0, "synthetic"),
+            KeyboardEvent(KEY_DOWN, 2, "b", 999.0 + 2**32 / 1e6 + 1),
+        ]
+        path = self._save_recording(events)
+        self.assertEqual(os.path.getsize(path) % 16, 0)
+        with keyboard.load_recording(path) as recording:
+            loaded = list(recording)
+        fields = ("event_type", "scan_code", "name", "device", "device_name", "modifiers", "is_keypad", "synthetic")
+        for event, copy in zip(events, loaded):
+            for field in fields:
+                self.assertEqual(getattr(copy, field), getattr(event, field), field)
+            self.assertAlmostEqual(copy.time, event.time, places=6)
+        self.assertEqual(len(loaded), len(events))
+
+    def test_recording_non_string_fields(self):
+        # X11 events have a set of key codes as modifiers.
+        events = [KeyboardEvent(KEY_DOWN, 38, "a", 100, 3, "keyboard", {50, 64})]
+        path = self._save_recording(events)
+        with keyboard.load_recording(path) as recording:
+            (copy,) = list(recording)
+        self.assertEqual(copy.modifiers, ("50", "64"))
+        self.assertEqual(copy.device, "3")
+
+    def test_recording_filter(self):
+        events = [make_event(KEY_DOWN if i % 2 == 0 else KEY_UP, "a", 1 + i % 3, 100 + i * 0.1) for i in range(10)]
+        path = self._save_recording(events)
+        with keyboard.load_recording(path) as recording:
+            self.assertEqual([e.time for e in recording.events(start=100.3, end=100.6)], [100.3, 100.4, 100.5])
+            self.assertEqual(len(list(recording.events(event_type=KEY_UP))), 5)
+            self.assertEqual([e.scan_code for e in recording.events(scan_codes=[2])], [2, 2, 2])
+
+    def test_recording_truncated(self):
+        path = self._save_recording([make_event(KEY_DOWN, "a", 1, 100), make_event(KEY_UP, "a", 1, 101)])
+        with open(path, "rb+") as file:
+            file.truncate(os.path.getsize(path) - 3)
+        with keyboard.load_recording(path) as recording:
+            self.assertEqual([e.event_type for e in recording], [KEY_DOWN])
+
+    def test_recording_invalid(self):
+        path = self._save_recording([])
+        with open(path, "wb") as file:
+            file.write(b'{"event_type": "down"}\n')
+        with self.assertRaises(ValueError):
+            keyboard.load_recording(path)
+
+    def test_start_recording_spill(self):
+        path = self._save_recording([])
+        keyboard.start_recording(spill_path=path, window=2)
+        self.do(d_a + u_a + d_b + u_b + d_c)
+        events = keyboard.stop_recording()
+        self.assertIsInstance(events, _RecordedEvents)
+        self.assertEqual(len(events), 5)
+        self.assertEqual(list(events), d_a + u_a + d_b + u_b + d_c)
+        self.assertEqual(events.spilled, 3)
+        self.assertEqual(events[0], d_a[0])
+        self.assertEqual(events[-1], d_c[0])
+        self.assertEqual(events[1:4], u_a + d_b + u_b)
+        self.assertEqual(events[::-2], d_c + d_b + d_a)
+        self.assertEqual(events[4:1], [])
+        events.close()
+
+    def test_start_recording_spill_and_queue(self):
+        path = self._save_recording([])
+        with self.assertRaises(ValueError):
+            keyboard.start_recording(Queue(), spill_path=path)
+
+    def test_spilling_recorder_index(self):
+        path = self._save_recording([])
+        recorder = _SpillingRecorder(path, window=100)
+        for i in range(3000):
+            recorder.put(KeyboardEvent(KEY_DOWN, i, "a", 100 + i * 0.001))
+        events = recorder.stop()
+        self.assertEqual(len(events), 3000)
+        self.assertEqual(len(events.checkpoints), 3)
+        for i in (0, 1023, 1024, 2047, 2899, 2900, 2999, -1):
+            self.assertEqual(events[i].scan_code, i % 3000)
+            self.assertAlmostEqual(events[i].time, 100 + (i % 3000) * 0.001, places=6)
+        self.assertEqual([e.scan_code for e in events], list(range(3000)))
+        with self.assertRaises(IndexError):
+            events[3000]
+        with events:
+            self.assertEqual([e.scan_code for e in events[1000:2950:7]], list(range(1000, 2950, 7)))
+            self.assertIsNotNone(events._reader)
+        self.assertIsNone(events._reader)
+
+    def test_spilling_recorder_write_error(self):
+        path = self._save_recording([])
+        recorder = _SpillingRecorder(path, window=1)
+        recorder.put(d_a[0])
+        original = recorder.writer.write
+        recorder.writer.write = mock.Mock(side_effect=OSError("disk full"))
+        with self.assertRaises(OSError):
+            recorder.put(u_a[0])
+        recorder.writer.write = original
+        recorder.put(d_b[0])
+        with recorder.stop() as events:
+            self.assertEqual(list(events), d_a + u_a + d_b)
+            self.assertEqual(len(events.checkpoints), 1)
+
+    def test_play_recording(self):
+        keyboard._virtually_pressed_events.clear()
+        path = self._save_recording(d_a + u_a)
+        with keyboard.load_recording(path) as recording:
+            keyboard.play(recording, 0)
+        self.do([], d_a + u_a)
+
     def test_get_typed_strings_simple(self):
         events = (
             du_a
@@ -789,33 +1207,40 @@ class TestKeyboard(unittest.TestCase):
 
     def test_remove_hotkey_internal(self):
         remove = keyboard.add_hotkey("shift+a", trigger, suppress=True)
-        self.assertTrue(all(keyboard._listener.blocking_hotkeys.values()))
+        self.assertEqual(
+            keyboard._listener.blocking_hotkeys.awaited(), {((5, 6), (1,))}
+        )
         self.assertTrue(all(keyboard._listener.filtered_modifiers.values()))
         self.assertNotEqual(keyboard._hotkeys, {})
         remove()
         self.assertTrue(not any(keyboard._listener.filtered_modifiers.values()))
-        self.assertTrue(not any(keyboard._listener.blocking_hotkeys.values()))
+        self.assertFalse(keyboard._listener.blocking_hotkeys)
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), set())
         self.assertEqual(keyboard._hotkeys, {})
 
     def test_remove_hotkey_internal_multistep_start(self):
         remove = keyboard.add_hotkey("shift+a, b", trigger, suppress=True)
-        self.assertTrue(all(keyboard._listener.blocking_hotkeys.values()))
+        self.assertEqual(
+            keyboard._listener.blocking_hotkeys.awaited(), {((5, 6), (1,))}
+        )
         self.assertTrue(all(keyboard._listener.filtered_modifiers.values()))
         self.assertNotEqual(keyboard._hotkeys, {})
         remove()
         self.assertTrue(not any(keyboard._listener.filtered_modifiers.values()))
-        self.assertTrue(not any(keyboard._listener.blocking_hotkeys.values()))
+        self.assertFalse(keyboard._listener.blocking_hotkeys)
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), set())
         self.assertEqual(keyboard._hotkeys, {})
 
     def test_remove_hotkey_internal_multistep_end(self):
         remove = keyboard.add_hotkey("shift+a, b", trigger, suppress=True)
         self.do(d_shift + du_a + u_shift)
-        self.assertTrue(any(keyboard._listener.blocking_hotkeys.values()))
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), {((2,),)})
         self.assertTrue(not any(keyboard._listener.filtered_modifiers.values()))
         self.assertNotEqual(keyboard._hotkeys, {})
         remove()
         self.assertTrue(not any(keyboard._listener.filtered_modifiers.values()))
-        self.assertTrue(not any(keyboard._listener.blocking_hotkeys.values()))
+        self.assertFalse(keyboard._listener.blocking_hotkeys)
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), set())
         self.assertEqual(keyboard._hotkeys, {})
 
     def test_add_hotkey_single_step_suppress_with_modifiers(self):
@@ -877,6 +1302,43 @@ class TestKeyboard(unittest.TestCase):
             d_ctrl + d_shift + du_a + u_shift + u_ctrl,
         )
 
+    def test_add_hotkey_sided_modifier(self):
+        keyboard.add_hotkey("left shift+a", lambda: True, suppress=True)
+        matcher = keyboard._listener.blocking_hotkeys
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 6])), None)
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 5])), True)
+
+    def test_add_hotkey_after_keymap_change(self):
+        keyboard.add_hotkey("shift+a", lambda: True, suppress=True)
+        matcher = keyboard._listener.blocking_hotkeys
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 6])), True)
+        # Scan code 6 becomes "b", and "right shift" moves to 13.
+        moved = {"right shift": [(13, [])], "b": [(6, [])]}
+        d_b_moved = make_event(KEY_DOWN, "b", 6)
+        try:
+            with mock.patch.dict(dummy_keys, moved):
+                keyboard.invalidate_keymap_cache()
+                self.assertEqual(keyboard._key_id(6), 6)
+                self.assertEqual(keyboard._key_id(13), "shift")
+                keyboard.add_hotkey("shift+b", lambda: True, suppress=True)
+                self.assertEqual(matcher.match(d_b_moved, frozenset([5, 6])), True)
+        finally:
+            keyboard.invalidate_keymap_cache()
+        self.assertEqual(keyboard._key_id(6), "shift")
+
+    def test_add_hotkey_modifier_both_sides(self):
+        keyboard.add_hotkey("shift+a", lambda: True, suppress=True)
+        matcher = keyboard._listener.blocking_hotkeys
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 5, 6])), None)
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 6])), True)
+        self.assertEqual(matcher.match(d_a[0], frozenset([1, 5])), True)
+
+    def test_add_hotkey_single_entry_per_step(self):
+        remove = keyboard.add_hotkey("shift+ctrl+a, shift+b", trigger, suppress=True)
+        self.assertEqual(len(keyboard._listener.blocking_hotkeys.transitions), 2)
+        remove()
+        self.assertEqual(keyboard._listener.blocking_hotkeys.transitions, {})
+
     def test_add_hotkey_single_step_timeout(self):
         keyboard.add_hotkey("a", trigger, timeout=1, suppress=True)
         self.do(du_a, triggered_event)
@@ -1017,8 +1479,7 @@ class TestKeyboard(unittest.TestCase):
     def test_add_hotkey_multistep_suppress_incomplete(self):
         keyboard.add_hotkey("a, b", trigger, suppress=True)
         self.do(du_a, [])
-        self.assertEqual(keyboard._listener.blocking_hotkeys[(1,)], [])
-        self.assertEqual(len(keyboard._listener.blocking_hotkeys[(2,)]), 1)
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), {((2,),)})
 
     def test_add_hotkey_multistep_suppress_incomplete(self):
         keyboard.add_hotkey("a, b", trigger, suppress=True)
@@ -1043,8 +1504,7 @@ class TestKeyboard(unittest.TestCase):
     def test_add_hotkey_multistep_suppress_repeated_key(self):
         keyboard.add_hotkey("a, b", trigger, suppress=True)
         self.do(du_a + du_a + du_b, du_a + triggered_event)
-        self.assertEqual(keyboard._listener.blocking_hotkeys[(2,)], [])
-        self.assertEqual(len(keyboard._listener.blocking_hotkeys[(1,)]), 1)
+        self.assertEqual(keyboard._listener.blocking_hotkeys.awaited(), {((1,),)})
 
     def test_add_hotkey_multi_step_suppress_regression_1(self):
         keyboard.add_hotkey("a, b", trigger, suppress=True)
@@ -1056,6 +1516,38 @@ class TestKeyboard(unittest.TestCase):
             du_a + du_b + du_a + du_b + du_space, du_a + du_b + du_a + du_b + du_space
         )
 
+    def test_add_hotkey_multistep_suppress_shared_prefix(self):
+        keyboard.add_hotkey("a, b", trigger, suppress=True)
+        keyboard.add_hotkey("a, c", trigger, suppress=True)
+        self.do(du_a + du_c, triggered_event)
+        self.do(du_a + du_space, du_a + du_space)
+
+    def test_add_hotkey_multistep_suppress_longer_sequence(self):
+        keyboard.add_hotkey("a, b", trigger, suppress=True)
+        keyboard.add_hotkey("a, b, c", trigger, suppress=True)
+        self.do(du_a + du_b + du_space, triggered_event + du_space)
+
+    def test_add_hotkey_multistep_many_pending(self):
+        for name in ["a", "b", "c"] * 10:
+            keyboard.add_hotkey("space, " + name, trigger, suppress=True)
+        self.do(du_space + du_b, triggered_event * 10)
+        matcher = keyboard._listener.blocking_hotkeys
+        self.assertEqual(len(matcher.pending), 0)
+        self.assertEqual(matcher.held, {})
+        self.assertEqual(matcher.waiting, {})
+        self.assertEqual(matcher.awaiting, {})
+        self.assertEqual(matcher.allowing, {})
+
+    def test_add_hotkey_callback_events_matched(self):
+        # Keys sent by a blocking hotkey's callback, here on the same thread,
+        # still match the other hotkeys.
+        queue = keyboard._queue.Queue()
+        keyboard.add_hotkey("a", lambda: keyboard.send("b"), suppress=True)
+        keyboard.add_hotkey("a+b", lambda: queue.put("a+b"), suppress=True)
+        self.do(d_a, [])
+        self.assertEqual(queue.get(timeout=0.5), "a+b")
+        self.do(u_a)
+
     def test_add_word_listener_success(self):
         queue = keyboard._queue.Queue()
 
@@ -1129,6 +1621,339 @@ class TestKeyboard(unittest.TestCase):
     #    keyboard.add_abbreviation('abc', 'aaa')
     #    self.do(du_a+du_b+du_c+du_space, [])
 
+    def test_latency_stats(self):
+        self.assertEqual(keyboard.stats(), {})
+        keyboard.enable_latency_stats()
+        self.addCleanup(keyboard.disable_latency_stats)
+        old = time.time() - 0.01
+        self.do([make_event(KEY_DOWN, "a", time=old), make_event(KEY_UP, "a", time=old)])
+        stats = keyboard.stats()
+        self.assertEqual(
+            sorted(stats), ["direct_callback", "handlers", "listen", "process"]
+        )
+        for stage in stats.values():
+            self.assertEqual(stage["count"], 2)
+        # Events 10ms old, with some slack for the buckets.
+        self.assertGreaterEqual(stats["listen"]["p50"], 5000)
+        self.assertGreaterEqual(stats["process"]["max"], 10000)
+        self.assertLess(stats["direct_callback"]["mean"], 10000)
+
+        keyboard.disable_latency_stats()
+        self.do(du_a)
+        self.assertEqual(keyboard.stats()["listen"]["count"], 2)
+
+    def test_latency_histogram(self):
+        from ._latency import Histogram
+
+        histogram = Histogram()
+        for ns in [0, 1000, 1000, 3000, -5] + [100000] * 6:
+            histogram.record(ns)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 11)
+        self.assertEqual(summary["max"], 100.0)
+        self.assertAlmostEqual(summary["mean"], 605000 / 11 / 1e3)
+        # Upper bounds of the buckets, never above the maximum.
+        self.assertEqual(summary["p50"], 100.0)
+        self.assertEqual(histogram.percentile(0.3), 1023)
+        self.assertEqual(histogram.percentile(0.1), 0)
+        histogram.clear()
+        self.assertEqual(histogram.summary()["count"], 0)
+
+    def test_handler_profiling(self):
+        self.assertEqual(keyboard.handler_profile(), [])
+        slow_calls = []
+        keyboard.enable_handler_profiling(
+            budget=0.002, on_slow=lambda name, seconds: slow_calls.append((name, seconds))
+        )
+        self.addCleanup(keyboard.disable_handler_profiling)
+
+        def slow_hook(event):
+            time.sleep(0.005)
+
+        def fast_callback(event):
+            pass
+
+        keyboard.hook(slow_hook)
+        keyboard.on_press(fast_callback)
+        self.do(du_a)
+
+        slow, fast = keyboard.handler_profile()
+        self.assertIn("slow_hook", slow["name"])
+        self.assertIn(__file__.rstrip("c"), slow["name"])
+        self.assertEqual(slow["calls"], 2)
+        self.assertEqual(slow["slow"], 2)
+        self.assertGreaterEqual(slow["max"], 0.005)
+        self.assertGreaterEqual(slow["total"], 0.01)
+        # Named after the callback, not the wrapper of on_press.
+        self.assertIn("fast_callback", fast["name"])
+        self.assertEqual(fast["calls"], 2)
+        self.assertEqual(fast["slow"], 0)
+        self.assertEqual([name for name, seconds in slow_calls], [slow["name"]] * 2)
+
+        self.assertEqual(keyboard.handler_profile(1, sort_by="calls")[0]["calls"], 2)
+        # Removed handlers are dropped from the profile.
+        keyboard.unhook(slow_hook)
+        self.assertEqual([row["name"] for row in keyboard.handler_profile()], [fast["name"]])
+
+        keyboard.disable_handler_profiling()
+        self.do(du_a)
+        self.assertEqual(keyboard.handler_profile()[0]["calls"], 2)
+
+    def test_handler_profiling_hotkeys_and_key_hooks(self):
+        keyboard.enable_handler_profiling(budget=None)
+        self.addCleanup(keyboard.disable_handler_profiling)
+        queue = keyboard._queue.Queue()
+
+        def blocking_hotkey():
+            pass
+
+        def key_hook(event):
+            queue.put(event.name)
+
+        def blocking_key_hook(event):
+            return True
+
+        remove = keyboard.add_hotkey("a", blocking_hotkey, suppress=True)
+        keyboard.on_press_key("b", key_hook)
+        keyboard.hook_key("b", blocking_key_hook, suppress=True)
+        self.do(d_a, [])
+        self.do(du_b, du_b)
+        self.assertEqual(queue.get(timeout=0.5), "b")
+
+        calls = dict((row["name"].split(" ")[0].rsplit(".", 1)[-1], row["calls"])
+                     for row in keyboard.handler_profile())
+        self.assertEqual(calls.get("blocking_hotkey"), 1)
+        self.assertEqual(calls.get("key_hook"), 2)
+        self.assertEqual(calls.get("blocking_key_hook"), 2)
+
+        remove()
+        names = [row["name"] for row in keyboard.handler_profile()]
+        self.assertFalse(any("blocking_hotkey" in name for name in names))
+        self.do(u_a)
+
+    def run_async(self, coroutine_function):
+        import asyncio
+
+        return asyncio.run(asyncio.wait_for(coroutine_function(), 1))
+
+    def test_events_async(self):
+        import asyncio
+
+        async def consume():
+            iterators = [keyboard.events() for _ in range(100)]
+            downs = keyboard.events(lambda e: e.event_type == KEY_DOWN)
+            reads = [
+                asyncio.ensure_future(iterator.__anext__())
+                for iterator in iterators + [downs]
+            ]
+            await asyncio.sleep(0)
+            # One hook for all of them.
+            self.assertEqual(len(keyboard._listener.handlers), 1)
+            self.do(du_a + du_b, du_a + du_b)
+            results = await asyncio.gather(*reads)
+            self.assertEqual(results, [d_a[0]] * 101)
+            self.assertEqual(await iterators[0].__anext__(), u_a[0])
+            self.assertEqual(await downs.__anext__(), d_b[0])
+            for iterator in iterators + [downs]:
+                await iterator.aclose()
+            self.assertEqual(keyboard._listener.handlers, [])
+
+        self.run_async(consume)
+
+    def test_events_async_bounded(self):
+        async def consume():
+            import asyncio
+
+            iterator = keyboard.events(maxsize=2)
+            first = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.sleep(0)
+            self.do(du_a + du_b)
+            # The oldest events were dropped.
+            self.assertEqual(await first, d_b[0])
+            self.assertEqual(await iterator.__anext__(), u_b[0])
+            await iterator.aclose()
+
+        self.run_async(consume)
+
+    def test_wait_async(self):
+        import asyncio
+
+        async def wait():
+            waiters = [
+                asyncio.ensure_future(keyboard.wait_async("a", suppress=True))
+                for _ in range(100)
+            ]
+            await asyncio.sleep(0)
+            self.assertEqual(len(keyboard._listener.blocking_hotkeys), 1)
+            self.do(d_b + d_a, d_b + d_a)
+            self.do(u_a + u_b)
+            self.assertFalse(any(waiter.done() for waiter in waiters))
+            self.do(d_a, [])
+            await asyncio.gather(*waiters)
+            await asyncio.sleep(0)
+            self.assertEqual(len(keyboard._listener.blocking_hotkeys), 0)
+            self.do(u_a)
+
+        self.run_async(wait)
+
+    def test_wait_async_cancel(self):
+        import asyncio
+
+        async def wait():
+            waiter = asyncio.ensure_future(keyboard.wait_async("a"))
+            forever = asyncio.ensure_future(keyboard.wait_async())
+            await asyncio.sleep(0)
+            self.assertEqual(len(keyboard._listener.nonblocking_hotkeys), 1)
+            waiter.cancel()
+            forever.cancel()
+            await asyncio.sleep(0)
+            self.assertTrue(forever.cancelled())
+            self.assertEqual(len(keyboard._listener.nonblocking_hotkeys), 0)
+
+        self.run_async(wait)
+
+    def test_read_event_async(self):
+        import asyncio
+
+        async def read():
+            key = asyncio.ensure_future(keyboard.read_key_async())
+            await asyncio.sleep(0)
+            self.do(du_a, du_a)
+            self.assertEqual(await key, "a")
+            self.assertEqual(keyboard._listener.handlers, [])
+
+            suppressed = asyncio.ensure_future(keyboard.read_event_async(suppress=True))
+            await asyncio.sleep(0)
+            self.do(d_b, [])
+            self.assertEqual(await suppressed, d_b[0])
+            self.do(u_b, u_b)
+
+        self.run_async(read)
+
+    def test_read_event_async_batch(self):
+        import asyncio
+
+        async def read():
+            event = asyncio.ensure_future(keyboard.read_event_async())
+            await asyncio.sleep(0)
+            # Both events reach the loop in the same flush.
+            self.do(du_a, du_a)
+            self.assertEqual(await event, d_a[0])
+            self.assertEqual(keyboard._listener.handlers, [])
+
+        self.run_async(read)
+
+    def test_read_hotkey_async(self):
+        import asyncio
+
+        async def read():
+            hotkey = asyncio.ensure_future(keyboard.read_hotkey_async())
+            await asyncio.sleep(0)
+            self.do(d_ctrl + d_a + d_b + u_ctrl)
+            self.assertEqual(await hotkey, "ctrl+a+b")
+
+        self.run_async(read)
+
+    def test_callback_executor_hotkey(self):
+        keyboard.start_callback_executor()
+        self.addCleanup(keyboard.stop_callback_executor)
+        release = keyboard._UninterruptibleEvent()
+        queue = keyboard._queue.Queue()
+        keyboard.add_hotkey(
+            "a", lambda: release.wait(1) and queue.put(1), suppress=True
+        )
+        # Suppressed and followed by other events while the callback runs.
+        self.do(d_a, [])
+        self.do(du_b, du_b)
+        release.set()
+        self.assertEqual(queue.get(timeout=0.5), 1)
+        keyboard.stop_callback_executor()
+        self.assertEqual(keyboard.callback_stats(), None)
+
+    def test_callback_executor_on_press_key(self):
+        keyboard.start_callback_executor()
+        self.addCleanup(keyboard.stop_callback_executor)
+        queue = keyboard._queue.Queue()
+        keyboard.on_press_key("a", lambda e: queue.put(e.name))
+        self.do(du_a + du_a, du_a + du_a)
+        self.assertEqual([queue.get(timeout=0.5), queue.get(timeout=0.5)], ["a", "a"])
+        keyboard.stop_callback_executor()
+        self.assertTrue(queue.empty())
+
+    def test_callback_executor_stop_from_callback(self):
+        keyboard.start_callback_executor()
+        self.addCleanup(keyboard.stop_callback_executor)
+        queue = keyboard._queue.Queue()
+
+        def stop():
+            try:
+                keyboard.stop_callback_executor()
+            except Exception as e:
+                queue.put(e)
+            else:
+                queue.put(None)
+
+        keyboard.add_hotkey("a", stop, suppress=True)
+        self.do(d_a, [])
+        self.assertEqual(queue.get(timeout=0.5), None)
+        self.assertEqual(keyboard.callback_stats(), None)
+
+    def test_callback_executor_ordering(self):
+        from ._callback_executor import CallbackExecutor
+
+        executor = CallbackExecutor(max_workers=4, max_pending=100)
+        calls = []
+        for i in range(50):
+            executor.submit("key", calls.append, (i,))
+        executor.shutdown()
+        self.assertEqual(calls, list(range(50)))
+        stats = executor.stats()
+        self.assertEqual(stats["submitted"], 50)
+        self.assertEqual(stats["completed"], 50)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_callback_executor_drop(self):
+        from ._callback_executor import CallbackExecutor
+
+        executor = CallbackExecutor(max_pending=2, overflow="drop")
+        release = keyboard._UninterruptibleEvent()
+        calls = []
+        executor.submit("key", release.wait)
+        results = [executor.submit("key", calls.append, (i,)) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(executor.stats()["queue_depth"], 2)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(calls, [0, 1])
+        self.assertEqual(executor.stats()["dropped"], 2)
+        self.assertEqual(executor.stats()["max_queue_depth"], 2)
+
+    def test_callback_executor_coalesce(self):
+        from ._callback_executor import CallbackExecutor
+
+        executor = CallbackExecutor(max_pending=1, overflow="coalesce")
+        release = keyboard._UninterruptibleEvent()
+        calls = []
+        executor.submit("key", release.wait)
+        for i in range(4):
+            executor.submit("key", calls.append, (i,))
+        # Other keys are not held back.
+        executor.submit("other", calls.append, ("other",))
+        for _ in range(50):
+            if calls:
+                break
+            time.sleep(0.01)
+        self.assertEqual(calls, ["other"])
+        release.set()
+        executor.shutdown()
+        self.assertEqual(calls, ["other", 3])
+        self.assertEqual(executor.stats()["coalesced"], 3)
+
+    def test_callback_executor_invalid_overflow(self):
+        with self.assertRaises(ValueError):
+            keyboard.start_callback_executor(overflow="block")
+        self.assertEqual(keyboard.callback_stats(), None)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Latency histograms of the stages events go through, from the kernel to the
+handlers. Each stage is a log2 histogram of nanoseconds, counted in a plain
+array of integers so the reader process can fill its own in shared memory.
+
+Stages measured "since the event" compare the event's timestamp with the
+clock of the moment, so clock changes throw off the samples taken while they
+happen. See `LatencyStats` for the stages.
+"""
+from time import perf_counter_ns, time_ns
+
+# Bucket i counts durations of i bits, up to 2**i - 1 ns. The last one
+# collects everything above 2**46 ns, about 19 hours.
+N_BUCKETS = 48
+COUNT = N_BUCKETS
+TOTAL = N_BUCKETS + 1
+MAX = N_BUCKETS + 2
+SIZE = N_BUCKETS + 3
+
+
+class Histogram(object):
+    """
+    Durations in nanoseconds, counted in `counts`, a mutable sequence of
+    `SIZE` integers. Only one thread must record at a time.
+    """
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts=None):
+        self.counts = [0] * SIZE if counts is None else counts
+
+    def record(self, ns):
+        counts = self.counts
+        if ns < 0:
+            ns = 0
+        bucket = ns.bit_length()
+        counts[bucket if bucket < N_BUCKETS else N_BUCKETS - 1] += 1
+        counts[COUNT] += 1
+        counts[TOTAL] += ns
+        if ns > counts[MAX]:
+            counts[MAX] = ns
+
+    def clear(self):
+        counts = self.counts
+        for i in range(SIZE):
+            counts[i] = 0
+
+    def percentile(self, fraction):
+        """
+        Returns, in nanoseconds, the upper bound of the bucket holding the
+        given fraction of the samples, so up to twice the exact value.
+        """
+        counts = self.counts
+        target = fraction * counts[COUNT]
+        seen = 0
+        for bucket in range(N_BUCKETS):
+            seen += counts[bucket]
+            if seen and seen >= target:
+                return min((1 << bucket) - 1, counts[MAX])
+        return counts[MAX]
+
+    def summary(self):
+        """
+        Returns the number of samples and their mean, maximum and
+        approximate 50th, 90th and 99th percentiles, in microseconds.
+        """
+        counts = self.counts
+        count = counts[COUNT]
+        return {
+            "count": count,
+            "mean": counts[TOTAL] / count / 1e3 if count else 0.0,
+            "max": counts[MAX] / 1e3,
+            "p50": self.percentile(0.5) / 1e3,
+            "p90": self.percentile(0.9) / 1e3,
+            "p99": self.percentile(0.99) / 1e3,
+        }
+
+
+class LatencyStats(object):
+    """
+    Histograms of the stages measured in this process:
+
+    - "listen": from the event to the listener receiving it.
+    - "direct_callback": time spent deciding whether to suppress it, in hooks
+    and hotkeys with `suppress=True`.
+    - "process": from the event to the processing thread picking it up.
+    - "handlers": time spent in the other hooks and hotkeys.
+
+    The backend may add its own, such as "read" for the kernel handing the
+    event to the Linux reader.
+    """
+
+    STAGES = ("listen", "direct_callback", "process", "handlers")
+
+    def __init__(self):
+        self.histograms = {stage: Histogram() for stage in self.STAGES}
+        self.listen = self.histograms["listen"]
+        self.direct_callback = self.histograms["direct_callback"]
+        self.process = self.histograms["process"]
+        self.handlers = self.histograms["handlers"]
+
+    def time_direct_callback(self, direct_callback, event):
+        start = perf_counter_ns()
+        self.listen.record(time_ns() - int(event.time * 1e9))
+        try:
+            return direct_callback(event)
+        finally:
+            self.direct_callback.record(perf_counter_ns() - start)
+
+    def time_handlers(self, process_event, event):
+        start = perf_counter_ns()
+        self.process.record(time_ns() - int(event.time * 1e9))
+        try:
+            return process_event(event)
+        finally:
+            self.handlers.record(perf_counter_ns() - start)
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class LinuxEventTransports(Enum):
+    QUEUE = "queue"
+    SHARED_MEMORY = "shared_memory"
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class LinuxReaderModes(Enum):
+    PROCESS = "process"
+    THREAD = "thread"
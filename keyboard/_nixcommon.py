@@ -3,22 +3,45 @@ import re
 import struct
 from io import BufferedWriter
 import os
+import errno
 import fcntl
 import signal
 import atexit
-from ._nixlibudev import set_up_libudev, create_udev_monitor, monitor_on_add
-from time import time as now
-from time import sleep
-from threading import Thread
+from collections import deque
+import select
+from ._linux_event_transports import LinuxEventTransports
+from ._linux_reader_modes import LinuxReaderModes
+from ._nixlibudev import set_up_libudev, create_udev_monitor, receive_added_devnode
+from time import time as now, monotonic_ns
 from glob import glob
-from multiprocessing import Queue, Process
+from threading import Thread
+from queue import Queue as ThreadQueue
+from multiprocessing import Queue, Process, Pipe
+from multiprocessing.sharedctypes import RawArray
+from ctypes import c_ulonglong
+from . import _latency
 
 # EVIOCGRAB ioctl: grab/release exclusive access to evdev device
 # Argument: 1 to grab, 0 to release
 EVIOCGRAB = 0x40044590
 
+# EVIOCGKEY ioctl: read the bitmap of keys currently held on the device,
+# sized for KEY_MAX (0x2ff) keys.
+KEY_STATE_SIZE = (0x2ff + 7) // 8
+EVIOCGKEY = 0x80004518 | (KEY_STATE_SIZE << 16)
+
+# EVIOCSCLOCKID ioctl: set the clock of the event timestamps.
+EVIOCSCLOCKID = 0x400445A0
+CLOCK_REALTIME = 0
+CLOCK_MONOTONIC = 1
+
 # l = long, H = unsigned short,I = unsigned int
 event_bin_format = "llHHI"
+event_struct = struct.Struct(event_bin_format)
+EVENT_SIZE = event_struct.size
+
+# Upper bound on how many events are pulled from a device in a single read.
+MAX_EVENTS_PER_READ = 64
 
 
 # Taken from include/linux/input.h
@@ -35,6 +58,12 @@ EV_ABS = 0x03
 # miscellanesus event
 EV_MSC = 0x04
 
+# codes for EV_SYN, marks the end of a frame of events
+SYN_REPORT = 0x00
+# the kernel's buffer overflowed and events were lost. We also use it as marker
+# in front of synthetic corrective events, with the number of them as value.
+SYN_DROPPED = 0x03
+
 
 try:
     _lib_udev = set_up_libudev()
@@ -56,12 +85,37 @@ def make_uinput(name: str):
     return uinput
 
 
+def key_codes_from_bitmap(bitmap):
+    """Returns the set of key codes whose bit is set in an EVIOCGKEY bitmap."""
+    bits = int.from_bytes(bitmap, "little")
+    codes = set()
+    while bits:
+        low_bit = bits & -bits
+        codes.add(low_bit.bit_length() - 1)
+        bits ^= low_bit
+    return codes
+
+
 class EventDevice(object):
     def __init__(self, path):
         self.path = path
         self._input_file = None
         self._output_file = None
         self._sysfs_name = None
+        # Leftover bytes of an incomplete event, only seen on non-evdev files.
+        self._partial_data = b""
+        self._pending_frame = []
+        self._pending_events = deque()
+        # Keys held according to the events handed out by read_frames, used to
+        # correct the listener after the kernel drops events.
+        self.pressed_keys = set()
+        # Set between a SYN_DROPPED and the SYN_REPORT that ends the drop.
+        self._dropping = False
+        # Reused by write_events, grown when a bigger batch comes along.
+        self._write_buffer = bytearray(EVENT_SIZE * 16)
+        # See set_monotonic_clock.
+        self.monotonic_clock = False
+        self.read_latency = None
 
     @property
     def sysfs_name(self):
@@ -79,11 +133,17 @@ class EventDevice(object):
                 self._sysfs_name = None
         return self._sysfs_name
 
+    def open_input(self):
+        """Returns `input_file`, raising OSError if it can't be opened."""
+        if self._input_file is None:
+            self._input_file: BufferedWriter = open(self.path, "rb")
+        return self._input_file
+
     @property
     def input_file(self):
         if self._input_file is None:
             try:
-                self._input_file: BufferedWriter = open(self.path, "rb")
+                self.open_input()
             except IOError as e:
                 if e.strerror == "Permission denied":
                     print(
@@ -102,18 +162,138 @@ class EventDevice(object):
             atexit.register(self._output_file.close)
         return self._output_file
 
+    def read_events(self):
+        """
+        Reads every event the kernel has ready for this device with a single
+        `os.read`, blocking until at least one is available. Returns a list of
+        event tuples in the same format as `read_event`.
+        """
+        data = os.read(self.input_file.fileno(), EVENT_SIZE * MAX_EVENTS_PER_READ)
+        if not data:
+            raise OSError(errno.ENODEV, "Device was closed", self.path)
+
+        if self._partial_data:
+            data = self._partial_data + data
+        complete = len(data) - len(data) % EVENT_SIZE
+        self._partial_data = data[complete:]
+
+        path = self.path
+        sysfs_name = self.sysfs_name
+        if not self.monotonic_clock:
+            return [
+                (seconds + microseconds / 1e6, type, code, value, path, sysfs_name)
+                for seconds, microseconds, type, code, value in event_struct.iter_unpack(
+                    memoryview(data)[:complete]
+                )
+            ]
+
+        # Measured against the kernel's own clock, then handed out in wall
+        # clock time like always.
+        read_ns = monotonic_ns()
+        offset = now() - read_ns / 1e9
+        histogram = self.read_latency
+        events = []
+        for seconds, microseconds, type, code, value in event_struct.iter_unpack(
+            memoryview(data)[:complete]
+        ):
+            if histogram is not None and type == EV_SYN and code == SYN_REPORT:
+                histogram.record(read_ns - seconds * 1000000000 - microseconds * 1000)
+            events.append((seconds + microseconds / 1e6 + offset, type, code, value, path, sysfs_name))
+        return events
+
+    def read_frames(self):
+        """
+        Like `read_events`, but groups the events into frames, each one ending
+        with its SYN_REPORT. Events of an incomplete frame are kept until the
+        rest of the frame arrives, so the returned list may be empty.
+
+        When the kernel reports SYN_DROPPED, the events up to the next
+        SYN_REPORT are discarded and replaced by the frame from
+        `resync_frame`, so held keys match the kernel again.
+        """
+        frames = []
+        frame = self._pending_frame
+        pressed_keys = self.pressed_keys
+        for event in self.read_events():
+            type = event[1]
+            if type == EV_SYN:
+                code = event[2]
+                if code == SYN_REPORT:
+                    if self._dropping:
+                        self._dropping = False
+                        frames.append(self.resync_frame(event[0]))
+                        continue
+                    frame.append(event)
+                    frames.append(frame)
+                    frame = []
+                    continue
+                if code == SYN_DROPPED:
+                    # Events of the interrupted frame were already counted in
+                    # pressed_keys, so they are still delivered.
+                    if frame:
+                        frames.append(frame)
+                        frame = []
+                    self._dropping = True
+                    continue
+            if self._dropping:
+                continue
+            if type == EV_KEY:
+                # 1 is down and 2 is autorepeat, both mean held.
+                if event[3]:
+                    pressed_keys.add(event[2])
+                else:
+                    pressed_keys.discard(event[2])
+            frame.append(event)
+        self._pending_frame = frame
+        return frames
+
+    def set_monotonic_clock(self, monotonic):
+        """
+        Makes the kernel stamp events with CLOCK_MONOTONIC instead of the wall
+        clock, so `read_latency`, a `_latency.Histogram`, can be given how
+        long each frame waited to be read. `read_events` still returns wall
+        clock times. Raises OSError on files that are not evdev devices.
+        """
+        clock = CLOCK_MONOTONIC if monotonic else CLOCK_REALTIME
+        fcntl.ioctl(self.input_file.fileno(), EVIOCSCLOCKID, struct.pack("i", clock))
+        self.monotonic_clock = monotonic
+
+    def read_key_state(self):
+        """Returns the set of key codes the kernel reports as held."""
+        bitmap = bytearray(KEY_STATE_SIZE)
+        fcntl.ioctl(self.input_file.fileno(), EVIOCGKEY, bitmap)
+        return key_codes_from_bitmap(bitmap)
+
+    def resync_frame(self, time=None):
+        """
+        Compares the keys held according to the kernel with `pressed_keys` and
+        returns a frame of synthetic EV_KEY events that fixes the difference,
+        releases first. The frame starts with a SYN_DROPPED marker whose value
+        is the number of corrective events that follow, zero if nothing
+        changed or the state couldn't be read.
+        """
+        if time is None:
+            time = now()
+        path = self.path
+        sysfs_name = self.sysfs_name
+        try:
+            held = self.read_key_state()
+        except OSError:
+            # Not an evdev device, nothing to compare with.
+            return [(time, EV_SYN, SYN_DROPPED, 0, path, sysfs_name)]
+
+        released = sorted(self.pressed_keys - held)
+        pressed = sorted(held - self.pressed_keys)
+        self.pressed_keys = held
+        frame = [(time, EV_SYN, SYN_DROPPED, len(released) + len(pressed), path, sysfs_name)]
+        frame.extend((time, EV_KEY, code, 0, path, sysfs_name) for code in released)
+        frame.extend((time, EV_KEY, code, 1, path, sysfs_name) for code in pressed)
+        return frame
+
     def read_event(self):
-        data = self.input_file.read(struct.calcsize(event_bin_format))
-        seconds, microseconds, type, code, value = struct.unpack(event_bin_format, data)
-
-        return (
-            seconds + microseconds / 1e6,
-            type,
-            code,
-            value,
-            self.path,
-            self.sysfs_name,
-        )
+        while not self._pending_events:
+            self._pending_events.extend(self.read_events())
+        return self._pending_events.popleft()
 
     def write_event(self, type, code, value):
         integer, fraction = divmod(now(), 1)
@@ -129,6 +309,51 @@ class EventDevice(object):
         self.output_file.write(data_event + sync_event)
         self.output_file.flush()
 
+    def write_events(self, events, sync_each=True):
+        """
+        Writes a batch of `(type, code, value)` events with a single
+        `os.write`, all sharing one timestamp.
+
+        If `sync_each` is true a SYN_REPORT follows every event, the same as
+        calling `write_event` for each one. Otherwise the events are written as
+        given, so the caller chooses where frames end by including
+        `(EV_SYN, SYN_REPORT, 0)` entries. A last SYN_REPORT is added if the
+        batch doesn't end with one.
+        """
+        if not isinstance(events, (list, tuple)):
+            events = list(events)
+        if not events:
+            return
+
+        integer, fraction = divmod(now(), 1)
+        seconds = int(integer)
+        microseconds = int(fraction * 1e6)
+
+        size = EVENT_SIZE * (2 * len(events) if sync_each else len(events) + 1)
+        if len(self._write_buffer) < size:
+            self._write_buffer = bytearray(size)
+        buffer = self._write_buffer
+        pack_into = event_struct.pack_into
+
+        offset = 0
+        type = code = None
+        for type, code, value in events:
+            pack_into(buffer, offset, seconds, microseconds, type, code, value)
+            offset += EVENT_SIZE
+            if sync_each:
+                pack_into(buffer, offset, seconds, microseconds, EV_SYN, SYN_REPORT, 0)
+                offset += EVENT_SIZE
+        if not sync_each and (type != EV_SYN or code != SYN_REPORT):
+            pack_into(buffer, offset, seconds, microseconds, EV_SYN, SYN_REPORT, 0)
+            offset += EVENT_SIZE
+
+        output_file = self.output_file
+        # Anything left by write_event must go first.
+        output_file.flush()
+        data = memoryview(buffer)[:offset]
+        while data:
+            data = data[os.write(output_file.fileno(), data):]
+
     def grab(self):
         """Grab exclusive access to this device. Other processes won't receive events."""
         fd = self.input_file.fileno()
@@ -140,132 +365,438 @@ class EventDevice(object):
         fcntl.ioctl(fd, EVIOCGRAB, 0)
 
 
-def device_reader_worker(device_paths, event_queue, command_queue, virtual_name):
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
-    devices = [EventDevice(p) for p in device_paths]
+class EventFilter(object):
+    """
+    Decides, inside the reader, which events are worth sending to the
+    listener, so the rest never crosses the process boundary.
+
+    - `types` event types to keep, or None to keep all of them.
+    - `code_ranges` optional dict from event type to a list of inclusive
+    `(first, last)` ranges of codes to keep for that type.
+    - `exclude_device_names` sysfs names of devices whose events are all
+    dropped, like our own virtual keyboard.
+
+    Frames left without any event are dropped entirely, and their closing
+    SYN_REPORT is only kept if EV_SYN is one of the `types`. Frame boundaries
+    are kept by the transport instead.
+
+    The counters live in shared memory, so `stats()` can be called from the
+    listener process while the reader updates them.
+    """
+
+    PASSED = 0
+    FILTERED = 1
+    FRAMES_DROPPED = 2
+
+    def __init__(self, types=None, code_ranges=None, exclude_device_names=()):
+        self.types = frozenset(types) if types is not None else None
+        self.code_ranges = dict(code_ranges or {})
+        self.exclude_device_names = frozenset(exclude_device_names)
+        self.counters = RawArray(c_ulonglong, 3)
+
+    def matches(self, type, code):
+        if self.types is not None and type not in self.types:
+            return False
+        ranges = self.code_ranges.get(type)
+        return ranges is None or any(first <= code <= last for first, last in ranges)
+
+    def filter_frame(self, frame):
+        """Returns the events of the frame that should be sent, maybe none."""
+        counters = self.counters
+        first = frame[0]
+        # All events in a frame come from the same device.
+        if first[5] in self.exclude_device_names:
+            kept = []
+        elif first[1] == EV_SYN and first[2] == SYN_DROPPED:
+            # The marker always goes with the corrections that are kept.
+            corrections = [event for event in frame[1:] if self.matches(event[1], event[2])]
+            kept = [first[:3] + (len(corrections),) + first[4:]] + corrections if corrections else []
+        elif self.code_ranges:
+            kept = [event for event in frame if self.matches(event[1], event[2])]
+        elif self.types is not None:
+            types = self.types
+            kept = [event for event in frame if event[1] in types]
+        else:
+            kept = frame
+
+        counters[self.PASSED] += len(kept)
+        counters[self.FILTERED] += len(frame) - len(kept)
+        if not kept:
+            counters[self.FRAMES_DROPPED] += 1
+        return kept
+
+    def stats(self):
+        """Returns how many events were passed and filtered so far."""
+        return {
+            "passed": self.counters[self.PASSED],
+            "filtered": self.counters[self.FILTERED],
+            "frames_dropped": self.counters[self.FRAMES_DROPPED],
+        }
+
+
+class DeviceReader(object):
+    """
+    Reads every device, the udev monitor and the grab/ungrab command channel
+    from a single thread by multiplexing all of their file descriptors with
+    one epoll. Each complete frame of events is passed to `on_frame`.
+
+    Keys already held when a device is added are announced with a resync
+    frame, see `EventDevice.resync_frame`. `resync_counters`, if given, is a
+    shared array where the number of SYN_DROPPED seen, corrective events sent
+    after them and keys found held on startup are counted.
+
+    `latency_counts`, if given, is a shared array with the counts of a
+    `_latency.Histogram` followed by a flag. While the flag is set, devices
+    switch to the monotonic clock and the time frames waited to be read is
+    counted in the histogram.
+    """
+
+    DROPS = 0
+    CORRECTED = 1
+    SEEDED = 2
+
+    def __init__(
+        self,
+        devices,
+        on_frame,
+        virtual_name=None,
+        command_conn=None,
+        event_filter=None,
+        resync_counters=None,
+        latency_counts=None,
+    ):
+        self.epoll = select.epoll()
+        self.on_frame = on_frame
+        self.virtual_name = virtual_name
+        self.event_filter = event_filter
+        if resync_counters is None:
+            resync_counters = RawArray(c_ulonglong, 3)
+        self.resync_counters = resync_counters
+        self.latency_counts = latency_counts
+        self.read_latency = None
+        if latency_counts is not None:
+            self.read_latency = _latency.Histogram(latency_counts)
+        self.devices = {}  # fd -> EventDevice
+        self.grabbed_devices = set()
+        self.is_grabbed = False
+
+        self.command_conn = command_conn
+        if command_conn is not None:
+            self.epoll.register(command_conn.fileno(), select.EPOLLIN)
+
+        self.udev_monitor = None
+        self.udev_fd = None
+
+        for device in devices:
+            self.add_device(device)
 
-    # Track grabbed devices - use mutable containers for thread sharing
-    grabbed_devices = set()
-    is_grabbed = [False]  # List as mutable container
+    def watch_udev(self, libudev):
+        """Starts adding devices that are plugged in later."""
+        udev, mon, fd = create_udev_monitor(libudev)
+        self.udev_monitor = (libudev, udev, mon)
+        self.udev_fd = fd
+        self.epoll.register(fd, select.EPOLLIN)
 
-    def is_virtual_device(device):
+    def is_virtual_device(self, device):
         """Check if this is the virtual keyboard created by the program."""
-        return device.sysfs_name == virtual_name
+        return device.sysfs_name == self.virtual_name
 
-    def grab_device(device):
+    def add_device(self, device):
+        if any(d.path == device.path for d in self.devices.values()):
+            return False
+        try:
+            input_file = device.open_input()
+        except OSError as e:
+            # A device added later must not take the other ones down.
+            print("# WARNING: Failed to read device '{}', skipping it: {}".format(device.path, e))
+            return False
+        fd = input_file.fileno()
+        self.devices[fd] = device
+        self.epoll.register(fd, select.EPOLLIN)
+        if self.is_grabbed:
+            self.grab_device(device)
+
+        frame = device.resync_frame()
+        if frame[0][3]:
+            self.resync_counters[self.SEEDED] += frame[0][3]
+            self._publish(frame)
+        return True
+
+    def remove_device(self, fd):
+        device = self.devices.pop(fd)
+        self.grabbed_devices.discard(device.path)
+        try:
+            self.epoll.unregister(fd)
+        except OSError:
+            pass
+        try:
+            device.input_file.close()
+        except OSError:
+            pass
+
+    def grab_device(self, device):
         """Grab a device if it's not the virtual keyboard."""
-        if is_virtual_device(device):
+        if self.is_virtual_device(device):
             return False
         try:
             device.grab()
-            grabbed_devices.add(device.path)
+            self.grabbed_devices.add(device.path)
             return True
         except OSError:
             return False
 
-    def ungrab_device(device):
+    def ungrab_device(self, device):
         """Release a grabbed device."""
-        if device.path not in grabbed_devices:
+        if device.path not in self.grabbed_devices:
             return
         try:
             device.ungrab()
         except OSError:
             pass
-        grabbed_devices.discard(device.path)
-
-    def read_loop(device):
-        while True:
+        self.grabbed_devices.discard(device.path)
+
+    def handle_command(self, command):
+        if command == "grab":
+            if not self.is_grabbed:
+                self.is_grabbed = True
+                for device in self.devices.values():
+                    if device.path not in self.grabbed_devices:
+                        self.grab_device(device)
+        elif command == "ungrab":
+            if self.is_grabbed:
+                self.is_grabbed = False
+                for device in list(self.devices.values()):
+                    self.ungrab_device(device)
+
+    def _sync_clock(self, device):
+        enabled = bool(self.latency_counts[_latency.SIZE])
+        if device.monotonic_clock != enabled:
             try:
-                event_queue.put(device.read_event(), block=True)
+                device.set_monotonic_clock(enabled)
             except OSError:
-                break
+                return
+            device.read_latency = self.read_latency if enabled else None
 
-    for d in devices:
-        Thread(target=read_loop, args=(d,), daemon=True).start()
-
-    def add_device(path):
-        device = EventDevice(path)
-        devices.append(device)
-        Thread(target=read_loop, args=(device,), daemon=True).start()
-        if is_grabbed[0]:
-            grab_device(device)
-
-    def grab_all_connected():
-        for device in devices:
-            if device.path not in grabbed_devices:
-                grab_device(device)
-
-    def ungrab_all_connected():
-        for path in list(grabbed_devices):
-            for device in devices:
-                if device.path == path:
-                    ungrab_device(device)
-                    break
-    def command_listener():
-        """Listen for grab/ungrab commands from main process."""
+    def _read_device(self, fd):
+        if self.latency_counts is not None:
+            self._sync_clock(self.devices[fd])
+        try:
+            frames = self.devices[fd].read_frames()
+        except OSError:
+            # Usually ENODEV, the device was unplugged.
+            self.remove_device(fd)
+            return
+        for frame in frames:
+            first = frame[0]
+            if first[1] == EV_SYN and first[2] == SYN_DROPPED:
+                self.resync_counters[self.DROPS] += 1
+                if not first[3]:
+                    continue
+                self.resync_counters[self.CORRECTED] += first[3]
+            self._publish(frame)
+
+    def _publish(self, frame):
+        if self.event_filter is not None:
+            frame = self.event_filter.filter_frame(frame)
+            if not frame:
+                return
+        self.on_frame(frame)
+
+    def _read_udev(self):
+        libudev, _, mon = self.udev_monitor
+        path = receive_added_devnode(libudev, mon)
+        # The input subsystem also announces legacy /dev/input/mouseN and
+        # jsN nodes, which don't speak the evdev protocol.
+        if path and re.search(r"/event\d+$", path):
+            self.add_device(EventDevice(path))
+
+    def _read_command(self):
+        try:
+            command = self.command_conn.recv()
+        except (EOFError, OSError):
+            self.epoll.unregister(self.command_conn.fileno())
+            self.command_conn = None
+            return
+        self.handle_command(command)
+
+    def poll(self, timeout=-1):
+        """
+        Waits up to `timeout` seconds (forever if negative) for any of the file
+        descriptors to be ready and handles all that are.
+        """
+        for fd, mask in self.epoll.poll(timeout):
+            if fd in self.devices:
+                if mask & select.EPOLLIN:
+                    self._read_device(fd)
+                else:
+                    self.remove_device(fd)
+            elif fd == self.udev_fd:
+                self._read_udev()
+            elif self.command_conn is not None and fd == self.command_conn.fileno():
+                self._read_command()
+
+    def run(self):
         while True:
-            try:
-                cmd = command_queue.get(block=True)
-                if cmd == 'grab':
-                    if not is_grabbed[0]:
-                        is_grabbed[0] = True
-                        grab_all_connected()
-                elif cmd == 'ungrab':
-                    if is_grabbed[0]:
-                        is_grabbed[0] = False
-                        ungrab_all_connected()
-            except OSError:
-                break
+            self.poll()
+
+
+def device_reader_worker(
+    device_paths,
+    event_queue,
+    command_conn,
+    virtual_name,
+    event_filter=None,
+    resync_counters=None,
+    latency_counts=None,
+):
+    devices = [EventDevice(p) for p in device_paths]
 
-    # Start command listener thread
-    Thread(target=command_listener, daemon=True).start()
+    reader = DeviceReader(
+        devices,
+        event_queue.put,
+        virtual_name,
+        command_conn,
+        event_filter,
+        resync_counters,
+        latency_counts,
+    )
 
     if _lib_udev:
         try:
-            udev, mon, fd = create_udev_monitor(_lib_udev)
-            monitor_on_add(_lib_udev, mon, add_device)
+            reader.watch_udev(_lib_udev)
         except BaseException:
             pass
 
-    # only should be reached if monitor fails
-    while True:
-        sleep(1e6)
+    reader.run()
+
+
+def device_reader_process(*args):
+    # Ctrl+C is meant for the main program, which will take us down with it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    device_reader_worker(*args)
 
 
 class AggregatedEventDevice:
-    def __init__(self, devices, output=None, virtual_name=None):
-        self.event_queue = Queue()
-        self.command_queue = Queue()  # For sending grab/ungrab commands
+    def __init__(
+        self,
+        devices,
+        output=None,
+        virtual_name=None,
+        transport=LinuxEventTransports.QUEUE,
+        reader_mode=LinuxReaderModes.PROCESS,
+        event_filter=None,
+    ):
+        self.event_filter = event_filter
+        # Updated by the reader, see DeviceReader.
+        self.resync_counters = RawArray(c_ulonglong, 3)
+        # Read latency histogram and whether to measure it, see DeviceReader.
+        self.latency_counts = RawArray(c_ulonglong, _latency.SIZE + 1)
+        self._ring = None
+        if transport == LinuxEventTransports.SHARED_MEMORY:
+            from ._nixring import SharedEventRing
+
+            self._ring = self.event_queue = SharedEventRing()
+            atexit.register(self._ring.close)
+        elif reader_mode == LinuxReaderModes.THREAD:
+            # Same process, so there is nothing to pickle.
+            self.event_queue = ThreadQueue()
+        else:
+            self.event_queue = Queue()
+        # For sending grab/ungrab commands, polled by the reader with epoll.
+        self.command_conn, reader_command_conn = Pipe()
 
         self.output = output  # stays in parent only
         self.grabbed = False
+        # Events of the last frame received that were not read yet.
+        self._pending_events = deque()
         paths = [d.path for d in devices]
 
-        self.process = Process(
-            target=device_reader_worker,
-            args=(paths, self.event_queue, self.command_queue, virtual_name),
-            daemon=True,
+        args = (
+            paths,
+            self.event_queue,
+            reader_command_conn,
+            virtual_name,
+            event_filter,
+            self.resync_counters,
+            self.latency_counts,
         )
-        self.process.start()
+        if reader_mode == LinuxReaderModes.THREAD:
+            self.process = None
+            self.thread = Thread(target=device_reader_worker, args=args, daemon=True)
+            self.thread.start()
+        else:
+            self.thread = None
+            self.process = Process(target=device_reader_process, args=args, daemon=True)
+            self.process.start()
+
+    def read_frame(self):
+        """
+        Blocks until a whole frame of events is available and returns it as a
+        list of event tuples. Frames end with their SYN_REPORT unless the event
+        filter drops it.
+        """
+        if self._pending_events:
+            frame = list(self._pending_events)
+            self._pending_events.clear()
+            return frame
+        return self.event_queue.get()
 
     def read_event(self):
         # Blocks until an event is available
-        return self.event_queue.get()
+        if self._ring is not None:
+            # Records are decoded one by one, no frame list is built.
+            return self._ring.read_event()
+        if not self._pending_events:
+            self._pending_events.extend(self.event_queue.get())
+        return self._pending_events.popleft()
+
+    def filter_stats(self):
+        """Counters of the reader's event filter, or None if it has none."""
+        return self.event_filter.stats() if self.event_filter else None
+
+    def resync_stats(self):
+        """
+        How many times the kernel dropped events, how many corrective events
+        were sent after that, and how many keys were found held on startup.
+        """
+        counters = self.resync_counters
+        return {
+            "drops": counters[DeviceReader.DROPS],
+            "corrected": counters[DeviceReader.CORRECTED],
+            "seeded": counters[DeviceReader.SEEDED],
+        }
+
+    def set_latency_stats(self, enabled):
+        """
+        Starts or stops measuring how long frames wait to be read, from a
+        clear histogram when starting. Devices switch clock on their next
+        event.
+        """
+        if enabled and not self.latency_counts[_latency.SIZE]:
+            _latency.Histogram(self.latency_counts).clear()
+        self.latency_counts[_latency.SIZE] = int(enabled)
+
+    def read_latency(self):
+        """The `_latency.Histogram` of the time frames waited to be read."""
+        return _latency.Histogram(self.latency_counts)
 
     def write_event(self, type, code, value):
         self.output.write_event(type, code, value)
 
+    def write_events(self, events, sync_each=True):
+        self.output.write_events(events, sync_each)
+
     def grab(self):
         """Grab exclusive access to all keyboards except the virtual one."""
         if not self.grabbed:
             self.grabbed = True
-            self.command_queue.put('grab')
+            self.command_conn.send('grab')
 
     def ungrab(self):
         """Release exclusive access to keyboards."""
         if self.grabbed:
             self.grabbed = False
-            self.command_queue.put('ungrab')
+            self.command_conn.send('ungrab')
 
 
 device_pattern = r"""N: Name="([^"]+?)".+?H: Handlers=([^\n]+)"""
@@ -291,7 +822,13 @@ def list_devices_from_by_id(name_suffix, by_id=True):
         yield EventDevice(path)
 
 
-def aggregate_devices(type_name, name: str):
+def aggregate_devices(
+    type_name,
+    name: str,
+    transport=LinuxEventTransports.QUEUE,
+    reader_mode=LinuxReaderModes.PROCESS,
+    event_filter=None,
+):
     # Some systems have multiple keyboards with different range of allowed keys
     # on each one, like a notebook with a "keyboard" device exclusive for the
     # power button. Instead of figuring out which keyboard allows which key to
@@ -315,7 +852,14 @@ def aggregate_devices(type_name, name: str):
 
     devices_from_proc = list(list_devices_from_proc(type_name))
     if devices_from_proc:
-        return AggregatedEventDevice(devices_from_proc, output=fake_device, virtual_name=name)
+        return AggregatedEventDevice(
+            devices_from_proc,
+            output=fake_device,
+            virtual_name=name,
+            transport=transport,
+            reader_mode=reader_mode,
+            event_filter=event_filter,
+        )
 
     # breaks on mouse for virtualbox
     # was getting /dev/input/by-id/usb-VirtualBox_USB_Tablet-event-mouse
@@ -323,7 +867,14 @@ def aggregate_devices(type_name, name: str):
         list_devices_from_by_id(type_name, by_id=False)
     )
     if devices_from_by_id:
-        return AggregatedEventDevice(devices_from_by_id, output=fake_device, virtual_name=name)
+        return AggregatedEventDevice(
+            devices_from_by_id,
+            output=fake_device,
+            virtual_name=name,
+            transport=transport,
+            reader_mode=reader_mode,
+            event_filter=event_filter,
+        )
 
     # If no keyboards were found we can only use the fake device to send keys.
     assert fake_device
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the evdev plumbing in `_nixcommon`. Real input devices are replaced
+by pipes, which are fed raw `input_event` structs by the test itself.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from ctypes import c_ulonglong
+from multiprocessing import Pipe, Process
+from multiprocessing.sharedctypes import RawArray
+from unittest import mock
+from time import monotonic_ns
+
+from ._nixcommon import (
+    EventDevice,
+    EventFilter,
+    DeviceReader,
+    key_codes_from_bitmap,
+    AggregatedEventDevice,
+    event_struct,
+    EV_KEY,
+    EV_SYN,
+    EV_MSC,
+    EV_REL,
+    SYN_REPORT,
+    SYN_DROPPED,
+)
+from ._nixring import SharedEventRing, MAX_DEVICES
+from . import _latency
+from ._linux_event_transports import LinuxEventTransports
+from ._linux_reader_modes import LinuxReaderModes
+
+
+def pack(type, code, value, seconds=1, microseconds=500000):
+    return event_struct.pack(seconds, microseconds, type, code, value)
+
+
+def syn(seconds=1):
+    return pack(EV_SYN, SYN_REPORT, 0, seconds)
+
+
+class PipeDevice(EventDevice):
+    """EventDevice backed by a pipe instead of /dev/input/event*."""
+
+    def __init__(self, path="/dev/input/event-test"):
+        EventDevice.__init__(self, path)
+        read_fd, self.write_fd = os.pipe()
+        self._input_file = os.fdopen(read_fd, "rb")
+        self._sysfs_name = "test device"
+
+    def feed(self, *chunks):
+        os.write(self.write_fd, b"".join(chunks))
+
+    def close(self):
+        os.close(self.write_fd)
+        self._input_file.close()
+
+
+class HeldKeysDevice(PipeDevice):
+    """PipeDevice whose kernel key state is set by the test."""
+
+    def __init__(self, path="/dev/input/event-test", held_keys=()):
+        PipeDevice.__init__(self, path)
+        self.held_keys = set(held_keys)
+
+    def read_key_state(self):
+        return set(self.held_keys)
+
+
+class MonotonicDevice(PipeDevice):
+    """PipeDevice that pretends to switch the clock of its timestamps."""
+
+    def set_monotonic_clock(self, monotonic):
+        self.monotonic_clock = monotonic
+
+
+class TestEventDevice(unittest.TestCase):
+    def setUp(self):
+        self.device = PipeDevice()
+
+    def tearDown(self):
+        self.device.close()
+
+    def test_read_events_batch(self):
+        self.device.feed(pack(EV_MSC, 4, 30), pack(EV_KEY, 30, 1), syn())
+        events = self.device.read_events()
+        self.assertEqual([e[1:4] for e in events], [(EV_MSC, 4, 30), (EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0)])
+        self.assertEqual(events[0][0], 1.5)
+        self.assertEqual(events[0][4:], ("/dev/input/event-test", "test device"))
+
+    def test_read_events_partial(self):
+        data = pack(EV_KEY, 30, 1)
+        self.device.feed(data[:10])
+        self.assertEqual(self.device.read_events(), [])
+        self.device.feed(data[10:])
+        self.assertEqual([e[1:4] for e in self.device.read_events()], [(EV_KEY, 30, 1)])
+
+    def test_read_frames(self):
+        self.device.feed(pack(EV_KEY, 30, 1), syn(), pack(EV_KEY, 30, 0))
+        frames = self.device.read_frames()
+        self.assertEqual([[e[1:4] for e in f] for f in frames], [[(EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0)]])
+        self.device.feed(syn())
+        frames = self.device.read_frames()
+        self.assertEqual([[e[1:4] for e in f] for f in frames], [[(EV_KEY, 30, 0), (EV_SYN, SYN_REPORT, 0)]])
+
+    def test_read_event_single(self):
+        self.device.feed(pack(EV_KEY, 30, 1), syn())
+        self.assertEqual(self.device.read_event()[1:4], (EV_KEY, 30, 1))
+        self.assertEqual(self.device.read_event()[1:4], (EV_SYN, SYN_REPORT, 0))
+
+    def test_write_events(self):
+        read_fd, write_fd = os.pipe()
+        self.device._output_file = os.fdopen(write_fd, "wb")
+        self.device.write_events([(EV_KEY, 30, 1), (EV_KEY, 30, 0)])
+        self.device.write_events([(EV_KEY, 42, 1), (EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0), (EV_KEY, 30, 0)], sync_each=False)
+        self.device._output_file.close()
+        data = os.read(read_fd, 4096)
+        os.close(read_fd)
+        events = [e[2:] for e in event_struct.iter_unpack(data)]
+        self.assertEqual(events, [
+            (EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0), (EV_KEY, 30, 0), (EV_SYN, SYN_REPORT, 0),
+            (EV_KEY, 42, 1), (EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0), (EV_KEY, 30, 0), (EV_SYN, SYN_REPORT, 0),
+        ])
+
+    def test_pressed_keys(self):
+        self.device.feed(pack(EV_KEY, 30, 1), pack(EV_KEY, 31, 1), syn(), pack(EV_KEY, 30, 2), pack(EV_KEY, 31, 0), syn())
+        self.device.read_frames()
+        self.assertEqual(self.device.pressed_keys, {30})
+
+    def test_key_codes_from_bitmap(self):
+        bitmap = bytearray(96)
+        bitmap[0] = 0b10
+        bitmap[3] = 0b01000000
+        bitmap[95] = 0b10000000
+        self.assertEqual(key_codes_from_bitmap(bitmap), {1, 30, 767})
+
+    def test_resync_not_evdev(self):
+        self.assertEqual(self.device.resync_frame(2.0)[0][:4], (2.0, EV_SYN, SYN_DROPPED, 0))
+
+    def test_syn_dropped(self):
+        device = HeldKeysDevice(held_keys=[31, 42])
+        self.addCleanup(device.close)
+        device.feed(pack(EV_KEY, 30, 1), syn(), pack(EV_KEY, 31, 1), pack(EV_SYN, SYN_DROPPED, 0), pack(EV_KEY, 32, 1), syn(seconds=3))
+        frames = device.read_frames()
+        self.assertEqual([[e[1:4] for e in f] for f in frames], [
+            [(EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0)],
+            # Interrupted frame, delivered as it was.
+            [(EV_KEY, 31, 1)],
+            [(EV_SYN, SYN_DROPPED, 2), (EV_KEY, 30, 0), (EV_KEY, 42, 1)],
+        ])
+        self.assertEqual(frames[2][0][0], 3.5)
+        self.assertEqual(device.pressed_keys, {31, 42})
+
+    def test_read_closed(self):
+        os.close(self.device.write_fd)
+        self.device.write_fd = os.open(os.devnull, os.O_WRONLY)
+        with self.assertRaises(OSError):
+            self.device.read_events()
+
+
+class TestDeviceReader(unittest.TestCase):
+    def setUp(self):
+        self.devices = [PipeDevice("/dev/input/event{}".format(i)) for i in range(3)]
+        self.frames = []
+        self.command_conn, reader_conn = Pipe()
+        self.reader = DeviceReader(self.devices, self.frames.append, "virtual", reader_conn)
+
+    def tearDown(self):
+        for device in self.devices:
+            try:
+                device.close()
+            except OSError:
+                pass
+
+    def test_multiplexes_devices(self):
+        self.devices[0].feed(pack(EV_KEY, 30, 1), syn())
+        self.devices[2].feed(pack(EV_KEY, 31, 1), syn(), pack(EV_KEY, 31, 0), syn())
+        self.reader.poll(0)
+        self.assertEqual(sorted((f[0][4], f[0][2], f[0][3]) for f in self.frames), [
+            ("/dev/input/event0", 30, 1),
+            ("/dev/input/event2", 31, 0),
+            ("/dev/input/event2", 31, 1),
+        ])
+
+    def test_nothing_ready(self):
+        self.reader.poll(0)
+        self.assertEqual(self.frames, [])
+
+    def test_add_device(self):
+        device = PipeDevice("/dev/input/event9")
+        self.devices.append(device)
+        self.assertTrue(self.reader.add_device(device))
+        self.assertFalse(self.reader.add_device(PipeDevice("/dev/input/event9")))
+        device.feed(pack(EV_KEY, 30, 1), syn())
+        self.reader.poll(0)
+        self.assertEqual(len(self.frames), 1)
+
+    def test_add_unreadable_device(self):
+        with mock.patch("sys.stdout", io.StringIO()) as output:
+            self.assertFalse(self.reader.add_device(EventDevice("/nonexistent/input/event99")))
+        self.assertIn("/nonexistent/input/event99", output.getvalue())
+        self.devices[0].feed(pack(EV_KEY, 30, 1), syn())
+        self.reader.poll(0)
+        self.assertEqual(len(self.frames), 1)
+
+    def test_removes_closed_device(self):
+        os.close(self.devices[1].write_fd)
+        self.devices[1].write_fd = os.open(os.devnull, os.O_WRONLY)
+        self.reader.poll(0)
+        self.assertEqual(len(self.reader.devices), 2)
+
+    def test_read_latency(self):
+        device = MonotonicDevice("/dev/input/event9")
+        self.devices.append(device)
+        counts = RawArray(c_ulonglong, _latency.SIZE + 1)
+        reader = DeviceReader([device], self.frames.append, latency_counts=counts)
+
+        seconds, microseconds = divmod(monotonic_ns() // 1000 - 2000, 1000000)
+        device.feed(pack(EV_KEY, 30, 1, seconds, microseconds), syn(seconds))
+        reader.poll(0)
+        # Not measuring yet.
+        self.assertFalse(device.monotonic_clock)
+        self.assertEqual(counts[_latency.COUNT], 0)
+
+        counts[_latency.SIZE] = 1
+        device.feed(
+            pack(EV_KEY, 30, 0, seconds, microseconds),
+            pack(EV_SYN, SYN_REPORT, 0, seconds, microseconds),
+        )
+        reader.poll(0)
+        self.assertTrue(device.monotonic_clock)
+        # One sample per frame, at least the 2ms it was backdated.
+        self.assertEqual(counts[_latency.COUNT], 1)
+        self.assertGreaterEqual(counts[_latency.MAX], 2000000)
+        # Times are still handed out in wall clock time.
+        self.assertGreater(self.frames[-1][0][0], 1e9)
+
+        counts[_latency.SIZE] = 0
+        device.feed(pack(EV_KEY, 30, 1), syn())
+        reader.poll(0)
+        self.assertFalse(device.monotonic_clock)
+        self.assertEqual(counts[_latency.COUNT], 1)
+
+    def test_seeds_held_keys(self):
+        device = HeldKeysDevice("/dev/input/event9", held_keys=[42])
+        self.devices.append(device)
+        self.reader.add_device(device)
+        self.assertEqual([e[1:4] for e in self.frames[0]], [(EV_SYN, SYN_DROPPED, 1), (EV_KEY, 42, 1)])
+        self.assertEqual(self.reader.resync_counters[DeviceReader.SEEDED], 1)
+
+    def test_counts_drops(self):
+        device = HeldKeysDevice("/dev/input/event9")
+        self.devices.append(device)
+        self.reader.add_device(device)
+        device.feed(pack(EV_SYN, SYN_DROPPED, 0), syn())
+        device.held_keys.add(30)
+        device.feed(pack(EV_SYN, SYN_DROPPED, 0), syn())
+        self.reader.poll(0)
+        counters = self.reader.resync_counters
+        self.assertEqual((counters[DeviceReader.DROPS], counters[DeviceReader.CORRECTED]), (2, 1))
+        self.assertEqual([[e[1:4] for e in f] for f in self.frames], [[(EV_SYN, SYN_DROPPED, 1), (EV_KEY, 30, 1)]])
+
+    def test_grab_command(self):
+        self.command_conn.send("grab")
+        self.reader.poll(0)
+        self.assertTrue(self.reader.is_grabbed)
+        self.command_conn.send("ungrab")
+        self.reader.poll(0)
+        self.assertFalse(self.reader.is_grabbed)
+
+
+def frame_of(*events, **kwargs):
+    name = kwargs.get("name", "kbd")
+    return [(1.0, type, code, value, "/dev/input/event3", name) for type, code, value in events]
+
+
+class TestEventFilter(unittest.TestCase):
+    def test_types(self):
+        event_filter = EventFilter(types=[EV_KEY])
+        kept = event_filter.filter_frame(frame_of((EV_MSC, 4, 30), (EV_KEY, 30, 1), (EV_SYN, SYN_REPORT, 0)))
+        self.assertEqual([e[1:4] for e in kept], [(EV_KEY, 30, 1)])
+        self.assertEqual(event_filter.stats(), {"passed": 1, "filtered": 2, "frames_dropped": 0})
+
+    def test_code_ranges(self):
+        event_filter = EventFilter(code_ranges={EV_KEY: [(1, 10), (30, 30)]})
+        kept = event_filter.filter_frame(frame_of((EV_KEY, 5, 1), (EV_KEY, 30, 1), (EV_KEY, 31, 1), (EV_REL, 0, 3)))
+        self.assertEqual([e[1:4] for e in kept], [(EV_KEY, 5, 1), (EV_KEY, 30, 1), (EV_REL, 0, 3)])
+
+    def test_excluded_device(self):
+        event_filter = EventFilter(exclude_device_names=["virtual"])
+        self.assertEqual(event_filter.filter_frame(frame_of((EV_KEY, 30, 1), name="virtual")), [])
+        self.assertEqual(len(event_filter.filter_frame(frame_of((EV_KEY, 30, 1)))), 1)
+        self.assertEqual(event_filter.stats(), {"passed": 1, "filtered": 1, "frames_dropped": 1})
+
+    def test_resync_marker(self):
+        event_filter = EventFilter(code_ranges={EV_KEY: [(1, 100)]})
+        kept = event_filter.filter_frame(frame_of((EV_SYN, SYN_DROPPED, 2), (EV_KEY, 30, 1), (EV_KEY, 300, 1)))
+        self.assertEqual([e[1:4] for e in kept], [(EV_SYN, SYN_DROPPED, 1), (EV_KEY, 30, 1)])
+        self.assertEqual(event_filter.filter_frame(frame_of((EV_SYN, SYN_DROPPED, 1), (EV_KEY, 300, 1))), [])
+
+    def test_reader_drops_empty_frames(self):
+        device = PipeDevice()
+        frames = []
+        reader = DeviceReader([device], frames.append, event_filter=EventFilter(types=[EV_KEY]))
+        device.feed(pack(EV_REL, 0, 3), syn(), pack(EV_KEY, 30, 1), syn())
+        reader.poll(0)
+        device.close()
+        self.assertEqual([[e[1:4] for e in f] for f in frames], [[(EV_KEY, 30, 1)]])
+
+
+def produce_frames(ring, count):
+    for i in range(count):
+        ring.put([(float(i), EV_KEY, 30, i % 2, "/dev/input/event3", "kbd"), (float(i), EV_SYN, SYN_REPORT, 0, "/dev/input/event3", "kbd")])
+
+
+class TestSharedEventRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedEventRing(capacity=8)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_round_trip(self):
+        frame = [(1.5, EV_KEY, 30, 1, "/dev/input/event3", "kbd"), (1.5, EV_SYN, SYN_REPORT, 0, "/dev/input/event3", "kbd")]
+        self.ring.put(frame)
+        self.assertEqual(self.ring.read_event(), frame[0])
+        self.assertEqual(self.ring.get(), frame[1:])
+
+    def test_frame_without_syn(self):
+        self.ring.put(frame_of((EV_KEY, 30, 1), (EV_KEY, 31, 1)))
+        self.ring.put(frame_of((EV_KEY, 30, 0)))
+        self.assertEqual([e[2] for e in self.ring.get()], [30, 31])
+        self.assertEqual([e[2] for e in self.ring.get()], [30])
+
+    def test_frame_larger_than_ring(self):
+        frame = frame_of(*[(EV_KEY, code, 1) for code in range(20)])
+        producer = threading.Thread(target=self.ring.put, args=(frame,))
+        producer.start()
+        self.assertEqual([e[2] for e in self.ring.get()], list(range(20)))
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+
+    def test_device_without_name(self):
+        self.ring.put([(0.0, EV_SYN, SYN_REPORT, 0, "/dev/input/event4", None)])
+        self.assertEqual(self.ring.read_event()[4:], ("/dev/input/event4", None))
+
+    def test_reused_device_slot(self):
+        for i in range(MAX_DEVICES + 1):
+            self.ring.put([(0.0, EV_SYN, SYN_REPORT, 0, "/dev/input/event{}".format(i), None)])
+            self.assertEqual(self.ring.read_event()[4], "/dev/input/event{}".format(i))
+        self.ring.put([(0.0, EV_SYN, SYN_REPORT, 0, "/dev/input/event0", None)])
+        self.assertEqual(self.ring.read_event()[4], "/dev/input/event0")
+
+    def test_reused_device_slot_unread(self):
+        ring = SharedEventRing(capacity=2 * MAX_DEVICES)
+        self.addCleanup(ring.close)
+        paths = ["/dev/input/event{}".format(i) for i in range(MAX_DEVICES + 1)]
+
+        def produce():
+            for path in paths:
+                ring.put([(0.0, EV_SYN, SYN_REPORT, 0, path, None)])
+            # All in one frame, the slots are reused within it.
+            ring.put([(0.0, EV_SYN, SYN_REPORT, 0, path, None) for path in paths])
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        # The last device waits until the record of the first one is read.
+        self.assertEqual([ring.read_event()[4] for _ in paths], paths)
+        self.assertEqual([e[4] for e in ring.get()], paths)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+
+    def test_other_process(self):
+        # More frames than fit the ring, so the producer has to wait for us.
+        process = Process(target=produce_frames, args=(self.ring, 20), daemon=True)
+        process.start()
+        frames = [self.ring.get() for _ in range(20)]
+        process.join()
+        self.assertEqual([f[0][0] for f in frames], [float(i) for i in range(20)])
+        self.assertEqual(frames[-1][0][1:], (EV_KEY, 30, 1, "/dev/input/event3", "kbd"))
+
+
+class TestAggregatedEventDevice(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "event99")
+        os.mkfifo(self.path)
+        # O_RDWR doesn't wait for the reader to open the other end.
+        self.write_fd = os.open(self.path, os.O_RDWR)
+
+    def tearDown(self):
+        os.close(self.write_fd)
+        shutil.rmtree(self.directory)
+
+    def check_reads(self, **kwargs):
+        device = AggregatedEventDevice([EventDevice(self.path)], **kwargs)
+        os.write(self.write_fd, pack(EV_KEY, 30, 1) + syn() + pack(EV_KEY, 30, 0) + syn())
+        self.assertEqual(device.read_event()[1:5], (EV_KEY, 30, 1, self.path))
+        self.assertEqual(device.read_event()[1:4], (EV_SYN, SYN_REPORT, 0))
+        self.assertEqual([e[1:4] for e in device.read_frame()], [(EV_KEY, 30, 0), (EV_SYN, SYN_REPORT, 0)])
+
+    def test_process_mode(self):
+        self.check_reads(reader_mode=LinuxReaderModes.PROCESS)
+
+    def test_thread_mode(self):
+        self.check_reads(reader_mode=LinuxReaderModes.THREAD)
+
+    def test_shared_memory_thread_mode(self):
+        self.check_reads(reader_mode=LinuxReaderModes.THREAD, transport=LinuxEventTransports.SHARED_MEMORY)
+
+
+if __name__ == "__main__":
+    unittest.main()
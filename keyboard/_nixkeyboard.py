@@ -1,20 +1,32 @@
 # -*- coding: utf-8 -*-
+import os
 import re
+import sys
+from array import array
 from threading import Condition
 from collections import defaultdict
 from subprocess import check_output, CalledProcessError
 from ._global_data import global_data
-from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
+from ._keyboard_event import KEY_DOWN, KEY_UP, canonical_event
 from ._canonical_names import all_modifiers, normalize_name
-from ._nixcommon import EV_KEY, aggregate_devices, AggregatedEventDevice
-
-# TODO: start by reading current keyboard state, as to not missing any already pressed keys.
-# See: http://stackoverflow.com/questions/3649874/how-to-get-keyboard-state-in-linux
+from . import _nixkeymap, _nixkeymapcache
+from ._nixcommon import EV_KEY, EV_SYN, SYN_DROPPED, aggregate_devices, AggregatedEventDevice, EventFilter
 
 
 # will wait until a key is realesed on hardware keyboard before attempting to write
 patient_type = False
 
+# drops the events of our own virtual keyboard in the reader, so hooks only see
+# physical key presses. Must be set before the device is built.
+ignore_virtual_keyboard = False
+
+# keeps the key tables on disk between runs, see _nixkeymapcache.
+use_tables_cache = True
+
+# modifier planes read from the console keymap, as bitmasks of MODIFIER_BITS.
+# Limit it to load less, planes the keymap doesn't define are skipped anyway.
+console_keymap_planes = tuple(range(16))
+
 
 def cleanup_key(name):
     """Formats a dumpkeys format to our standard."""
@@ -23,6 +35,9 @@ def cleanup_key(name):
     for mod in ("Meta_", "Control_", "dead_", "KP_"):
         if name.startswith(mod):
             name = name[len(mod):]
+    # "eacute" and "U+20ac" are named by their character, like the keymap
+    # read with ioctls does.
+    name = _nixkeymap.character_name(name)
 
     # Dumpkeys is weird like that.
     if name == "Remove":
@@ -48,15 +63,22 @@ def cleanup_modifier(modifier):
 
 
 """
-Use `dumpkeys --keys-only` to list all scan codes and their names. We
-then parse the output and built a table. For each scan code and modifiers we
-have a list of names and vice-versa.
+Read the console keymap (with ioctls, or `dumpkeys --keys-only` if that's
+not possible) to list all scan codes and their names. We then built a table.
+For each scan code and modifiers we have a list of names and vice-versa.
 """
 
 scan_code_and_mods_to_name = defaultdict(list)
 from_name = defaultdict(list)
 keypad_scan_codes = set()
 
+MODIFIER_BITS = {
+    "shift": 1,
+    "alt gr": 2,
+    "ctrl": 4,
+    "alt": 8,
+}
+
 MODIFIER_WEIGHTS = {
     "shift": 1,
     "alt gr": 2,
@@ -69,6 +91,11 @@ def modifier_cost(modifiers):
     return sum(MODIFIER_WEIGHTS[m] for m in modifiers)
 
 
+# Cost of the entries kept in from_name, so registering a key doesn't have to
+# go through them again.
+_from_name_costs = {}
+
+
 def register_key(key_and_modifiers, name):
     _, modifiers = key_and_modifiers
 
@@ -77,34 +104,178 @@ def register_key(key_and_modifiers, name):
 
     # --- from_name: prefer fewer modifiers ---
     existing = from_name[name]
+    cost = modifier_cost(modifiers)
 
     if not existing:
         existing.append(key_and_modifiers)
+        _from_name_costs[name] = cost
         return
 
-    # Find current best mapping
-    best = min(existing, key=lambda km: modifier_cost(km[1]))
+    best_cost = _from_name_costs.get(name)
+    if best_cost is None:
+        # Filled by someone else, like the synonyms.
+        best_cost = min(modifier_cost(km[1]) for km in existing)
 
     # Replace if new mapping is better
-    if modifier_cost(modifiers) < modifier_cost(best[1]):
+    if cost < best_cost:
         existing.clear()
         existing.append(key_and_modifiers)
-    elif modifier_cost(modifiers) == modifier_cost(best[1]):
+        best_cost = cost
+    elif cost == best_cost:
         if key_and_modifiers not in existing:
             existing.append(key_and_modifiers)
+    _from_name_costs[name] = best_cost
+
+
+"""
+The listener doesn't use the tables above. They are compiled into a dense
+array with one entry per scan code and modifier plane (the bitmask of
+MODIFIER_BITS), holding the index of the key name in an interned name table.
+The names already include the fallbacks to the unmodified key and "unknown",
+so resolving a key is a single index operation.
+"""
+
+N_MODIFIER_MASKS = 16
+# Scan codes the console keymap can describe, higher ones use the tables.
+N_SCAN_CODES = 256
+
+# What the listener reads, replaced as a whole so it never sees tables being
+# rebuilt: (key names, name indexes, scan_code_and_mods_to_name,
+# keypad_scan_codes), the last two for scan codes outside the array.
+_name_table = None
+# Current modifier plane, 0 while modifiers outside MODIFIER_BITS are held.
+_modifier_mask = 0
+_pressed_modifiers_tuple = ()
+
+
+def _lookup_name(scan_code, modifiers, tables=None):
+    if tables is None:
+        tables = scan_code_and_mods_to_name
+    names = (
+        tables.get((scan_code, modifiers))
+        or tables.get((scan_code, ()))
+        or ["unknown"]
+    )
+    return names[0]
+
+
+def _compile_names():
+    global _name_table
+    masks_modifiers = [
+        tuple(sorted(m for m, bit in MODIFIER_BITS.items() if mask & bit))
+        for mask in range(N_MODIFIER_MASKS)
+    ]
+    names = []
+    index_by_name = {}
+    indexes = array("H", bytes(2 * N_SCAN_CODES * N_MODIFIER_MASKS))
+    for scan_code in range(N_SCAN_CODES):
+        for mask, modifiers in enumerate(masks_modifiers):
+            name = _lookup_name(scan_code, modifiers)
+            index = index_by_name.get(name)
+            if index is None:
+                index = index_by_name[name] = len(names)
+                names.append(sys.intern(name))
+            indexes[scan_code * N_MODIFIER_MASKS + mask] = index
+    _name_table = (tuple(names), indexes, scan_code_and_mods_to_name, keypad_scan_codes)
+
+
+def key_name(scan_code, modifier_mask=0):
+    """Name of the key in the given modifier plane, as the listener sees it."""
+    key_names, name_indexes, tables, _ = _name_table
+    if scan_code < N_SCAN_CODES:
+        return key_names[name_indexes[scan_code * N_MODIFIER_MASKS + modifier_mask]]
+    modifiers = tuple(sorted(m for m, bit in MODIFIER_BITS.items() if modifier_mask & bit))
+    return _lookup_name(scan_code, modifiers, tables)
+
+
+def _update_modifiers(name, is_down):
+    global _modifier_mask, _pressed_modifiers_tuple
+    if is_down:
+        pressed_modifiers.add(name)
+    else:
+        pressed_modifiers.discard(name)
+    _pressed_modifiers_tuple = tuple(sorted(pressed_modifiers))
+    mask = 0
+    for modifier in pressed_modifiers:
+        bit = MODIFIER_BITS.get(modifier)
+        if bit is None:
+            # The keymap has no plane for it, use the plain key names.
+            mask = 0
+            break
+        mask |= bit
+    _modifier_mask = mask
 
 
 def build_tables():
-    if scan_code_and_mods_to_name and from_name:
+    if not (scan_code_and_mods_to_name and from_name):
+        _load_tables()
+    if _name_table is None:
+        _compile_names()
+
+
+def _keymap_loader():
+    # Which of the two sources `_build_tables_from_keymap` will read.
+    try:
+        os.close(_nixkeymap.open_console())
+    except OSError:
+        return "dumpkeys"
+    return "ioctl"
+
+
+def _load_tables():
+    if not use_tables_cache:
+        _build_tables_from_keymap()
         return
 
-    modifiers_bits = {
-        "shift": 1,
-        "alt gr": 2,
-        "ctrl": 4,
-        "alt": 8,
-    }
+    key = _nixkeymapcache.keymap_key(_keymap_loader())
+    if _nixkeymapcache.load(key, scan_code_and_mods_to_name, from_name, keypad_scan_codes):
+        return
+    _build_tables_from_keymap()
+    _nixkeymapcache.save(key, scan_code_and_mods_to_name, from_name, keypad_scan_codes)
+
+
+def invalidate_tables_cache():
+    """
+    Drops the cached key tables, in memory and on disk, and reads them again
+    from the console keymap. Needed after the keymap is changed with loadkeys.
+    """
+    global scan_code_and_mods_to_name, from_name, keypad_scan_codes, _from_name_costs
+    _nixkeymapcache.invalidate()
+    # Filled anew, while the listener keeps reading the old tables through
+    # `_name_table` until the new one replaces it.
+    scan_code_and_mods_to_name = defaultdict(list)
+    from_name = defaultdict(list)
+    keypad_scan_codes = set()
+    _from_name_costs = {}
+    _load_tables()
+    _compile_names()
+
+
+def _build_tables_from_keymap():
+    try:
+        fd = _nixkeymap.open_console()
+    except OSError:
+        _build_tables_from_dumpkeys()
+        return
+    try:
+        for scan_code, plane, str_name in _nixkeymap.read_keymap(fd, console_keymap_planes):
+            _register_keysym(scan_code, plane, str_name)
+    except OSError:
+        # Console without keymap ioctls, start over with dumpkeys.
+        scan_code_and_mods_to_name.clear()
+        from_name.clear()
+        keypad_scan_codes.clear()
+        _build_tables_from_dumpkeys()
+        return
+    finally:
+        os.close(fd)
+    _add_missing_keys()
+    _register_synonyms(_nixkeymap.SYNONYMS)
+
+
+def _build_tables_from_dumpkeys():
     keycode_template = r"^keycode\s+(\d+)\s+=(.*?)$"
+    keymaps_template = r"^keymaps\s+(\S+)\s*$"
     try:
         dump = check_output(["dumpkeys", "--keys-only"],
                             universal_newlines=True)
@@ -116,21 +287,37 @@ def build_tables():
         else:
             raise
 
+    # Columns are the planes the keymap defines, in order. Without the
+    # keymaps line, assume they're all defined.
+    keymaps = re.search(keymaps_template, dump, re.MULTILINE)
+    planes = _nixkeymap.keymap_planes(keymaps.group(1)) if keymaps else range(256)
+
     for str_scan_code, str_names in re.findall(keycode_template, dump, re.MULTILINE):
         scan_code = int(str_scan_code)
-        for i, str_name in enumerate(str_names.strip().split()):
-            modifiers = tuple(
-                sorted(modifier for modifier,
-                       bit in modifiers_bits.items() if i & bit)
-            )
-            name, is_keypad = cleanup_key(str_name)
-            register_key((scan_code, modifiers), name)
-            if is_keypad:
-                keypad_scan_codes.add(scan_code)
-                register_key((scan_code, modifiers), "keypad " + name)
-            elif name.islower() and len(name)==1:
-                register_key((scan_code,("shift",)), name.upper())
+        for plane, str_name in zip(planes, str_names.strip().split()):
+            _register_keysym(scan_code, plane, str_name)
+    _add_missing_keys()
 
+    synonyms_template = r"^(\S+)\s+for (.+)$"
+    dump = check_output(["dumpkeys", "--long-info"], universal_newlines=True)
+    _register_synonyms(re.findall(synonyms_template, dump, re.MULTILINE))
+
+
+def _register_keysym(scan_code, plane, str_name):
+    modifiers = tuple(
+        sorted(modifier for modifier,
+               bit in MODIFIER_BITS.items() if plane & bit)
+    )
+    name, is_keypad = cleanup_key(str_name)
+    register_key((scan_code, modifiers), name)
+    if is_keypad:
+        keypad_scan_codes.add(scan_code)
+        register_key((scan_code, modifiers), "keypad " + name)
+    elif name.islower() and len(name)==1:
+        register_key((scan_code,("shift",)), name.upper())
+
+
+def _add_missing_keys():
     # dumpkeys consistently misreports the Windows key, sometimes
     # skipping it completely or reporting as 'alt. 125 = left win,
     # 126 = right win.
@@ -149,9 +336,9 @@ def build_tables():
     if (127, ()) not in scan_code_and_mods_to_name:
         register_key((127, ()), "menu")
 
-    synonyms_template = r"^(\S+)\s+for (.+)$"
-    dump = check_output(["dumpkeys", "--long-info"], universal_newlines=True)
-    for synonym_str, original_str in re.findall(synonyms_template, dump, re.MULTILINE):
+
+def _register_synonyms(synonyms):
+    for synonym_str, original_str in synonyms:
         synonym, _ = cleanup_key(synonym_str)
         original, _ = cleanup_key(original_str)
         if synonym != original:
@@ -166,7 +353,18 @@ def build_device(name: str):
     global _device
     if _device:
         return
-    _device = aggregate_devices("kbd", name)
+    # listen only cares about key events, the rest is dropped in the reader.
+    event_filter = EventFilter(
+        types=[EV_KEY],
+        exclude_device_names=[name] if ignore_virtual_keyboard else (),
+    )
+    _device = aggregate_devices(
+        "kbd",
+        name,
+        global_data.linux_event_transport,
+        global_data.linux_reader_mode,
+        event_filter,
+    )
 
 
 _down_keys = None
@@ -196,6 +394,44 @@ def ungrab():
     return False
 
 
+def filter_stats():
+    """
+    Returns how many events the reader passed to the listener and how many it
+    filtered out, or None if there is no reader.
+    """
+    if isinstance(_device, AggregatedEventDevice):
+        return _device.filter_stats()
+    return None
+
+
+def resync_stats():
+    """
+    Returns how many times the kernel dropped events, how many corrective
+    events were sent because of that and how many keys were found held on
+    startup, or None if there is no reader.
+    """
+    if isinstance(_device, AggregatedEventDevice):
+        return _device.resync_stats()
+    return None
+
+
+def set_latency_stats(enabled):
+    """
+    Starts or stops measuring how long the kernel's events wait for the
+    reader, see `AggregatedEventDevice.set_latency_stats`.
+    """
+    build_device(global_data.device_name)
+    if isinstance(_device, AggregatedEventDevice):
+        _device.set_latency_stats(enabled)
+
+
+def latency_histograms():
+    """Returns the histograms of the stages measured by the reader, by name."""
+    if isinstance(_device, AggregatedEventDevice):
+        return {"read": _device.read_latency()}
+    return {}
+
+
 def is_grabbed()->bool:
     """Release exclusive access to all physical keyboards."""
     global _device
@@ -210,29 +446,34 @@ def listen(callback):
     build_device(global_data.device_name)
     build_tables()
 
+    # Keys already held on startup, or whose events the kernel dropped, are
+    # sent by the reader as synthetic events after a SYN_DROPPED marker.
+    synthetic_left = 0
     while True:
         time, type, code, value, device_path, device_name = _device.read_event()
 
         if type != EV_KEY:
+            if type == EV_SYN and code == SYN_DROPPED:
+                synthetic_left = value
             continue
 
+        synthetic = synthetic_left > 0
+        if synthetic:
+            synthetic_left -= 1
+
         scan_code = code
         event_type = KEY_DOWN if value else KEY_UP  # 0 = UP, 1 = DOWN, 2 = HOLD
 
-        pressed_modifiers_tuple = tuple(sorted(pressed_modifiers))
-        names = (
-            scan_code_and_mods_to_name[(scan_code, pressed_modifiers_tuple)]
-            or scan_code_and_mods_to_name[(scan_code, ())]
-            or ["unknown"]
-        )
-        name = names[0]
+        pressed_modifiers_tuple = _pressed_modifiers_tuple
+        key_names, name_indexes, tables, keypad = _name_table
+        if scan_code < N_SCAN_CODES:
+            name = key_names[name_indexes[scan_code * N_MODIFIER_MASKS + _modifier_mask]]
+        else:
+            name = _lookup_name(scan_code, pressed_modifiers_tuple, tables)
         if name in all_modifiers:
-            if event_type == KEY_DOWN:
-                pressed_modifiers.add(name)
-            else:
-                pressed_modifiers.discard(name)
+            _update_modifiers(name, event_type == KEY_DOWN)
 
-        is_keypad = scan_code in keypad_scan_codes
+        is_keypad = scan_code in keypad
 
         if event_type == KEY_DOWN:
             _down_keys[scan_code] = True
@@ -241,16 +482,18 @@ def listen(callback):
                 del _down_keys[scan_code]
                 with _keys_cond:
                     _keys_cond.notify_all()
+        # Names in the tables went through normalize_name already.
         callback(
-            KeyboardEvent(
-                event_type=event_type,
-                scan_code=scan_code,
-                name=name,
-                time=time,
-                device=device_path,
-                device_name=device_name,
-                is_keypad=is_keypad,
-                modifiers=pressed_modifiers_tuple,
+            canonical_event(
+                event_type,
+                scan_code,
+                name,
+                time,
+                device_path,
+                device_name,
+                pressed_modifiers_tuple,
+                is_keypad,
+                synthetic,
             )
         )
 
@@ -295,6 +538,25 @@ def release(scan_code, should_be_shifted: bool = False):
     _write_event(scan_code, False, global_data.device_name, should_be_shifted)
 
 
+def send_keys(actions):
+    """
+    Presses and releases scan codes, given as `(scan_code, is_down)` pairs,
+    with a single write to the device. Each action is its own frame. An
+    action can also be a `(scan_code, is_down, shifted)` tuple, like the steps
+    of a `WritePlan`, `shifted` being passed as `should_be_shifted`.
+    """
+    if patient_type:
+        # Every key may have to wait for the user, so they can't be batched.
+        for action in actions:
+            scan_code, is_down = action[0], action[1]
+            should_be_shifted = len(action) > 2 and action[2]
+            _write_event(scan_code, is_down, global_data.device_name, should_be_shifted)
+        return
+
+    build_device(global_data.device_name)
+    _device.write_events([(EV_KEY, action[0], int(action[1])) for action in actions])
+
+
 """
 Doesn't work on wayland because waland blocks synthetic unicode events by
 design
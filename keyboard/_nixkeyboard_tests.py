@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the key tables of the evdev backend. `dumpkeys` is never run, the
+tables are filled by the tests themselves.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import defaultdict
+from unittest import mock
+
+from . import _nixkeyboard, _nixkeymap, _nixkeymapcache
+
+
+def reset_tables():
+    _nixkeyboard.scan_code_and_mods_to_name.clear()
+    _nixkeyboard.from_name.clear()
+    _nixkeyboard.keypad_scan_codes.clear()
+    _nixkeyboard._from_name_costs.clear()
+    _nixkeyboard._name_table = None
+
+
+def sample_tables():
+    scan_code_and_mods_to_name = defaultdict(list)
+    scan_code_and_mods_to_name[(30, ())] = ["a"]
+    scan_code_and_mods_to_name[(30, ("shift",))] = ["A"]
+    scan_code_and_mods_to_name[(79, ())] = ["1", "keypad 1"]
+    from_name = defaultdict(list)
+    from_name["a"] = [(30, ())]
+    from_name["A"] = [(30, ("shift",))]
+    from_name["1"] = [(79, ())]
+    return scan_code_and_mods_to_name, from_name, {79}
+
+
+class TestKeymapCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_cache_home = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = self.directory
+
+    def tearDown(self):
+        if self.previous_cache_home is None:
+            del os.environ["XDG_CACHE_HOME"]
+        else:
+            os.environ["XDG_CACHE_HOME"] = self.previous_cache_home
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        _nixkeymapcache.save("key", *sample_tables())
+        tables = defaultdict(list), defaultdict(list), set()
+        self.assertTrue(_nixkeymapcache.load("key", *tables))
+        self.assertEqual(tables, sample_tables())
+        # Still defaultdicts after loading.
+        self.assertEqual(tables[0][(1, ())], [])
+
+    def test_other_key(self):
+        _nixkeymapcache.save("key", *sample_tables())
+        self.assertFalse(_nixkeymapcache.load("other key", defaultdict(list), defaultdict(list), set()))
+
+    def test_corrupted(self):
+        os.makedirs(os.path.dirname(_nixkeymapcache.cache_path()))
+        with open(_nixkeymapcache.cache_path(), "w") as f:
+            f.write('{"version": 1, "key": "key", "from_name": 3')
+        self.assertFalse(_nixkeymapcache.load("key", defaultdict(list), defaultdict(list), set()))
+
+    def test_key_depends_on_loader(self):
+        self.assertNotEqual(_nixkeymapcache.keymap_key("ioctl"), _nixkeymapcache.keymap_key("dumpkeys"))
+
+    def test_invalidate(self):
+        _nixkeymapcache.invalidate()
+        _nixkeymapcache.save("key", *sample_tables())
+        _nixkeymapcache.invalidate()
+        self.assertFalse(os.path.exists(_nixkeymapcache.cache_path()))
+
+    def test_build_tables_warm(self):
+        _nixkeymapcache.save(_nixkeymapcache.keymap_key(_nixkeyboard._keymap_loader()), *sample_tables())
+        original = _nixkeyboard._build_tables_from_dumpkeys
+        _nixkeyboard._build_tables_from_dumpkeys = lambda: self.fail("dumpkeys was run")
+        try:
+            _nixkeyboard.build_tables()
+            self.assertEqual(_nixkeyboard.from_name["A"], [(30, ("shift",))])
+            self.assertIn(79, _nixkeyboard.keypad_scan_codes)
+        finally:
+            _nixkeyboard._build_tables_from_dumpkeys = original
+            reset_tables()
+
+
+class TestConsoleKeymap(unittest.TestCase):
+    def setUp(self):
+        self.original = _nixkeymap.open_console, _nixkeymap.read_keymap, _nixkeyboard._build_tables_from_dumpkeys
+        self.dumpkeys_runs = 0
+
+        def fake_dumpkeys():
+            self.dumpkeys_runs += 1
+        _nixkeymap.open_console = lambda: os.open(os.devnull, os.O_RDONLY)
+        _nixkeyboard._build_tables_from_dumpkeys = fake_dumpkeys
+
+    def tearDown(self):
+        _nixkeymap.open_console, _nixkeymap.read_keymap, _nixkeyboard._build_tables_from_dumpkeys = self.original
+        reset_tables()
+
+    def test_keysym_names(self):
+        self.assertEqual(_nixkeymap.keysym_name(0x0B61), "a")
+        self.assertEqual(_nixkeymap.keysym_name(0x002B), "plus")
+        self.assertEqual(_nixkeymap.keysym_name(0x00E9), "é")
+        self.assertEqual(_nixkeymap.keysym_name(0x0818), "Meta_Control_x")
+        self.assertEqual(_nixkeymap.keysym_name(0x0100), "F1")
+        self.assertEqual(_nixkeymap.keysym_name(0x0118), "Prior")
+        self.assertEqual(_nixkeymap.keysym_name(0x0201), "Return")
+        self.assertEqual(_nixkeymap.keysym_name(0x0301), "KP_1")
+        self.assertEqual(_nixkeymap.keysym_name(0x0603), "Up")
+        self.assertEqual(_nixkeymap.keysym_name(0x0702), "Control")
+        self.assertEqual(_nixkeymap.keysym_name(0xF000 ^ 0x20AC), "€")
+        self.assertEqual(_nixkeymap.keysym_name(0xF000 ^ 0x00E9), "é")
+        self.assertIsNone(_nixkeymap.keysym_name(_nixkeymap.K_HOLE))
+
+    def test_build_tables(self):
+        _nixkeymap.read_keymap = lambda fd, planes: iter([
+            (30, 0, "a"),
+            (2, 1, "exclam"),
+            (29, 0, "Control"),
+            (79, 0, "KP_1"),
+            (104, 0, "Prior"),
+        ])
+        _nixkeyboard._build_tables_from_keymap()
+        tables = _nixkeyboard.scan_code_and_mods_to_name
+        self.assertEqual(self.dumpkeys_runs, 0)
+        self.assertEqual(tables[(30, ())], ["a"])
+        self.assertEqual(tables[(30, ("shift",))], ["A"])
+        self.assertEqual(tables[(2, ("shift",))], ["!"])
+        self.assertEqual(tables[(29, ())], ["ctrl"])
+        self.assertEqual(tables[(79, ())], ["1", "keypad 1"])
+        self.assertEqual(_nixkeyboard.keypad_scan_codes, {79})
+        self.assertEqual(tables[(125, ())], ["windows"])
+        self.assertEqual(_nixkeyboard.from_name["page up"], [(104, ())])
+
+    def test_character_names(self):
+        self.assertEqual(_nixkeymap.character_name("eacute"), "é")
+        self.assertEqual(_nixkeymap.character_name("nobreakspace"), "\xa0")
+        self.assertEqual(_nixkeymap.character_name("ydiaeresis"), "ÿ")
+        self.assertEqual(_nixkeymap.character_name("U+20ac"), "€")
+        self.assertEqual(_nixkeymap.character_name("Return"), "Return")
+        self.assertEqual(_nixkeymap.character_name("U+zz"), "U+zz")
+        self.assertEqual(_nixkeyboard.cleanup_key("Meta_eacute"), ("é", False))
+        # Micro sign, not the greek letter normalize_name turns "mu" into.
+        self.assertEqual(_nixkeyboard.cleanup_key("mu"), ("\xb5", False))
+
+    def test_keymap_planes(self):
+        self.assertEqual(_nixkeymap.keymap_planes("0-2,4-6,8-9,12"), [0, 1, 2, 4, 5, 6, 8, 9, 12])
+
+    def test_loaders_agree(self):
+        # The same keymap, as dumpkeys prints it and as the ioctls read it.
+        dumps = {
+            "--keys-only": "keymaps 0-2,4\nkeycode 18 = e E eacute Control_e\nkeycode 6 = five percent U+20ac\n",
+            "--long-info": "pound for sterling\n",
+        }
+        original_check_output = _nixkeyboard.check_output
+        _nixkeyboard.check_output = lambda args, **kwargs: dumps[args[1]]
+        try:
+            original_dumpkeys = self.original[2]
+            original_dumpkeys()
+        finally:
+            _nixkeyboard.check_output = original_check_output
+        from_dumpkeys = dict(_nixkeyboard.scan_code_and_mods_to_name)
+        reset_tables()
+
+        keysyms = [(18, 0, 0x0B65), (18, 1, 0x0B45), (18, 2, 0x00E9), (18, 4, 0x0005), (6, 0, 0x0035), (6, 1, 0x0025), (6, 2, 0xF000 ^ 0x20AC)]
+        _nixkeymap.read_keymap = lambda fd, planes: iter(
+            [(scan_code, plane, _nixkeymap.keysym_name(keysym)) for scan_code, plane, keysym in keysyms]
+        )
+        _nixkeyboard._build_tables_from_keymap()
+        self.assertEqual(dict(_nixkeyboard.scan_code_and_mods_to_name), from_dumpkeys)
+        self.assertEqual(from_dumpkeys[(18, ("alt gr",))], ["é"])
+        self.assertEqual(from_dumpkeys[(18, ("ctrl",))], ["e"])
+        self.assertEqual(from_dumpkeys[(6, ("alt gr",))], ["€"])
+
+    def test_falls_back_to_dumpkeys(self):
+        def failing_keymap(fd, planes):
+            yield (30, 0, "a")
+            raise OSError("Inappropriate ioctl for device")
+        _nixkeymap.read_keymap = failing_keymap
+        _nixkeyboard._build_tables_from_keymap()
+        self.assertEqual(self.dumpkeys_runs, 1)
+        self.assertNotIn((30, ()), _nixkeyboard.scan_code_and_mods_to_name)
+
+
+class ReplayDevice(object):
+    def __init__(self, events):
+        self.events = list(events)
+
+    def read_event(self):
+        if not self.events:
+            raise EOFError()
+        return self.events.pop(0)
+
+
+class TestCompiledNames(unittest.TestCase):
+    def setUp(self):
+        for scan_code, plane, name in [(30, 0, "a"), (2, 0, "one"), (2, 1, "exclam"), (42, 0, "Shift"), (125, 0, "Alt")]:
+            _nixkeyboard._register_keysym(scan_code, plane, name)
+        _nixkeyboard._add_missing_keys()
+        _nixkeyboard.build_tables()
+
+    def tearDown(self):
+        reset_tables()
+        _nixkeyboard.pressed_modifiers.clear()
+        _nixkeyboard._update_modifiers("shift", False)
+
+    def test_key_name(self):
+        self.assertEqual(_nixkeyboard.key_name(30), "a")
+        self.assertEqual(_nixkeyboard.key_name(30, 1), "A")
+        self.assertEqual(_nixkeyboard.key_name(2, 1), "!")
+        # Falls back to the unmodified key, then to "unknown".
+        self.assertEqual(_nixkeyboard.key_name(2, 4), "1")
+        self.assertEqual(_nixkeyboard.key_name(31), "unknown")
+        self.assertEqual(_nixkeyboard.key_name(400), "unknown")
+        self.assertEqual(_nixkeyboard.key_name(125), "windows")
+
+    def test_register_key_prefers_fewer_modifiers(self):
+        _nixkeyboard.register_key((3, ("alt", "ctrl")), "@")
+        _nixkeyboard.register_key((4, ("shift",)), "@")
+        _nixkeyboard.register_key((5, ("shift",)), "@")
+        self.assertEqual(_nixkeyboard.from_name["@"], [(4, ("shift",)), (5, ("shift",))])
+
+    def test_invalidate_publishes_new_table(self):
+        old_table = _nixkeyboard._name_table
+
+        def load_tables():
+            # What the listener reads is untouched while rebuilding.
+            self.assertIs(_nixkeyboard._name_table, old_table)
+            self.assertEqual(_nixkeyboard.key_name(30), "a")
+            _nixkeyboard._register_keysym(30, 0, "b")
+
+        with mock.patch.object(_nixkeymapcache, "invalidate"), \
+                mock.patch.object(_nixkeyboard, "_load_tables", load_tables):
+            _nixkeyboard.invalidate_tables_cache()
+        self.assertIsNot(_nixkeyboard._name_table, old_table)
+        self.assertEqual(_nixkeyboard.key_name(30), "b")
+        self.assertEqual(old_table[0][old_table[1][30 * _nixkeyboard.N_MODIFIER_MASKS]], "a")
+
+    def test_listen(self):
+        events = []
+        original_device = _nixkeyboard._device
+        _nixkeyboard._device = ReplayDevice([
+            (1.0, 1, 42, 1, "/dev/input/event3", "kbd"),
+            (1.0, 1, 2, 1, "/dev/input/event3", "kbd"),
+            (1.0, 1, 42, 0, "/dev/input/event3", "kbd"),
+            (1.0, 1, 2, 0, "/dev/input/event3", "kbd"),
+        ])
+        _nixkeyboard._down_keys = {}
+        try:
+            with self.assertRaises(EOFError):
+                _nixkeyboard.listen(events.append)
+        finally:
+            _nixkeyboard._device = original_device
+        self.assertEqual([(e.name, e.modifiers) for e in events], [
+            ("shift", ()),
+            ("!", ("shift",)),
+            ("shift", ("shift",)),
+            ("1", ()),
+        ])
+
+    def test_send_keys_patient_shifted(self):
+        # The user holds shift, which "!" is typed with: nothing to wait for.
+        written = []
+        device = mock.Mock()
+        device.write_event = lambda type, code, value: written.append((code, value))
+        _nixkeyboard.pressed_modifiers.add("shift")
+        with mock.patch.object(_nixkeyboard, "_device", device), \
+                mock.patch.object(_nixkeyboard, "_down_keys", {}), \
+                mock.patch.object(_nixkeyboard, "patient_type", True):
+            thread = threading.Thread(target=_nixkeyboard.send_keys, args=([(2, True, True), (2, False, True)],))
+            thread.daemon = True
+            thread.start()
+            thread.join(1)
+            alive = thread.is_alive()
+            if alive:
+                with _nixkeyboard._keys_cond:
+                    _nixkeyboard.pressed_modifiers.discard("shift")
+                    _nixkeyboard._keys_cond.notify_all()
+                thread.join(1)
+        self.assertFalse(alive)
+        self.assertEqual(written, [(2, 1), (2, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
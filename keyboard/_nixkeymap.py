@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Reads the console keymap straight from the kernel with the KDGKBENT ioctl,
+the same table `dumpkeys` prints, without spawning it.
+
+The keymap has one plane per combination of modifiers, the bitmask being the
+plane number, and each plane maps the 256 keycodes to a keysym: a type in the
+high byte and a value in the low one. Keysyms are translated to the names
+`dumpkeys` would print (see `ksyms.c` in kbd), so they go through the same
+clean up afterwards, except for Latin-1 and Unicode characters, which are
+named by the character itself. `character_name` translates the names dumpkeys
+prints for them the same way, so both sources give the same key names.
+
+KDGKBSENT is not used: it returns the strings sent by function keys, which
+play no part in key names.
+"""
+import os
+import fcntl
+import struct
+
+# include/uapi/linux/kd.h
+KDGKBTYPE = 0x4B33
+KB_84 = 0x01
+KB_101 = 0x02
+KDGKBENT = 0x4B46
+NR_KEYS = 256
+# struct kbentry { unsigned char kb_table; unsigned char kb_index; unsigned short kb_value; }
+kbentry_struct = struct.Struct("BBH")
+
+# include/uapi/linux/keyboard.h
+KT_LATIN = 0
+KT_FN = 1
+KT_SPEC = 2
+KT_PAD = 3
+KT_DEAD = 4
+KT_CONS = 5
+KT_CUR = 6
+KT_SHIFT = 7
+KT_META = 8
+KT_ASCII = 9
+KT_LOCK = 10
+KT_LETTER = 11
+KT_SLOCK = 12
+NR_TYPES = 15
+K_HOLE = 0x0200
+K_NOSUCHMAP = 0x027F
+
+# Same device order dumpkeys tries.
+CONSOLE_PATHS = ("/dev/tty", "/dev/tty0", "/dev/vc/0", "/dev/console")
+
+iso646_names = (
+    ["nul"]
+    + ["Control_" + c for c in "abcdefg"]
+    + ["BackSpace", "Tab", "Linefeed"]
+    + ["Control_" + c for c in "klmnopqrstuvwxyz"]
+    + ["Escape", "Control_backslash", "Control_bracketright", "Control_asciicircum", "Control_underscore"]
+    + ["space", "exclam", "quotedbl", "numbersign", "dollar", "percent", "ampersand", "apostrophe",
+       "parenleft", "parenright", "asterisk", "plus", "comma", "minus", "period", "slash",
+       "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine",
+       "colon", "semicolon", "less", "equal", "greater", "question", "at"]
+    + list("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+    + ["bracketleft", "backslash", "bracketright", "asciicircum", "underscore", "grave"]
+    + list("abcdefghijklmnopqrstuvwxyz")
+    + ["braceleft", "bar", "braceright", "asciitilde", "Delete"]
+)
+
+# Names dumpkeys prints for the Latin-1 characters from 0xA0.
+latin1_names = [
+    "nobreakspace", "exclamdown", "cent", "sterling", "currency", "yen", "brokenbar",
+    "section", "diaeresis", "copyright", "ordfeminine", "guillemotleft", "notsign",
+    "hyphen", "registered", "macron", "degree", "plusminus", "twosuperior",
+    "threesuperior", "acute", "mu", "paragraph", "periodcentered", "cedilla",
+    "onesuperior", "masculine", "guillemotright", "onequarter", "onehalf",
+    "threequarters", "questiondown", "Agrave", "Aacute", "Acircumflex", "Atilde",
+    "Adiaeresis", "Aring", "AE", "Ccedilla", "Egrave", "Eacute", "Ecircumflex",
+    "Ediaeresis", "Igrave", "Iacute", "Icircumflex", "Idiaeresis", "ETH", "Ntilde",
+    "Ograve", "Oacute", "Ocircumflex", "Otilde", "Odiaeresis", "multiply", "Ooblique",
+    "Ugrave", "Uacute", "Ucircumflex", "Udiaeresis", "Yacute", "THORN", "ssharp",
+    "agrave", "aacute", "acircumflex", "atilde", "adiaeresis", "aring", "ae",
+    "ccedilla", "egrave", "eacute", "ecircumflex", "ediaeresis", "igrave", "iacute",
+    "icircumflex", "idiaeresis", "eth", "ntilde", "ograve", "oacute", "ocircumflex",
+    "otilde", "odiaeresis", "division", "oslash", "ugrave", "uacute", "ucircumflex",
+    "udiaeresis", "yacute", "thorn", "ydiaeresis",
+]
+latin1_characters = {name: chr(0xA0 + i) for i, name in enumerate(latin1_names)}
+
+fn_names = (
+    ["F{}".format(i) for i in range(1, 21)]
+    + ["Find", "Insert", "Remove", "Select", "Prior", "Next", "Macro", "Help", "Do", "Pause"]
+    + ["F{}".format(i) for i in range(21, 247)]
+)
+
+spec_names = [
+    "VoidSymbol", "Return", "Show_Registers", "Show_Memory", "Show_State", "Break",
+    "Last_Console", "Caps_Lock", "Num_Lock", "Scroll_Lock", "Scroll_Forward",
+    "Scroll_Backward", "Boot", "Caps_On", "Compose", "SAK", "Decr_Console",
+    "Incr_Console", "KeyboardSignal", "Bare_Num_Lock",
+]
+
+pad_names = ["KP_{}".format(i) for i in range(10)] + [
+    "KP_Add", "KP_Subtract", "KP_Multiply", "KP_Divide", "KP_Enter", "KP_Comma",
+    "KP_Period", "KP_MinPlus",
+]
+
+dead_names = [
+    "dead_grave", "dead_acute", "dead_circumflex", "dead_tilde", "dead_diaeresis",
+    "dead_cedilla", "dead_macron", "dead_breve", "dead_abovedot", "dead_abovering",
+    "dead_doubleacute", "dead_caron", "dead_ogonek",
+]
+
+shift_names = ["Shift", "AltGr", "Control", "Alt", "ShiftL", "ShiftR", "CtrlL", "CtrlR", "CapsShift"]
+
+# Printed by `dumpkeys --long-info` as "<synonym> for <name>".
+SYNONYMS = (
+    ("Control_h", "BackSpace"),
+    ("Control_i", "Tab"),
+    ("Control_j", "Linefeed"),
+    ("Home", "Find"),
+    ("End", "Select"),
+    ("PageUp", "Prior"),
+    ("PageDown", "Next"),
+    ("multiplication", "multiply"),
+    ("pound", "sterling"),
+    ("pilcrow", "paragraph"),
+    ("Oslash", "Ooblique"),
+    ("Shift_L", "ShiftL"),
+    ("Shift_R", "ShiftR"),
+    ("Control_L", "CtrlL"),
+    ("Control_R", "CtrlR"),
+    ("AltL", "Alt"),
+    ("AltR", "AltGr"),
+    ("Alt_L", "Alt"),
+    ("Alt_R", "AltGr"),
+    ("AltGr_L", "Alt"),
+    ("AltGr_R", "AltGr"),
+    ("AltLLock", "Alt_Lock"),
+    ("AltRLock", "AltGr_Lock"),
+    ("SCtrl", "SControl"),
+    ("Spawn_Console", "KeyboardSignal"),
+    ("Uncaps_Shift", "CapsShift"),
+    ("tilde", "asciitilde"),
+    ("circumflex", "asciicircum"),
+    ("no-break_space", "nobreakspace"),
+    ("paragraph_sign", "section"),
+    ("soft_hyphen", "hyphen"),
+    ("rightanglequote", "guillemotright"),
+)
+
+
+def latin_name(value):
+    if value < len(iso646_names):
+        return iso646_names[value]
+    if value >= 0xA0:
+        return chr(value)
+    return None
+
+
+def character_name(name):
+    """
+    Returns the character a dumpkeys name stands for, for Latin-1 names such
+    as "eacute" and Unicode ones such as "U+20ac", or the name unchanged.
+    """
+    character = latin1_characters.get(name)
+    if character is not None:
+        return character
+    if name.startswith("U+") and len(name) > 2:
+        try:
+            return chr(int(name[2:], 16))
+        except ValueError:
+            pass
+    return name
+
+
+def keymap_planes(spec):
+    """
+    Returns the planes listed by a dumpkeys "keymaps" line, such as
+    "0-2,4-6,8-9,12", in the order of the columns of its keycode lines.
+    """
+    planes = []
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        planes.extend(range(int(first), int(last or first) + 1))
+    return planes
+
+
+def _indexed(names, value):
+    return names[value] if value < len(names) else None
+
+
+def keysym_name(keysym):
+    """
+    Returns the dumpkeys name of a keysym as returned by KDGKBENT, or None for
+    holes and keysyms that can't be named.
+    """
+    type, value = keysym >> 8, keysym & 0xFF
+    if type >= NR_TYPES:
+        # Unicode keymaps store characters directly, flipped like this.
+        code_point = keysym ^ 0xF000
+        return latin_name(code_point) if code_point < 0x100 else chr(code_point)
+    elif keysym == K_HOLE:
+        return None
+    elif type in (KT_LATIN, KT_LETTER):
+        return latin_name(value)
+    elif type == KT_META:
+        name = latin_name(value)
+        return "Meta_" + name if name else None
+    elif type == KT_FN:
+        return _indexed(fn_names, value)
+    elif type == KT_SPEC:
+        return _indexed(spec_names, value)
+    elif type == KT_PAD:
+        return _indexed(pad_names, value)
+    elif type == KT_DEAD:
+        return _indexed(dead_names, value)
+    elif type == KT_CONS:
+        return "Console_{}".format(value + 1)
+    elif type == KT_CUR:
+        return _indexed(("Down", "Left", "Right", "Up"), value)
+    elif type == KT_SHIFT:
+        return _indexed(shift_names, value)
+    elif type == KT_ASCII:
+        return "Ascii_{}".format(value) if value < 10 else "Hex_{:X}".format(value - 10)
+    elif type == KT_LOCK:
+        name = _indexed(shift_names, value)
+        return name + "_Lock" if name else None
+    elif type == KT_SLOCK:
+        name = _indexed(shift_names, value)
+        return "S" + name if name else None
+    return None
+
+
+def is_console(fd):
+    """Whether the file descriptor is a virtual console with a keyboard."""
+    type = bytearray(1)
+    try:
+        fcntl.ioctl(fd, KDGKBTYPE, type)
+    except OSError:
+        return False
+    return type[0] in (KB_84, KB_101)
+
+
+def open_console():
+    """
+    Opens the first console that answers keyboard ioctls, returning its file
+    descriptor. Raises OSError if there is none.
+    """
+    for path in CONSOLE_PATHS:
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NOCTTY)
+        except OSError:
+            continue
+        if is_console(fd):
+            return fd
+        os.close(fd)
+    raise OSError("No console with a keyboard found, tried " + ", ".join(CONSOLE_PATHS))
+
+
+def read_keymap(fd, planes=range(16)):
+    """
+    Yields a `(keycode, plane, name)` for each named entry of the given planes
+    of the console keymap. Planes the keymap doesn't define are skipped after
+    a single ioctl.
+    """
+    entry = bytearray(kbentry_struct.size)
+    for plane in planes:
+        for keycode in range(NR_KEYS):
+            kbentry_struct.pack_into(entry, 0, plane, keycode, 0)
+            fcntl.ioctl(fd, KDGKBENT, entry)
+            keysym = kbentry_struct.unpack_from(entry)[2]
+            if keysym == K_NOSUCHMAP and keycode == 0:
+                break
+            name = keysym_name(keysym)
+            if name is not None:
+                yield keycode, plane, name
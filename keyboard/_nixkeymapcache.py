@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the key tables that `_nixkeyboard.build_tables` reads from
+the console keymap, so warm starts neither query it nor spawn `dumpkeys`.
+
+The tables are stored as compact JSON together with a format version and a
+key. The key is a hash of everything that decides the console keymap: the
+keymap configuration files, the installed `dumpkeys` and which of the ioctls
+or `dumpkeys` the tables are read with. Checking it only
+reads a handful of small files. Keymaps loaded by hand (with `loadkeys`) don't
+touch those files, so `invalidate` must be called after them.
+"""
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+
+# 2: Latin-1 and Unicode key names are characters, dumpkeys columns are
+# mapped to their modifier planes.
+CACHE_VERSION = 2
+
+# Files read by the various distributions to set up the console keymap.
+KEYMAP_CONFIG_FILES = (
+    "/etc/vconsole.conf",
+    "/etc/default/keyboard",
+    "/etc/default/console-setup",
+    "/etc/sysconfig/keyboard",
+    "/etc/conf.d/keymaps",
+)
+
+
+def cache_path():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "keyboard", "dumpkeys-tables.json")
+
+
+def keymap_key(loader):
+    """
+    Returns the hash that identifies the active console keymap, as read by
+    `loader`, "ioctl" or "dumpkeys".
+    """
+    digest = hashlib.sha1("{}:{}".format(CACHE_VERSION, loader).encode())
+    for path in KEYMAP_CONFIG_FILES:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        digest.update(path.encode() + b"\0" + data + b"\0")
+
+    # A kbd upgrade may change what dumpkeys reports.
+    dumpkeys = shutil.which("dumpkeys")
+    if dumpkeys:
+        try:
+            stat = os.stat(dumpkeys)
+            digest.update("{}:{}:{}".format(dumpkeys, stat.st_size, stat.st_mtime_ns).encode())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def load(key, scan_code_and_mods_to_name, from_name, keypad_scan_codes):
+    """
+    Fills the given tables from the cache if it exists and matches `key`.
+    Returns whether it did.
+    """
+    try:
+        with open(cache_path()) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION or data.get("key") != key:
+        return False
+
+    try:
+        for scan_code, modifiers, names in data["scan_code_and_mods_to_name"]:
+            scan_code_and_mods_to_name[(scan_code, tuple(modifiers))] = names
+        for name, entries in data["from_name"].items():
+            from_name[name] = [(scan_code, tuple(modifiers)) for scan_code, modifiers in entries]
+        keypad_scan_codes.update(data["keypad_scan_codes"])
+    except (KeyError, TypeError, ValueError):
+        # Corrupted cache, don't leave half filled tables behind.
+        scan_code_and_mods_to_name.clear()
+        from_name.clear()
+        keypad_scan_codes.clear()
+        return False
+    return True
+
+
+def save(key, scan_code_and_mods_to_name, from_name, keypad_scan_codes):
+    """Writes the tables to the cache. Failing to do so is not an error."""
+    data = {
+        "version": CACHE_VERSION,
+        "key": key,
+        "scan_code_and_mods_to_name": [
+            [scan_code, modifiers, names]
+            for (scan_code, modifiers), names in scan_code_and_mods_to_name.items()
+        ],
+        "from_name": from_name,
+        "keypad_scan_codes": sorted(keypad_scan_codes),
+    }
+    path = cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so concurrent starts never read half a file.
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError:
+        pass
+
+
+def invalidate():
+    """Deletes the cache, if there is one."""
+    try:
+        os.remove(cache_path())
+    except FileNotFoundError:
+        pass
@@ -39,26 +39,36 @@ def set_up_libudev():
     return libudev
 
 
+def receive_added_devnode(libudev, mon):
+    """
+    Receives one pending device from the monitor and returns its device node
+    if it was just added, otherwise None. Meant to be called once the monitor
+    fd is readable.
+    """
+    dev = libudev.udev_monitor_receive_device(mon)
+    if not dev:
+        return None
+
+    try:
+        action = libudev.udev_device_get_action(dev)
+        if not action or action != b"add":
+            return None
+
+        devnode = libudev.udev_device_get_devnode(dev)
+        return devnode.decode() if devnode else None
+    finally:
+        libudev.udev_device_unref(dev)
+
+
 def monitor_on_add(libudev, mon, on_add):
     fd = libudev.udev_monitor_get_fd(mon)
 
     while True:
         select.select([fd], [], [])
 
-        dev = libudev.udev_monitor_receive_device(mon)
-        if not dev:
-            continue
-
-        action = libudev.udev_device_get_action(dev)
-        if not action or action != b"add":
-            libudev.udev_device_unref(dev)
-            continue
-
-        devnode = libudev.udev_device_get_devnode(dev)
+        devnode = receive_added_devnode(libudev, mon)
         if devnode:
-            on_add(devnode.decode())
-
-        libudev.udev_device_unref(dev)
+            on_add(devnode)
 
 
 def create_udev_monitor(libudev):
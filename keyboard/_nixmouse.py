@@ -3,7 +3,8 @@ import os
 import struct
 from subprocess import check_output
 import re
-from ._nixcommon import EV_KEY, EV_REL, EV_MSC, EV_SYN, EV_ABS, aggregate_devices
+from ._nixcommon import EV_KEY, EV_REL, EV_MSC, EV_SYN, EV_ABS, aggregate_devices, EventFilter
+from ._global_data import global_data
 from ._mouse_event import ButtonEvent, WheelEvent, MoveEvent, LEFT, RIGHT, MIDDLE, X, X2, UP, DOWN
 
 import ctypes
@@ -97,7 +98,9 @@ def build_device():
     global device
     if device:
         return
-    device = aggregate_devices('mouse', "py_keys_mouse")
+    # listen only handles buttons and relative movement.
+    event_filter = EventFilter(types=[EV_KEY, EV_REL])
+    device = aggregate_devices('mouse', "py_keys_mouse", global_data.linux_event_transport, global_data.linux_reader_mode, event_filter)
 
 
 init = build_device
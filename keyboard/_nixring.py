@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Shared memory transport between the evdev reader process and the listener.
+
+Events are stored as fixed-width records in a single-producer/single-consumer
+ring inside a `multiprocessing.shared_memory` block, so nothing is pickled on
+the way. Device paths and names are sent once, through a small table of
+fixed-size slots that records refer to by index. A pipe works as doorbell: the
+reader writes one byte after publishing a frame, and the listener only blocks
+on it when the ring is empty.
+
+Layout of the shared block:
+
+    [header: write index, read index][records ...][device slots ...]
+
+The indexes only grow and are taken modulo the capacity. Each one is written
+by a single side, and the producer fills records (and device slots) before
+publishing the new write index, so the consumer never sees partial data. A
+device slot is only reassigned once the consumer has read every record that
+refers to its previous device.
+"""
+import os
+import struct
+from time import sleep
+from multiprocessing import Pipe
+from multiprocessing.shared_memory import SharedMemory
+
+# Indexes are kept on separate cache lines to avoid false sharing.
+WRITE_INDEX_OFFSET = 0
+READ_INDEX_OFFSET = 64
+HEADER_SIZE = 128
+index_struct = struct.Struct("=Q")
+
+# time, type, code, value, device id, flags
+record_struct = struct.Struct("=dHHIHH")
+RECORD_SIZE = record_struct.size
+
+MAX_DEVICES = 256
+MAX_DEVICE_STRING = 128
+device_struct = struct.Struct("{0}s{0}s".format(MAX_DEVICE_STRING))
+
+# Set on the first record that uses a device slot after it was (re)assigned,
+# so the listener knows its cached path and name are stale.
+FLAG_NEW_DEVICE = 0x8000
+# Set on the last record of each frame, filtered frames may not end with a
+# SYN_REPORT.
+FLAG_END_OF_FRAME = 0x4000
+
+DEFAULT_CAPACITY = 4096
+
+
+class SharedEventRing(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY, _attach=None):
+        self.capacity = capacity
+        self._devices_offset = HEADER_SIZE + capacity * RECORD_SIZE
+        if _attach is None:
+            size = self._devices_offset + MAX_DEVICES * device_struct.size
+            self.shared_memory = SharedMemory(create=True, size=size)
+            self.doorbell_reader, self.doorbell_writer = Pipe(duplex=False)
+            self._owner = True
+        else:
+            name, self.doorbell_reader, self.doorbell_writer = _attach
+            try:
+                # The owner unlinks the block, the reader only borrows it.
+                self.shared_memory = SharedMemory(name=name, track=False)
+            except TypeError:
+                # Python < 3.13.
+                self.shared_memory = SharedMemory(name=name)
+            self._owner = False
+        self.buffer = self.shared_memory.buf
+        # The reader must never block on the doorbell.
+        os.set_blocking(self.doorbell_writer.fileno(), False)
+
+        # Producer side.
+        self._write_index = index_struct.unpack_from(self.buffer, WRITE_INDEX_OFFSET)[0]
+        self._device_ids = {}
+        self._device_keys = [None] * MAX_DEVICES
+        # Write index of the last record referring to each slot.
+        self._device_uses = [-1] * MAX_DEVICES
+        self._next_device_id = 0
+
+        # Consumer side.
+        self._read_index = index_struct.unpack_from(self.buffer, READ_INDEX_OFFSET)[0]
+        self._available_index = self._read_index
+        self._devices = [None] * MAX_DEVICES
+        # Flags of the last record read.
+        self.last_flags = 0
+
+    def __reduce__(self):
+        return (
+            _attach_ring,
+            (self.capacity, self.shared_memory.name, self.doorbell_reader, self.doorbell_writer),
+        )
+
+    def _device_id(self, path, name, write_index):
+        """
+        Returns the slot of the given device, for the record at
+        `write_index`, and the flags that record needs. Fills a new slot the
+        first time the device is seen, waiting until the listener read the
+        records of the device it had before.
+        """
+        key = (path, name)
+        device_id = self._device_ids.get(key)
+        if device_id is not None:
+            self._device_uses[device_id] = write_index
+            return device_id, 0
+
+        device_id = self._next_device_id
+        last_use = self._device_uses[device_id]
+        if last_use >= self._load_read_index():
+            if last_use >= self._write_index:
+                # Still unpublished, part of the records being written.
+                self._publish(write_index)
+            while last_use >= self._load_read_index():
+                sleep(0.001)
+        self._device_uses[device_id] = write_index
+        self._next_device_id = (device_id + 1) % MAX_DEVICES
+        self._device_ids.pop(self._device_keys[device_id], None)
+        self._device_keys[device_id] = key
+        self._device_ids[key] = device_id
+        device_struct.pack_into(
+            self.buffer,
+            self._devices_offset + device_id * device_struct.size,
+            (path or "").encode()[:MAX_DEVICE_STRING],
+            (name or "").encode()[:MAX_DEVICE_STRING],
+        )
+        return device_id, FLAG_NEW_DEVICE
+
+    def put(self, frame, flags=0):
+        """
+        Publishes a frame of event tuples, as given by
+        `EventDevice.read_frames`. Called only by the reader. Blocks while the
+        ring doesn't have room for the whole frame.
+
+        Frames larger than the ring are published in parts as the listener
+        makes room, only the last record marking the end of the frame.
+        """
+        capacity = self.capacity
+        for start in range(0, len(frame), capacity):
+            part = frame[start:start + capacity]
+            self._put_records(part, flags, start + len(part) == len(frame))
+
+    def _put_records(self, records, flags, end_of_frame):
+        while self._write_index + len(records) - self._load_read_index() > self.capacity:
+            sleep(0.001)
+
+        buffer = self.buffer
+        write_index = self._write_index
+        last_index = write_index + len(records) - 1 if end_of_frame else None
+        for time, type, code, value, path, name in records:
+            offset = HEADER_SIZE + (write_index % self.capacity) * RECORD_SIZE
+            device_id, record_flags = self._device_id(path, name, write_index)
+            record_flags |= flags
+            if write_index == last_index:
+                record_flags |= FLAG_END_OF_FRAME
+            record_struct.pack_into(buffer, offset, time, type, code, value, device_id, record_flags)
+            write_index += 1
+
+        self._publish(write_index)
+
+    def _publish(self, write_index):
+        self._write_index = write_index
+        index_struct.pack_into(self.buffer, WRITE_INDEX_OFFSET, write_index)
+        try:
+            os.write(self.doorbell_writer.fileno(), b"\0")
+        except BlockingIOError:
+            # The pipe is full, so the listener has wake ups pending anyway.
+            pass
+
+    def _load_read_index(self):
+        return index_struct.unpack_from(self.buffer, READ_INDEX_OFFSET)[0]
+
+    def _load_device(self, device_id):
+        path, name = device_struct.unpack_from(
+            self.buffer, self._devices_offset + device_id * device_struct.size
+        )
+        path = path.rstrip(b"\0").decode()
+        name = name.rstrip(b"\0").decode() or None
+        device = self._devices[device_id] = (path, name)
+        return device
+
+    def read_event(self):
+        """
+        Blocks until an event is available and returns it in the same tuple
+        format used by `EventDevice.read_event`. Called only by the listener.
+        """
+        while self._read_index == self._available_index:
+            self._available_index = index_struct.unpack_from(self.buffer, WRITE_INDEX_OFFSET)[0]
+            if self._read_index == self._available_index:
+                # Drain every pending wake up, then check the index again.
+                os.read(self.doorbell_reader.fileno(), 4096)
+
+        offset = HEADER_SIZE + (self._read_index % self.capacity) * RECORD_SIZE
+        time, type, code, value, device_id, flags = record_struct.unpack_from(self.buffer, offset)
+        self._read_index += 1
+        index_struct.pack_into(self.buffer, READ_INDEX_OFFSET, self._read_index)
+        self.last_flags = flags
+
+        if flags & FLAG_NEW_DEVICE:
+            path, name = self._load_device(device_id)
+        else:
+            path, name = self._devices[device_id]
+        return (time, type, code, value, path, name)
+
+    def get(self):
+        """Blocks until a whole frame is available and returns it."""
+        frame = [self.read_event()]
+        while not self.last_flags & FLAG_END_OF_FRAME:
+            frame.append(self.read_event())
+        return frame
+
+    def close(self):
+        self.buffer = None
+        self.shared_memory.close()
+        if self._owner:
+            self.shared_memory.unlink()
+
+
+def _attach_ring(capacity, name, doorbell_reader, doorbell_writer):
+    return SharedEventRing(capacity, _attach=(name, doorbell_reader, doorbell_writer))
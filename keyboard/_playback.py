@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Replays recorded events on time.
+
+Every event gets an absolute deadline: `monotonic_ns` at the start of the
+playback plus its offset in the recording, divided by the speed factor. Time
+spent sending events or oversleeping is therefore caught up on instead of
+adding up over a long recording.
+
+Waiting sleeps until `SPIN` before the deadline and spins the rest, because
+`time.sleep` alone can be late by a millisecond or more. Events due within
+`TICK` of each other are sent together. How far from its deadline each event
+was sent is kept in a histogram.
+
+Recordings that are not in memory, such as files, are read and decoded by a
+`Prefetcher` on another thread, so only a bounded window of events is ever
+loaded and decoding doesn't delay the events due. Waiting for the next event
+of a `Prefetcher` stops at the deadline of the events already read, so a
+source that yields events as they happen doesn't hold them back.
+"""
+from collections import deque
+from queue import Empty, Full, Queue
+from threading import Thread
+from time import monotonic_ns, sleep
+
+from ._latency import Histogram
+
+SPIN = 1000000
+TICK = 1000000
+MAX_BATCH = 64
+
+# Marks the end of the source in the prefetch queue.
+_END = object()
+
+
+class Prefetcher(object):
+    """
+    Iterates `source` on a background thread and yields its items passed
+    through `decode`, keeping at most about `size` of them decoded ahead.
+
+    Items are handed over in chunks of up to `chunk`, or as soon as they're
+    decoded when the consumer is waiting for them. Exceptions raised by the
+    source or `decode` are raised by the iteration, after the items before
+    them. Iterating it a second time yields nothing.
+    """
+
+    def __init__(self, source, decode=None, size=1024, chunk=64):
+        self.queue = Queue(max(1, size // chunk))
+        self.closed = False
+        self.items = deque()
+        self.end = None
+        self.thread = Thread(
+            target=self._run, args=(source, decode, chunk), name="keyboard-prefetch", daemon=True
+        )
+        self.thread.start()
+
+    def _put(self, message):
+        # Returns False if closed, without waiting for room anymore.
+        while not self.closed:
+            try:
+                self.queue.put(message, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _run(self, source, decode, chunk):
+        items = []
+        try:
+            for item in source:
+                items.append(item if decode is None else decode(item))
+                if len(items) >= chunk or self.queue.empty():
+                    if not self._put((items, None)):
+                        return
+                    items = []
+        except Exception as e:
+            self._put((items, e))
+        else:
+            self._put((items, _END))
+
+    def get(self, timeout=None):
+        """
+        Returns the next item, waiting at most `timeout` seconds for it if
+        given, else raises `queue.Empty`. Raises `StopIteration` at the end.
+        """
+        items = self.items
+        while not items:
+            end = self.end
+            if end is not None:
+                # The error is raised once.
+                self.end = _END
+                if end is not _END:
+                    raise end
+                raise StopIteration
+            if self.closed:
+                raise StopIteration
+            chunk, self.end = self.queue.get(timeout=timeout)
+            items.extend(chunk)
+        return items.popleft()
+
+    def __iter__(self):
+        try:
+            while True:
+                try:
+                    item = self.get()
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops reading the source, which is left where it was."""
+        self.closed = True
+        # Unblocks the thread if it's waiting for room.
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+
+
+def wait_until(deadline, spin=SPIN):
+    """Returns at the given `time.monotonic_ns` deadline."""
+    remaining = deadline - monotonic_ns()
+    if remaining > spin:
+        sleep((remaining - spin) / 1e9)
+    while monotonic_ns() < deadline:
+        # Lets other threads run, the listener's included.
+        sleep(0)
+
+
+def play_timed(events, speed_factor, send, tick=TICK, max_batch=MAX_BATCH):
+    """
+    Calls `send(group)` with the events, in lists of consecutive events due
+    within `tick` nanoseconds of the first one, each list at the deadline of
+    its first event. If `speed_factor` is <= 0 they are sent as fast as
+    possible, `max_batch` at a time.
+
+    `events` is consumed as it's played, so it may be a generator. When it's
+    a `Prefetcher`, a group is sent on time even if the next event isn't
+    read yet. Returns a `Histogram` of the difference between each event's
+    deadline and the moment it was sent, empty when not timed.
+    """
+    errors = Histogram()
+    timed = speed_factor > 0
+    start = None
+    first_time = None
+    group = []
+    deadlines = []
+
+    def flush():
+        if timed:
+            wait_until(deadlines[0])
+            now = monotonic_ns()
+            for deadline in deadlines:
+                errors.record(abs(now - deadline))
+        send(group)
+
+    if isinstance(events, Prefetcher):
+        get = events.get
+    else:
+        iterator = iter(events)
+        get = lambda timeout: next(iterator)
+
+    while True:
+        timeout = None
+        if group and timed:
+            # Until the spinning before the deadline of the group.
+            timeout = max(0, deadlines[0] - SPIN - monotonic_ns()) / 1e9
+        try:
+            event = get(timeout)
+        except Empty:
+            flush()
+            group = []
+            deadlines = []
+            continue
+        except StopIteration:
+            break
+        if start is None:
+            start = monotonic_ns()
+            first_time = event.time
+        deadline = start + int((event.time - first_time) / speed_factor * 1e9) if timed else start
+        if group and (deadline - deadlines[0] > tick or len(group) >= max_batch):
+            flush()
+            group = []
+            deadlines = []
+        group.append(event)
+        deadlines.append(deadline)
+    if group:
+        flush()
+    return errors
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary format for recorded keyboard events.
+
+A recording is a 16 byte header followed by records of 16 bytes:
+
+    header: magic b"KBRC", version (u16), record size (u16), padding
+    record: kind (u8), flags (u8), device (u16), delta (u32),
+            scan code (i32), name (u16), modifiers (u16)
+
+Records are little endian and of these kinds:
+
+- EVENT: an event `delta` microseconds after the previous one, or after the
+  last TIME. `device`, `name` and `modifiers` are ids of devices and strings
+  defined before, or NONE.
+- TIME: the absolute time of the next event, as a float64 in place of
+  `delta` and `scan code`. Written first and whenever the delta overflows or
+  goes back in time.
+- STRING: defines string `name`, of `delta` bytes of UTF-8 following the
+  record, padded to a multiple of 16.
+- DEVICE: defines device `device`, with the `name` string as path and the
+  `modifiers` string as device name.
+
+Strings and devices are defined the first time an event uses them, so a
+recording can be written as events arrive, and read up to its last whole
+record if the writer was interrupted.
+
+`SpillingRecorder` records this way for long sessions, keeping only the
+latest events in memory.
+"""
+import itertools
+import mmap
+import struct
+from collections import deque
+from collections.abc import Sequence
+from threading import Lock
+
+from ._keyboard_event import KEY_DOWN, KEY_UP, canonical_event
+
+MAGIC = b"KBRC"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+RECORD = struct.Struct("<BBHIiHH")
+TIME_RECORD = struct.Struct("<B3xd4x")
+SIZE = RECORD.size
+
+EVENT, TIME, STRING, DEVICE = range(4)
+NONE = 0xFFFF
+
+FLAG_DOWN = 1
+FLAG_NO_SCAN_CODE = 2
+FLAG_KEYPAD = 4
+FLAG_NOT_KEYPAD = 8
+FLAG_SYNTHETIC = 16
+
+MAX_DELTA = 0xFFFFFFFF
+
+# Spilled events between the positions a `SpillingRecorder` remembers.
+CHECKPOINT_EVERY = 1024
+
+
+class RecordingWriter(object):
+    """
+    Writes events to `file`, a binary file open for writing, starting with
+    the header. Devices, device names and modifiers are stored as strings,
+    modifiers sorted.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.strings = {}
+        self.devices = {}
+        self.base = None
+        self.last_us = 0
+        self.count = 0
+        self.offset = 0
+        self._write(HEADER.pack(MAGIC, VERSION, SIZE))
+
+    def _write(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+    def position(self):
+        """
+        Returns where the next event will be written, for
+        `RecordingReader.events_from`.
+        """
+        return (self.offset, self.base or 0.0, self.last_us)
+
+    def _string(self, string):
+        if string is None:
+            return NONE
+        string_id = self.strings.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            if string_id >= NONE:
+                raise ValueError("Too many distinct strings in one recording")
+            data = string.encode("utf-8")
+            self._write(RECORD.pack(STRING, 0, 0, len(data), 0, string_id, 0))
+            self._write(data + b"\0" * (-len(data) % SIZE))
+            self.strings[string] = string_id
+        return string_id
+
+    def _device(self, device, device_name):
+        if device is None and device_name is None:
+            return NONE
+        key = (device, device_name)
+        device_id = self.devices.get(key)
+        if device_id is None:
+            device_id = len(self.devices)
+            if device_id >= NONE:
+                raise ValueError("Too many distinct devices in one recording")
+            path_id = self._string(None if device is None else str(device))
+            name_id = self._string(None if device_name is None else str(device_name))
+            self._write(RECORD.pack(DEVICE, 0, device_id, 0, 0, path_id, name_id))
+            self.devices[key] = device_id
+        return device_id
+
+    def write(self, event):
+        """Appends a `KeyboardEvent`."""
+        device_id = self._device(event.device, event.device_name)
+        name_id = self._string(event.name)
+        modifiers = event.modifiers
+        if modifiers is not None:
+            # Stored sorted, as strings: X11 gives a set of key codes.
+            modifiers = "\0".join(sorted(str(modifier) for modifier in modifiers))
+        modifiers_id = NONE if modifiers is None else self._string(modifiers)
+
+        if self.base is not None:
+            us = int(round((event.time - self.base) * 1e6))
+            delta = us - self.last_us
+        if self.base is None or not 0 <= delta <= MAX_DELTA:
+            self._write(TIME_RECORD.pack(TIME, event.time))
+            self.base = event.time
+            us = delta = 0
+        self.last_us = us
+
+        flags = FLAG_DOWN if event.event_type == KEY_DOWN else 0
+        scan_code = event.scan_code
+        if scan_code is None:
+            flags |= FLAG_NO_SCAN_CODE
+            scan_code = 0
+        if event.is_keypad is not None:
+            flags |= FLAG_KEYPAD if event.is_keypad else FLAG_NOT_KEYPAD
+        if event.synthetic:
+            flags |= FLAG_SYNTHETIC
+        self._write(RECORD.pack(EVENT, flags, device_id, delta, scan_code, name_id, modifiers_id))
+        self.count += 1
+
+    def write_events(self, events):
+        for event in events:
+            self.write(event)
+
+    def flush(self):
+        self.file.flush()
+
+
+class RecordingReader(object):
+    """
+    Reads a recording from the file at `path`, memory-mapped, so only the
+    parts iterated are loaded. Iterating yields `KeyboardEvent`s, which makes
+    it a valid argument for `keyboard.play`; see `events` to filter them.
+    A recording cut short ends at its last whole record.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            try:
+                self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file.
+                self.buffer = b""
+        if len(self.buffer) < HEADER.size:
+            raise ValueError("Not a keyboard recording: {}".format(path))
+        magic, version, size = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError("Not a keyboard recording: {}".format(path))
+        if version != VERSION or size != SIZE:
+            raise ValueError(
+                "Unsupported keyboard recording version {} in {}".format(version, path)
+            )
+        self._tables = None
+
+    def events(self, start=None, end=None, event_type=None, scan_codes=None):
+        """
+        Yields the events with a time from `start` (inclusive) to `end`
+        (exclusive), of the given `event_type` and scan codes if given.
+        Records of other events are skipped without creating objects.
+        Events without scan code are kept only if `scan_codes` is None.
+        """
+        return self._events(HEADER.size, 0.0, 0, [], [], start, end, event_type, scan_codes)
+
+    def events_from(self, position):
+        """
+        Yields the events from a `RecordingWriter.position` taken while
+        writing this recording.
+        """
+        if self._tables is None:
+            strings, devices = [], []
+            # Matches no event, only reads the strings and devices.
+            for _ in self._events(HEADER.size, 0.0, 0, strings, devices, scan_codes=()):
+                pass
+            self._tables = strings, devices
+        offset, base, us = position
+        return self._events(offset, base, us, *self._tables)
+
+    def _events(
+        self, offset, base, us, strings, devices, start=None, end=None, event_type=None, scan_codes=None
+    ):
+        # `strings` and `devices` are the tables defined before `offset`.
+        buffer = self.buffer
+        length = len(buffer) - SIZE
+        unpack_from = RECORD.unpack_from
+        down = None if event_type is None else event_type == KEY_DOWN
+        if scan_codes is not None:
+            scan_codes = frozenset(scan_codes)
+
+        while offset <= length:
+            kind, flags, device_id, delta, scan_code, name_id, modifiers_id = unpack_from(buffer, offset)
+            offset += SIZE
+
+            if kind == EVENT:
+                us += delta
+                if down is not None and bool(flags & FLAG_DOWN) != down:
+                    continue
+                if scan_codes is not None and (flags & FLAG_NO_SCAN_CODE or scan_code not in scan_codes):
+                    continue
+                time = base + us / 1e6
+                if start is not None and time < start:
+                    continue
+                if end is not None and time >= end:
+                    # Later events may still come before a TIME going back.
+                    continue
+                device, device_name = (None, None) if device_id == NONE else devices[device_id]
+                modifiers = None
+                if modifiers_id != NONE:
+                    modifiers = tuple(strings[modifiers_id].split("\0")) if strings[modifiers_id] else ()
+                yield canonical_event(
+                    KEY_DOWN if flags & FLAG_DOWN else KEY_UP,
+                    None if flags & FLAG_NO_SCAN_CODE else scan_code,
+                    None if name_id == NONE else strings[name_id],
+                    time,
+                    device,
+                    device_name,
+                    modifiers,
+                    True if flags & FLAG_KEYPAD else False if flags & FLAG_NOT_KEYPAD else None,
+                    bool(flags & FLAG_SYNTHETIC),
+                )
+            elif kind == TIME:
+                base = TIME_RECORD.unpack_from(buffer, offset - SIZE)[1]
+                us = 0
+            elif kind == STRING:
+                data_end = offset + delta
+                if data_end > len(buffer):
+                    return
+                if name_id == len(strings):
+                    strings.append(bytes(buffer[offset:data_end]).decode("utf-8"))
+                offset += delta + (-delta % SIZE)
+            elif kind == DEVICE:
+                if device_id == len(devices):
+                    devices.append((
+                        None if name_id == NONE else strings[name_id],
+                        None if modifiers_id == NONE else strings[modifiers_id],
+                    ))
+            else:
+                raise ValueError("Unknown record kind {} at offset {}".format(kind, offset - SIZE))
+
+    def __iter__(self):
+        return self.events()
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SpillingRecorder(object):
+    """
+    Records events, used as a hook like a `queue.Queue`, keeping the last
+    `window` in memory and appending older ones to a new recording at `path`.
+    """
+
+    def __init__(self, path, window=10000):
+        if window < 0:
+            raise ValueError("window must not be negative")
+        self.path = path
+        self.window = window
+        self.file = open(path, "wb")
+        self.writer = RecordingWriter(self.file)
+        self.memory = deque()
+        self.checkpoints = []
+        self.lock = Lock()
+
+    def put(self, event):
+        with self.lock:
+            self.memory.append(event)
+            if len(self.memory) > self.window:
+                writer = self.writer
+                # Once per checkpoint, even if writing is retried.
+                if writer.count == len(self.checkpoints) * CHECKPOINT_EVERY:
+                    self.checkpoints.append(writer.position())
+                # Kept in memory if it can't be written.
+                writer.write(self.memory[0])
+                self.memory.popleft()
+
+    def stop(self):
+        """
+        Closes the file and returns the events recorded as a
+        `RecordedEvents`.
+        """
+        with self.lock:
+            self.file.close()
+            return RecordedEvents(self.path, self.writer.count, self.checkpoints, list(self.memory))
+
+
+class RecordedEvents(Sequence):
+    """
+    Read-only sequence of the events of a `SpillingRecorder`: those written
+    to the recording at `path`, read when accessed, followed by those still
+    in memory. Indexing a written event reads at most `CHECKPOINT_EVERY`
+    events from the file; slices are returned as lists, read in one pass.
+    Close it, or use it as a context manager, when done indexing it.
+    """
+
+    def __init__(self, path, spilled, checkpoints, memory):
+        self.path = path
+        self.spilled = spilled
+        self.checkpoints = checkpoints
+        self.memory = memory
+        self._reader = None
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = RecordingReader(self.path)
+        return self._reader
+
+    def __len__(self):
+        return self.spilled + len(self.memory)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            if not indices:
+                return []
+            if indices.step < 0:
+                return self[indices[-1]:indices[0] + 1][::indices.step]
+            return self._read(indices[0], indices[-1] + 1)[::indices.step]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("recorded event index out of range")
+        if index >= self.spilled:
+            return self.memory[index - self.spilled]
+        return self._read(index, index + 1)[0]
+
+    def _read(self, start, stop):
+        # Events from `start` to `stop`, reading the file from the checkpoint
+        # before `start`.
+        events = []
+        if start < self.spilled:
+            checkpoint = start // CHECKPOINT_EVERY
+            offset = checkpoint * CHECKPOINT_EVERY
+            read = self.reader.events_from(self.checkpoints[checkpoint])
+            events.extend(itertools.islice(read, start - offset, min(stop, self.spilled) - offset))
+        events.extend(itertools.islice(self.memory, max(start - self.spilled, 0), max(stop - self.spilled, 0)))
+        return events
+
+    def __iter__(self):
+        if self.spilled:
+            # A reader of its own, closed when done.
+            with RecordingReader(self.path) as reader:
+                for event in itertools.islice(reader, self.spilled):
+                    yield event
+        for event in self.memory:
+            yield event
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
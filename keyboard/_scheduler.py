@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Single thread that runs delayed calls, instead of a thread per call.
+
+Timers are kept in a heap ordered by monotonic deadline. Cancelled timers are
+only marked and skipped when they come up, so cancelling is O(1). Timers
+scheduled with a `key` replace the pending timer with the same key, which is
+how repeating timers are rescheduled without piling up. Timers due within
+`coalesce` seconds of the first one run on the same wake up, a little early.
+
+Callbacks run on the scheduler's thread one after the other, so they must be
+quick. How late each timer ran is kept in a histogram, see `stats`. Timers
+that must not wait for user callbacks, like key repeat, get a scheduler of
+their own.
+"""
+import heapq
+import itertools
+import traceback
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+from ._latency import Histogram
+
+
+class Timer(object):
+    __slots__ = ("deadline", "fn", "args", "key", "cancelled")
+
+    def __init__(self, deadline, fn, args, key):
+        self.deadline = deadline
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.cancelled = False
+
+    def cancel(self):
+        """Stops the timer from running, if it didn't yet."""
+        self.cancelled = True
+
+
+class Scheduler(object):
+    def __init__(self, coalesce=0.001, name="keyboard-scheduler"):
+        self.coalesce = coalesce
+        self.name = name
+        self.condition = Condition()
+        self.heap = []
+        self.keys = {}
+        self._order = itertools.count()
+        self.thread = None
+        self.jitter = Histogram()
+        self.scheduled = 0
+        self.fired = 0
+
+    def call_at(self, deadline, fn, args=(), key=None):
+        """
+        Calls `fn(*args)` at the given `time.monotonic` deadline and returns
+        the `Timer`. A timer with the same `key` still pending is cancelled.
+        """
+        timer = Timer(deadline, fn, args, key)
+        with self.condition:
+            if key is not None:
+                previous = self.keys.get(key)
+                if previous is not None:
+                    previous.cancel()
+                self.keys[key] = timer
+            is_first = not self.heap or deadline < self.heap[0][0]
+            heapq.heappush(self.heap, (deadline, next(self._order), timer))
+            self.scheduled += 1
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+            elif is_first:
+                self.condition.notify()
+        return timer
+
+    def call_later(self, delay, fn, args=(), key=None):
+        """Like `call_at`, `delay` seconds from now."""
+        return self.call_at(monotonic() + delay, fn, args, key)
+
+    def cancel(self, key):
+        """Cancels the pending timer with the given key, if any."""
+        with self.condition:
+            timer = self.keys.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _due(self):
+        # Pops the timers to run now, waiting until there are some.
+        heap = self.heap
+        while True:
+            while heap and heap[0][2].cancelled:
+                self._forget(heapq.heappop(heap)[2])
+            if not heap:
+                self.condition.wait()
+                continue
+            now = monotonic()
+            if heap[0][0] > now:
+                self.condition.wait(heap[0][0] - now)
+                continue
+            due = []
+            limit = now + self.coalesce
+            while heap and heap[0][0] <= limit:
+                timer = heapq.heappop(heap)[2]
+                self._forget(timer)
+                if not timer.cancelled:
+                    due.append(timer)
+            if due:
+                return due
+
+    def _forget(self, timer):
+        if timer.key is not None and self.keys.get(timer.key) is timer:
+            del self.keys[timer.key]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                due = self._due()
+            for timer in due:
+                # Cancelled while others ran before it.
+                if timer.cancelled:
+                    continue
+                self.jitter.record(int((monotonic() - timer.deadline) * 1e9))
+                self.fired += 1
+                try:
+                    timer.fn(*timer.args)
+                except Exception:
+                    traceback.print_exc()
+
+    def stats(self):
+        """
+        Returns the number of timers `scheduled`, `fired` and `pending`, and
+        `jitter`, how late they fired, summarized like `keyboard.stats`.
+        Timers run early to coalesce them with another count as 0.
+        """
+        with self.condition:
+            pending = sum(1 for _, _, timer in self.heap if not timer.cancelled)
+        return {
+            "scheduled": self.scheduled,
+            "fired": self.fired,
+            "pending": pending,
+            "jitter": self.jitter.summary(),
+        }
+
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+
+def get_scheduler():
+    """Returns the scheduler shared by `keyboard.call_later` calls."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
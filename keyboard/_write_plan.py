@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Compiles a text into the key presses and releases that type it, so texts
+typed often are resolved once instead of on every `keyboard.write`.
+"""
+import collections
+
+from ._canonical_names import normalize_name
+
+
+class WritePlan(
+    collections.namedtuple("WritePlan", "text steps final batches modifiers")
+):
+    """
+    Immutable list of the actions that type `text`:
+
+    - `steps`: one `(actions, character)` pair per character. `actions` are
+    `(scan_code, is_down, shifted)` tuples, `shifted` telling the backend the
+    key is typed with shift. `character` is None, or the character to type
+    with `type_unicode` after the actions when no key types it.
+    - `final`: actions releasing the modifiers still held at the end.
+    - `batches`: the same actions, as `(scan_code, is_down)` pairs merged in
+    `(pairs, character)` runs for a backend's `send_keys`.
+    - `modifiers`: scan codes of the modifiers pressed.
+    """
+
+    __slots__ = ()
+
+
+def modifier_transition(held, needed, modifier_scan_code):
+    """
+    Returns the actions going from the `held` modifiers, a list of `(name,
+    scan_code)` in press order, to the `needed` names, and the new list.
+
+    Modifiers both need stay held. The others are released first, last
+    pressed first, so no combination outside of the two sets is ever held,
+    then the missing ones are pressed.
+    """
+    needed_names = set(needed)
+    actions = [(code, False, False) for name, code in reversed(held) if name not in needed_names]
+    kept = [(name, code) for name, code in held if name in needed_names]
+    kept_names = set(name for name, code in kept)
+    for name in needed:
+        if name not in kept_names:
+            code = modifier_scan_code(name)
+            kept.append((name, code))
+            kept_names.add(name)
+            actions.append((code, True, False))
+    return actions, kept
+
+
+def compile_plan(text, map_name, modifier_scan_code):
+    """
+    Returns the `WritePlan` of a text. `map_name` is the backend's, and
+    `modifier_scan_code(name)` returns the scan code to press a modifier.
+    Between characters only the modifiers that change are pressed or
+    released, see `modifier_transition`.
+    """
+    steps = []
+    modifier_codes = set()
+    # Names and scan codes of the modifiers held, in press order.
+    held = []
+
+    for character in text:
+        try:
+            entries = map_name(normalize_name(character))
+            scan_code, modifiers = next(iter(entries))
+        except (KeyError, ValueError, StopIteration):
+            # Typed as unicode, with the modifiers released.
+            actions, held = modifier_transition(held, (), modifier_scan_code)
+            steps.append((tuple(actions), character))
+            continue
+
+        actions, held = modifier_transition(held, modifiers, modifier_scan_code)
+        modifier_codes.update(code for name, code in held)
+        shifted = "shift" in modifiers
+        actions.append((scan_code, True, shifted))
+        actions.append((scan_code, False, shifted))
+        steps.append((tuple(actions), None))
+
+    final = tuple(modifier_transition(held, (), modifier_scan_code)[0])
+
+    batches = []
+    pairs = []
+    for actions, character in steps:
+        pairs.extend((scan_code, is_down) for scan_code, is_down, shifted in actions)
+        if character is not None:
+            batches.append((tuple(pairs), character))
+            pairs = []
+    pairs.extend((scan_code, is_down) for scan_code, is_down, shifted in final)
+    if pairs:
+        batches.append((tuple(pairs), None))
+
+    return WritePlan(text, tuple(steps), final, tuple(batches), frozenset(modifier_codes))
@@ -9,6 +9,7 @@ import threading
 import time
 from ._x11_utils import X11, MODIFIER_KEYCODES
 from ._keyboard_event import KeyboardEvent, KEY_DOWN, KEY_UP
+from ._scheduler import Scheduler
 
 
 def init():
@@ -44,6 +45,9 @@ _auto_repeat_interval_ms = 50
 _auto_repeat_lock = threading.Lock()
 _auto_repeat_thread = None
 _auto_repeat_stop_event = threading.Event()
+# Separate from the scheduler of `keyboard.call_later`, so slow user timers
+# don't delay repeats.
+_repeat_scheduler = Scheduler(name="keyboard-x11-repeat")
 _user_callback = None
 
 
@@ -94,11 +98,12 @@ def _repeat_fire():
         if _user_callback:
             _user_callback(synthetic_event)
 
-        # Schedule next repeat
+        # Schedule next repeat, from the last deadline so ticks don't drift,
+        # without bursts to catch up if they fell behind.
         interval = _auto_repeat_interval_ms / 1000.0
-        _repeat_timer = threading.Timer(interval, _repeat_fire)
-        _repeat_timer.daemon = True
-        _repeat_timer.start()
+        last_deadline = _repeat_timer.deadline if _repeat_timer else now
+        deadline = max(last_deadline + interval, now)
+        _repeat_timer = _repeat_scheduler.call_at(deadline, _repeat_fire)
 
 
 def _start_repeat(keycode, key_name):
@@ -115,9 +120,7 @@ def _start_repeat(keycode, key_name):
 
     delay = _auto_repeat_delay_ms / 1000.0
 
-    _repeat_timer = threading.Timer(delay, _repeat_fire)
-    _repeat_timer.daemon = True
-    _repeat_timer.start()
+    _repeat_timer = _repeat_scheduler.call_later(delay, _repeat_fire)
 
 
 def _update_auto_repeat_settings():
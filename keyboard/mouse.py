@@ -26,6 +26,7 @@ from ._mouse_event import (
     DOUBLE,
 )
 from ._generic import GenericListener as _GenericListener
+from ._playback import play_timed as _play_timed
 
 _pressed_events = set()
 
@@ -251,22 +252,25 @@ def play(
 
     The parameters `include_*` define if events of that type should be included
     in the replay or ignored.
+
+    Events are sent at their time since the start of the playback, so delays
+    don't add up over long recordings. Returns how far from their time the
+    events were sent, like `keyboard.play`.
     """
-    last_time = None
-    for event in events:
-        if speed_factor > 0 and last_time is not None:
-            _time.sleep((event.time - last_time) / speed_factor)
-        last_time = event.time
-
-        if isinstance(event, ButtonEvent) and include_clicks:
-            if event.event_type == UP:
-                _os_mouse.release(event.button)
-            else:
-                _os_mouse.press(event.button)
-        elif isinstance(event, MoveEvent) and include_moves:
-            _os_mouse.move_to(event.x, event.y)
-        elif isinstance(event, WheelEvent) and include_wheel:
-            _os_mouse.wheel(event.delta)
+
+    def send(events):
+        for event in events:
+            if isinstance(event, ButtonEvent) and include_clicks:
+                if event.event_type == UP:
+                    _os_mouse.release(event.button)
+                else:
+                    _os_mouse.press(event.button)
+            elif isinstance(event, MoveEvent) and include_moves:
+                _os_mouse.move_to(event.x, event.y)
+            elif isinstance(event, WheelEvent) and include_wheel:
+                _os_mouse.wheel(event.delta)
+
+    return _play_timed(events, speed_factor, send).summary()
 
 
 replay = play